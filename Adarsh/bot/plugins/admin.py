@@ -3,12 +3,14 @@ import os
 import time
 import string
 import random
+import secrets
 import asyncio
+import logging
 import aiofiles
 import datetime
-from Adarsh.utils.broadcast_helper import send_msg
+from Adarsh.utils.broadcast_helper import BroadcastEngine
 from Adarsh.utils.database import Database
-from Adarsh.bot import StreamBot
+from Adarsh.bot import StreamBot, multi_clients
 from Adarsh.vars import Var
 from pyrogram import filters, Client
 from pyrogram.types import Message
@@ -23,68 +25,224 @@ async def sts(c: Client, m: Message):
         await m.reply_text(text=f"Total Users in DB: {total_users}", quote=True)
 
 
-@StreamBot.on_message(filters.command("broadcast") & filters.private & filters.user(list(Var.ADMIN_IDS)))
-async def broadcast_(c, m):
-    user_id=m.from_user.id
-    out = await m.reply_text(
-            text=f"Broadcast initiated! You will be notified with log file when all the users are notified."
+@StreamBot.on_message(filters.command("compact") & filters.private & filters.user(list(Var.ADMIN_IDS)))
+async def compact_temp_files(c: Client, m: Message):
+    out = await m.reply_text(text="Compacting duplicate file tokens...", quote=True)
+    groups, removed = await db.compact_temp_files()
+    await out.edit_text(
+        text=f"Compaction done.\n\nFiles merged: {groups}\nDuplicate records removed: {removed}\n"
+             f"Old tokens keep working as aliases."
     )
-    all_users = await db.get_all_users()
-    broadcast_msg = m.reply_to_message
-    while True:
-        broadcast_id = ''.join([random.choice(string.ascii_letters) for i in range(3)])
-        if not Broadcast_IDs.get(broadcast_id):
-            break
-    start_time = time.time()
-    total_users = await db.total_users_count()
-    done = 0
-    failed = 0
-    success = 0
+
+
+_BROADCAST_NS = "broadcast"
+# A running broadcast refreshes its checkpoint at least this often; older
+# "running" state is treated as belonging to a dead process.
+_BROADCAST_STALE_AFTER = 300
+# Seconds between heartbeat writes of a running broadcast, independent of
+# deliveries so a long FloodWait does not make it look dead
+_BROADCAST_HEARTBEAT = 60
+# Owner recorded on the broadcasts this process runs; every state write of a
+# running broadcast is conditional on it, so a takeover or cancel wins
+_BROADCAST_OWNER = secrets.token_hex(4)
+
+
+async def _run_broadcast(m: Message, out: Message, broadcast_msg: Message, state: dict):
+    broadcast_id = state['id']
     Broadcast_IDs[broadcast_id] = dict(
-        total=total_users,
-        current=done,
-        failed=failed,
-        success=success
+        total=state['total'],
+        current=state['current'],
+        failed=state['failed'],
+        success=state['success']
     )
-    async with aiofiles.open('broadcast.txt', 'w') as broadcast_log_file:
-        async for user in all_users:
-            sts, msg = await send_msg(
-                user_id=int(user['id']),
-                message=broadcast_msg
-            )
-            if msg is not None:
-                await broadcast_log_file.write(msg)
-            if sts == 200:
-                success += 1
-            else:
-                failed += 1
-            if sts == 400:
-                await db.delete_user(user['id'])
-            done += 1
-            if Broadcast_IDs.get(broadcast_id) is None:
-                break
-            else:
-                Broadcast_IDs[broadcast_id].update(
-                    dict(
-                        current=done,
-                        failed=failed,
-                        success=success
-                    )
+    cancelled = False
+
+    def on_progress(stats):
+        if Broadcast_IDs.get(broadcast_id) is not None:
+            Broadcast_IDs[broadcast_id].update(
+                dict(
+                    current=stats['current'],
+                    failed=stats['failed'],
+                    success=stats['success']
                 )
-    if Broadcast_IDs.get(broadcast_id):
-        Broadcast_IDs.pop(broadcast_id)
-    completed_in = datetime.timedelta(seconds=int(time.time() - start_time))
+            )
+
+    async def checkpoint(cursor, stats):
+        nonlocal cancelled
+        state['heartbeat'] = time.time()
+        if stats is not None:
+            state.update(
+                cursor=cursor or state.get('cursor'),
+                **{k: stats[k] for k in ('current', 'success', 'failed', 'dead')}
+            )
+        if not await db.set_state_if(_BROADCAST_NS, broadcast_id, state,
+                                     {'owner': _BROADCAST_OWNER, 'status': 'running'}):
+            # Cancelled, or taken over by another process
+            cancelled = True
+            Broadcast_IDs.pop(broadcast_id, None)
+
+    async def heartbeat():
+        while not cancelled:
+            await asyncio.sleep(_BROADCAST_HEARTBEAT)
+            try:
+                await checkpoint(None, None)
+            except Exception as e:
+                logging.warning(f"Broadcast {broadcast_id} heartbeat failed: {e}")
+
+    state.update(status='running', owner=_BROADCAST_OWNER, heartbeat=time.time())
+    if not await db.set_state_if(_BROADCAST_NS, broadcast_id, state, {'owner': _BROADCAST_OWNER}):
+        Broadcast_IDs.pop(broadcast_id, None)
+        await out.edit_text(f"Broadcast `{broadcast_id}` was taken over by another process.")
+        return
+
+    all_users = await db.get_all_users(after_id=state.get('cursor'))
+    clients = multi_clients if Var.BROADCAST_MULTI_CLIENT and multi_clients else {0: StreamBot}
+    log_path = f'broadcast_{broadcast_id}.txt'
+    async with aiofiles.open(log_path, 'a') as broadcast_log_file:
+        engine = BroadcastEngine(
+            clients,
+            broadcast_msg,
+            db,
+            log_file=broadcast_log_file,
+            is_cancelled=lambda: cancelled or Broadcast_IDs.get(broadcast_id) is None,
+            on_progress=on_progress,
+            checkpoint=checkpoint,
+            stats=state,
+        )
+        beat = asyncio.create_task(heartbeat())
+        try:
+            stats = await engine.run(all_users, total=state['total'])
+        except Exception:
+            # The last checkpoint stays, so /resumebroadcast can pick it up once stale
+            Broadcast_IDs.pop(broadcast_id, None)
+            raise
+        finally:
+            beat.cancel()
+    cancelled = engine.is_cancelled()
+    Broadcast_IDs.pop(broadcast_id, None)
+
+    if cancelled:
+        # Keep the final checkpoint so the broadcast can still be resumed, and
+        # record our exact position unless someone has resumed it since
+        state.update(
+            status='cancelled',
+            heartbeat=0,
+            cursor=engine.cursor or state.get('cursor'),
+            **{k: stats[k] for k in ('current', 'success', 'failed', 'dead')}
+        )
+        await db.set_state_if(_BROADCAST_NS, broadcast_id, state, {'status': 'cancelled'})
+    else:
+        await db.delete_state(_BROADCAST_NS, broadcast_id)
+
+    total_users = state['total']
+    done, success, failed = stats['current'], stats['success'], stats['failed']
+    completed_in = datetime.timedelta(seconds=int(time.time() - state['started_at']))
+    headline = f"broadcast `{broadcast_id}` cancelled after" if state['status'] == 'cancelled' else "broadcast completed in"
+    report = (
+        f"{headline} `{completed_in}`\n\nTotal users {total_users}.\n"
+        f"Total done {done}, {success} success and {failed} failed.\n"
+        f"Removed {stats['dead']} dead users.\n"
+        f"Throughput {stats['rate']:.1f} msg/s over {len(clients)} bot(s), "
+        f"{stats['flood_waits']} FloodWait pause(s)."
+    )
     await asyncio.sleep(3)
     await out.delete()
     if failed == 0:
         await m.reply_text(
-            text=f"broadcast completed in `{completed_in}`\n\nTotal users {total_users}.\nTotal done {done}, {success} success and {failed} failed.",
+            text=report,
             quote=True
         )
     else:
         await m.reply_document(
-            document='broadcast.txt',
-            caption=f"broadcast completed in `{completed_in}`\n\nTotal users {total_users}.\nTotal done {done}, {success} success and {failed} failed.",
+            document=log_path,
+            caption=report,
             quote=True
         )
-    os.remove('broadcast.txt')
+    os.remove(log_path)
+
+
+@StreamBot.on_message(filters.command("broadcast") & filters.private & filters.user(list(Var.ADMIN_IDS)))
+async def broadcast_(c, m):
+    user_id=m.from_user.id
+    broadcast_msg = m.reply_to_message
+    while True:
+        broadcast_id = ''.join([random.choice(string.ascii_letters) for i in range(3)])
+        if not Broadcast_IDs.get(broadcast_id) and not await db.get_state(_BROADCAST_NS, broadcast_id):
+            break
+    out = await m.reply_text(
+            text=f"Broadcast `{broadcast_id}` initiated! You will be notified with log file when all the users are notified.\n\n"
+                 f"If the bot restarts, continue it with /resumebroadcast {broadcast_id}"
+    )
+    state = dict(
+        id=broadcast_id,
+        status='running',
+        owner=_BROADCAST_OWNER,
+        heartbeat=time.time(),
+        source_chat_id=broadcast_msg.chat.id,
+        source_message_id=broadcast_msg.id,
+        total=await db.total_users_count(),
+        cursor=None,
+        current=0,
+        failed=0,
+        success=0,
+        dead=0,
+        started_at=time.time(),
+    )
+    await db.set_state(_BROADCAST_NS, broadcast_id, state)
+    await _run_broadcast(m, out, broadcast_msg, state)
+
+
+@StreamBot.on_message(filters.command("resumebroadcast") & filters.private & filters.user(list(Var.ADMIN_IDS)))
+async def resume_broadcast(c, m):
+    if len(m.command) < 2:
+        pending = [s for s in await db.list_state(_BROADCAST_NS) if s.get('status') != 'done']
+        if not pending:
+            await m.reply_text("No unfinished broadcasts.", quote=True)
+            return
+        lines = [
+            f"`{s['id']}` — {s['status']}, {s['current']}/{s['total']} done"
+            for s in pending
+        ]
+        await m.reply_text("Unfinished broadcasts:\n\n" + "\n".join(lines) + "\n\nUse /resumebroadcast ID", quote=True)
+        return
+    broadcast_id = m.command[1]
+    if not await db.get_state(_BROADCAST_NS, broadcast_id):
+        await m.reply_text(f"No broadcast with id `{broadcast_id}`.", quote=True)
+        return
+    # Cancelled broadcasts have heartbeat 0; a running one only once it went stale.
+    # The claim is atomic, so of two racing resumes only one gets it.
+    state = None if broadcast_id in Broadcast_IDs else await db.claim_state(
+        _BROADCAST_NS, broadcast_id, _BROADCAST_OWNER, time.time() - _BROADCAST_STALE_AFTER
+    )
+    if not state:
+        await m.reply_text(f"Broadcast `{broadcast_id}` is still running.", quote=True)
+        return
+    broadcast_msg = await c.get_messages(state['source_chat_id'], state['source_message_id'])
+    if not broadcast_msg or broadcast_msg.empty:
+        await m.reply_text("The original broadcast message no longer exists.", quote=True)
+        return
+    out = await m.reply_text(
+        text=f"Resuming broadcast `{broadcast_id}` from {state['current']}/{state['total']}."
+    )
+    await _run_broadcast(m, out, broadcast_msg, state)
+
+
+@StreamBot.on_message(filters.command("cancelbroadcast") & filters.private & filters.user(list(Var.ADMIN_IDS)))
+async def cancel_broadcast(c, m):
+    if len(m.command) < 2:
+        await m.reply_text("Usage: /cancelbroadcast ID", quote=True)
+        return
+    broadcast_id = m.command[1]
+    # Taking ownership (any heartbeat qualifies) makes every later checkpoint of
+    # the running instance fail, wherever it runs, so it stops there
+    canceller = f"cancel:{secrets.token_hex(4)}"
+    state = await db.claim_state(_BROADCAST_NS, broadcast_id, canceller, float('inf'))
+    if not state and broadcast_id not in Broadcast_IDs:
+        await m.reply_text(f"No broadcast with id `{broadcast_id}`.", quote=True)
+        return
+    if state:
+        # heartbeat 0: resumable right away
+        state.update(status='cancelled', heartbeat=0)
+        await db.set_state_if(_BROADCAST_NS, broadcast_id, state, {'owner': canceller})
+    Broadcast_IDs.pop(broadcast_id, None)
+    await m.reply_text(f"Broadcast `{broadcast_id}` cancelled.", quote=True)
@@ -1,10 +1,11 @@
 import re
 import os
+import time
 import asyncio
 import json
 import logging
 from pathlib import Path
-from Adarsh.bot import StreamBot
+from Adarsh.bot import StreamBot, multi_clients
 from Adarsh.utils.database import Database
 from Adarsh.utils.human_readable import humanbytes
 from Adarsh.vars import Var
@@ -14,9 +15,20 @@ from pyrogram.enums import ParseMode
 from pyrogram.errors import FloodWait
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from Adarsh.utils.file_properties import get_name, get_hash, get_media_from_message
-from helper_func import encode, get_message_id, decode, get_messages
+from helper_func import encode, get_message_id, decode
 from Adarsh.utils.thumbnail_extractor import extract_thumbnail_from_middle
 from Adarsh.utils.github_uploader import upload_image_to_github
+from Adarsh.utils.github_publisher import GitHubPublisher
+from Adarsh.utils import batch_checkpoint
+from Adarsh.utils import forum_index
+from Adarsh.utils import forum_topics
+from Adarsh.utils.job_journal import journal
+from Adarsh.utils.progress_reporter import ProgressReporter
+from Adarsh.utils.batch_executor import BatchExecutor, RateGovernor, Subject
+from Adarsh.utils.paginator import MessagePaginator
+from Adarsh.utils.history_scanner import HistoryScanner
+from Adarsh.utils.thumbnail_service import ThumbnailService
+from Adarsh.server import range_reader
 
 db = Database(Var.DATABASE_URL, Var.name)
 CUSTOM_CAPTION = os.environ.get("CUSTOM_CAPTION", None)
@@ -98,6 +110,95 @@ async def create_intermediate_link(message: Message):
     
     return intermediate_link, caption
 
+async def generate_batch_thumbnail(client: Client, message: Message, folder_name: str, caption: str) -> str:
+    """Grab a frame from a batch video with ffmpeg and upload it to the
+    thumbnail repo. Returns the image URL; raises on failure."""
+    temp_video_path = None
+    thumbnail_path = None
+    try:
+        logging.info(f"🎬 Starting thumbnail extraction for video: {caption}")
+        logging.info(f"   Folder name: {folder_name}")
+
+        # Preferred: let ffmpeg read only the byte ranges it needs through the
+        # loopback range reader instead of downloading the whole video
+        range_url = await range_reader.register(client, message)
+        try:
+            thumbnail_path = await extract_thumbnail_from_middle(range_url)
+            logging.info(f"   Thumbnail extracted over range reads: {thumbnail_path}")
+        except Exception as range_error:
+            logging.warning(f"   Range-read thumbnail failed, downloading the video instead: {range_error}")
+        finally:
+            range_reader.unregister(range_url)
+
+        if thumbnail_path is None:
+            # Fallback: download video temporarily
+            temp_dir = Path("/tmp/batch_videos")
+            temp_dir.mkdir(exist_ok=True)
+            import secrets as sec
+            temp_video_path = str(temp_dir / f"video_{sec.token_hex(8)}.mp4")
+
+            logging.info(f"   Downloading video to: {temp_video_path}")
+            # Download the video file
+            await client.download_media(message, file_name=temp_video_path)
+
+            video_size = os.path.getsize(temp_video_path) if os.path.exists(temp_video_path) else 0
+            logging.info(f"   Video downloaded successfully ({video_size} bytes)")
+
+            # Extract thumbnail from middle of video
+            logging.info(f"   Extracting thumbnail from video...")
+            thumbnail_path = await extract_thumbnail_from_middle(temp_video_path)
+
+        thumb_size = os.path.getsize(thumbnail_path) if os.path.exists(thumbnail_path) else 0
+        logging.info(f"   Thumbnail extracted successfully: {thumbnail_path} ({thumb_size} bytes)")
+
+        # Upload thumbnail to GitHub
+        logging.info(f"   Uploading thumbnail to GitHub (folder: {folder_name})...")
+        thumbnail_url = await upload_image_to_github(
+            image_path=thumbnail_path,
+            github_token=THUMB_API,
+            folder_name=folder_name,
+            title_name=caption
+        )
+
+        logging.info(f"✅ Thumbnail uploaded successfully: {thumbnail_url}")
+        return thumbnail_url
+    finally:
+        # Always cleanup temporary files, even on failure
+        try:
+            if temp_video_path and os.path.exists(temp_video_path):
+                os.remove(temp_video_path)
+                logging.debug(f"Cleaned up temp video: {temp_video_path}")
+            if thumbnail_path and os.path.exists(thumbnail_path):
+                os.remove(thumbnail_path)
+                logging.debug(f"Cleaned up thumbnail: {thumbnail_path}")
+        except Exception as cleanup_error:
+            logging.error(f"Error cleaning up temp files: {cleanup_error}")
+
+
+# Shared by every /batch: dedupes by file_unique_id, caches URLs in the
+# 'thumbs' state namespace and caps concurrent ffmpeg processes
+thumbnails = ThumbnailService(
+    generate_batch_thumbnail, db,
+    workers=Var.THUMB_WORKERS or None,
+    queue_size=Var.THUMB_QUEUE_SIZE,
+)
+
+
+def batch_caption(message: Message, media) -> str:
+    """Caption used for batch entries: sanitized caption → filename → random name."""
+    caption = ""
+    if message.caption:
+        caption = sanitize_caption(message.caption.html)
+    if not caption or not caption.strip():
+        filename = getattr(media, 'file_name', None) or get_name(message)
+        if filename:
+            caption = sanitize_caption(filename)
+    if not caption or not caption.strip():
+        import secrets
+        caption = f"file_{secrets.token_hex(4)}"
+    return caption
+
+
 async def create_intermediate_link_for_batch(message: Message, folder_name: str = None, client: Client = None, shared_thumbnail_url: str = None):
     """Create intermediate links for batch processing - both stream and download, with optional thumbnail.
     
@@ -110,22 +211,7 @@ async def create_intermediate_link_for_batch(message: Message, folder_name: str
             raise ValueError("No media found in message")
 
         # Get caption with fallback chain and sanitization
-        caption = ""
-        
-        # Try message caption first
-        if message.caption:
-            caption = sanitize_caption(message.caption.html)
-        
-        # Fallback to filename if caption is empty after sanitization
-        if not caption or not caption.strip():
-            filename = getattr(media, 'file_name', None) or get_name(message)
-            if filename:
-                caption = sanitize_caption(filename)
-        
-        # Fallback to random name if still empty
-        if not caption or not caption.strip():
-            import secrets
-            caption = f"file_{secrets.token_hex(4)}"
+        caption = batch_caption(message, media)
         
         message_data = {
             'message_id': message.id,
@@ -146,61 +232,14 @@ async def create_intermediate_link_for_batch(message: Message, folder_name: str
         
         # Only extract thumbnail if we don't have a shared one AND this is a video
         if not shared_thumbnail_url and mime_type and mime_type.startswith('video/') and folder_name and THUMB_API and client:
-            temp_video_path = None
-            thumbnail_path = None
             try:
-                logging.info(f"🎬 Starting thumbnail extraction for video: {caption}")
-                logging.info(f"   Video mime type: {mime_type}")
-                logging.info(f"   Folder name: {folder_name}")
-                
-                # Download video temporarily
-                temp_dir = Path("/tmp/batch_videos")
-                temp_dir.mkdir(exist_ok=True)
-                import secrets as sec
-                temp_video_path = str(temp_dir / f"video_{sec.token_hex(8)}.mp4")
-                
-                logging.info(f"   Downloading video to: {temp_video_path}")
-                # Download the video file
-                await client.download_media(message, file_name=temp_video_path)
-                
-                video_size = os.path.getsize(temp_video_path) if os.path.exists(temp_video_path) else 0
-                logging.info(f"   Video downloaded successfully ({video_size} bytes)")
-                
-                # Extract thumbnail from middle of video
-                logging.info(f"   Extracting thumbnail from video...")
-                thumbnail_path = await extract_thumbnail_from_middle(temp_video_path)
-                
-                thumb_size = os.path.getsize(thumbnail_path) if os.path.exists(thumbnail_path) else 0
-                logging.info(f"   Thumbnail extracted successfully: {thumbnail_path} ({thumb_size} bytes)")
-                
-                # Upload thumbnail to GitHub
-                logging.info(f"   Uploading thumbnail to GitHub (folder: {folder_name})...")
-                thumbnail_url = await upload_image_to_github(
-                    image_path=thumbnail_path,
-                    github_token=THUMB_API,
-                    folder_name=folder_name,
-                    title_name=caption
-                )
-                
-                logging.info(f"✅ Thumbnail uploaded successfully: {thumbnail_url}")
-                    
+                thumbnail_url = await generate_batch_thumbnail(client, message, folder_name, caption)
             except Exception as thumb_error:
                 thumb_err_str = str(thumb_error)
                 logging.error(f"❌ Thumbnail failed for '{caption}': {thumb_err_str}", exc_info=True)
                 # Store the first thumbnail error so the batch loop can report it to the bot
                 if not message_data.get('_thumb_error'):
                     message_data['_thumb_error'] = thumb_err_str
-            finally:
-                # Always cleanup temporary files, even on failure
-                try:
-                    if temp_video_path and os.path.exists(temp_video_path):
-                        os.remove(temp_video_path)
-                        logging.debug(f"Cleaned up temp video: {temp_video_path}")
-                    if thumbnail_path and os.path.exists(thumbnail_path):
-                        os.remove(thumbnail_path)
-                        logging.debug(f"Cleaned up thumbnail: {thumbnail_path}")
-                except Exception as cleanup_error:
-                    logging.error(f"Error cleaning up temp files: {cleanup_error}")
         else:
             # Log why thumbnail extraction was skipped
             reasons = []
@@ -313,6 +352,15 @@ async def create_pdf_download_links(message: Message):
         }
 
 
+def _wants_batch_thumbnail(msg) -> bool:
+    """Batch entries get a thumbnail when they are videos and THUMB_API is set."""
+    if not THUMB_API or not (msg.document or msg.video or msg.audio):
+        return False
+    media = get_media_from_message(msg)
+    mime_type = getattr(media, 'mime_type', '') or ''
+    return mime_type.startswith('video/')
+
+
 async def process_message(msg, json_output, skipped_messages, folder_name=None, client=None, shared_thumbnail_url=None):
     """Process individual message and create intermediate link (updated for new system with thumbnail support)"""
     try:
@@ -846,87 +894,6 @@ def generate_lecture_html(json_filename: str) -> str:
 </html>"""
 
 
-async def upload_to_github(file_content: str, file_path: str, commit_message: str, token: str, branch: str = None):
-    """Upload JSON file to GitHub repository.
-
-    file_path: expected format "owner/repo/path/to/file.json"
-    Returns (True, None) on success, (False, error_detail) on failure.
-    """
-    import base64
-    import aiohttp
-
-    try:
-        if not token:
-            return False, "GIT_TOKEN is empty or not set"
-
-        # Normalize and split path
-        normalized = file_path.strip().lstrip('/').rstrip('/')
-        parts = normalized.split('/', 2)
-        if len(parts) < 3:
-            return False, f"Invalid path format: '{file_path}' — expected owner/repo/path/to/file.json"
-
-        owner, repo, path = parts[0], parts[1], parts[2]
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
-
-        content_encoded = base64.b64encode(file_content.encode('utf-8')).decode('utf-8')
-
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-
-        async with aiohttp.ClientSession() as session:
-            params = {}
-            if branch:
-                params['ref'] = branch
-
-            sha = None
-            get_warning = None
-            async with session.get(api_url, headers=headers, params=params) as resp_get:
-                if resp_get.status == 200:
-                    data = await resp_get.json()
-                    sha = data.get('sha')
-                elif resp_get.status == 404:
-                    sha = None  # file doesn't exist yet, will create
-                elif resp_get.status == 401:
-                    return False, "GitHub token is invalid or expired (401 Unauthorized)"
-                elif resp_get.status == 403:
-                    get_text = await resp_get.text()
-                    return False, f"GitHub access forbidden (403) — token may lack 'repo' scope. Detail: {get_text[:300]}"
-                else:
-                    get_text = await resp_get.text()
-                    get_warning = f"GET {resp_get.status}: {get_text[:200]}"
-
-            payload = {
-                "message": commit_message or "Add file via bot",
-                "content": content_encoded
-            }
-            if sha:
-                payload["sha"] = sha
-            if branch:
-                payload["branch"] = branch
-
-            async with session.put(api_url, headers=headers, json=payload) as resp_put:
-                resp_text = await resp_put.text()
-                if resp_put.status in (200, 201):
-                    return True, None
-                elif resp_put.status == 401:
-                    return False, "GitHub token invalid/expired (401). Re-check GIT_TOKEN."
-                elif resp_put.status == 403:
-                    return False, f"GitHub 403 Forbidden — token likely missing 'repo' write scope.\nRepo: {owner}/{repo}\nDetail: {resp_text[:300]}"
-                elif resp_put.status == 404:
-                    return False, f"GitHub 404 — repo '{owner}/{repo}' not found or token has no access to it.\nURL: {api_url}"
-                elif resp_put.status == 422:
-                    return False, f"GitHub 422 Unprocessable — possibly wrong branch or SHA conflict.\nDetail: {resp_text[:300]}"
-                else:
-                    detail = f"HTTP {resp_put.status}\nURL: {api_url}\nResponse: {resp_text[:400]}"
-                    if get_warning:
-                        detail = f"GET warning: {get_warning}\n{detail}"
-                    return False, detail
-
-    except Exception as e:
-        return False, f"Exception during upload: {type(e).__name__}: {e}"
-
 @StreamBot.on_message(filters.private & filters.user(list(Var.ADMIN_IDS)) & filters.command('batch'))
 async def batch_command(client: Client, message: Message):
     user_id = message.from_user.id
@@ -942,7 +909,8 @@ async def batch_command(client: Client, message: Message):
 
 @StreamBot.on_message(
     filters.private & filters.user(list(Var.ADMIN_IDS)) & filters.text
-    & ~filters.command(['batch', 'fbatch', 'fwd', 'start', 'gen', 'users', 'broadcast', 'ping', 'root', 'checkenv'])
+    & ~filters.command(['batch', 'fbatch', 'fwd', 'start', 'gen', 'users', 'broadcast', 'ping', 'root', 'checkenv', 'compact',
+                       'resumebroadcast', 'cancelbroadcast'])
 )
 async def batch_conversation_handler(client: Client, message: Message):
     user_id = message.from_user.id
@@ -982,8 +950,12 @@ async def batch_conversation_handler(client: Client, message: Message):
         return
 
 
-async def _run_batch_processing(client: Client, message: Message, github_dest_folder: str):
-    """Run the actual batch processing after collecting both inputs."""
+async def _run_batch_processing(client: Client, message: Message, github_dest_folder: str, job: dict = None):
+    """Run the actual batch processing after collecting both inputs.
+
+    job is the journal entry when resuming after a restart; subjects it
+    records as staged or unchanged are not processed again.
+    """
     try:
         links_text = message.text.strip()
         subjects_data = []
@@ -1032,6 +1004,18 @@ async def _run_batch_processing(client: Client, message: Message, github_dest_fo
             )
             return
 
+        dest_parts = github_dest_folder.strip().strip('/').split('/', 2)
+        if len(dest_parts) < 2:
+            await message.reply(f"❌ Invalid GitHub folder '{github_dest_folder}' — expected owner/repo/path")
+            return
+        # Subjects' JSON and HTML are staged as blobs and written in one commit per chunk of subjects
+        publisher = GitHubPublisher(dest_parts[0], dest_parts[1], git_token,
+                                    blob_concurrency=Var.GITHUB_BLOB_CONCURRENCY)
+        dest_prefix = dest_parts[2] if len(dest_parts) == 3 else ''
+
+        if job is None:
+            job = await journal.create('batch', message.chat.id, message.id, {'github_dest_folder': github_dest_folder})
+
         # status_msg is used ONLY for progress — never edited to show errors
         status_msg = await message.reply_text(
             f"🚀 Starting batch processing for {len(subjects_data)} subjects...\n"
@@ -1039,187 +1023,327 @@ async def _run_batch_processing(client: Client, message: Message, github_dest_fo
             f"📂 Folder: {github_dest_folder.split('/', 2)[2] if '/' in github_dest_folder else github_dest_folder}"
         )
 
-        success_count = 0
-        fail_count = 0
+        class MockMessage:
+            def __init__(self, text):
+                self.text = text
+                self.forward_from_chat = None
+                self.forward_sender_name = None
 
+        # Resolve every subject's F/L links up front; unresolvable ones are reported and skipped
+        total_subjects = len(subjects_data)
+        subjects = []
+        fail_count = 0
         for idx, subject_info in enumerate(subjects_data, 1):
             subject_name = subject_info['subject']
-            json_output = []
-            skipped_messages = []
-
+            if job['subjects'].get(str(idx), {}).get('state') == 'invalid':
+                fail_count += 1     # already reported before the restart
+                continue
+            f_msg_id = await get_message_id(client, MockMessage(subject_info['first']))
+            s_msg_id = await get_message_id(client, MockMessage(subject_info['last']))
+            if not f_msg_id or not s_msg_id:
+                fail_count += 1
+                # Send as NEW message so it is never overwritten
+                await message.reply_text(
+                    f"❌ [{idx}/{total_subjects}] {subject_name}\n"
+                    f"Invalid message IDs — could not resolve links:\n"
+                    f"F: {subject_info['first']}\n"
+                    f"L: {subject_info['last']}"
+                )
+                job['subjects'][str(idx)] = {'state': 'invalid'}
+                continue
+            subjects.append(Subject(
+                idx, subject_name, min(f_msg_id, s_msg_id), max(f_msg_id, s_msg_id),
+                folder=subject_name.lower().replace(" ", "_"),
+                fingerprints={},
+            ))
+
+        def subject_paths(subject):
+            """(json filename, JSON path in repo, HTML path in repo) for a subject."""
+            json_filename = f"{subject.name}.json"
+            json_repo_path = f"{dest_prefix}/{json_filename}".replace('//', '/').lstrip('/')
+            html_repo_path = f"{dest_prefix}/{subject.name}.html".replace('//', '/').lstrip('/')
+            return json_filename, json_repo_path, html_repo_path
+
+        # Checkpoints from earlier runs of the same subject path: unchanged messages are reused
+        async def load_checkpoint(subject):
+            subject.extra['checkpoint_key'] = f"{publisher.full_name}/{subject_paths(subject)[1]}"
             try:
-                class MockMessage:
-                    def __init__(self, text):
-                        self.text = text
-                        self.forward_from_chat = None
-                        self.forward_sender_name = None
-
-                f_msg_id = await get_message_id(client, MockMessage(subject_info['first']))
-                s_msg_id = await get_message_id(client, MockMessage(subject_info['last']))
-
-                if not f_msg_id or not s_msg_id:
-                    fail_count += 1
-                    # Send as NEW message so it is never overwritten
-                    await message.reply_text(
-                        f"❌ [{idx}/{len(subjects_data)}] {subject_name}\n"
-                        f"Invalid message IDs — could not resolve links:\n"
-                        f"F: {subject_info['first']}\n"
-                        f"L: {subject_info['last']}"
-                    )
-                    await status_msg.edit_text(
-                        f"⏳ Progress: {idx}/{len(subjects_data)} | ✅ {success_count} | ❌ {fail_count}"
-                    )
-                    continue
-
-                start_id = min(f_msg_id, s_msg_id)
-                end_id = max(f_msg_id, s_msg_id)
-                total_messages = end_id - start_id + 1
-
-                await status_msg.edit_text(
-                    f"🔄 [{idx}/{len(subjects_data)}] Processing: {subject_name}\n"
-                    f"Messages: {total_messages} | ✅ {success_count} | ❌ {fail_count}"
+                checkpoint = await batch_checkpoint.load(db, subject.extra['checkpoint_key'], subject.start_id)
+            except Exception as e:
+                logging.warning(f"Could not load checkpoint for {subject.name}: {e}")
+                checkpoint = None
+            subject.extra['checkpoint'] = checkpoint
+            if checkpoint:
+                subject.thumbnail_url = checkpoint.get('thumbnail_url')
+        await asyncio.gather(*[load_checkpoint(subject) for subject in subjects])
+
+        async def save_checkpoint(subject):
+            try:
+                await batch_checkpoint.save(
+                    db, subject.extra['checkpoint_key'], subject, subject.extra['fingerprints'],
+                    subject.extra['json_hash'], subject.extra.get('html_hash'),
                 )
+            except Exception as e:
+                logging.warning(f"Could not save checkpoint for {subject.name}: {e}")
+
+        counts = {'success': 0, 'fail': fail_count}
+        summary_lines = []
+        staged = []     # (subject, notes) waiting for the next commit
+
+        # Subjects a resumed job finished before the restart: staged blobs still
+        # exist on GitHub, so they only need to go into the next commit
+        pending = []
+        for subject in subjects:
+            saved = job['subjects'].get(str(subject.index), {})
+            if saved.get('state') == 'staged':
+                publisher.restage(saved['files'])
+                subject.state, subject.result = "done", saved['result']
+                subject.thumbnail_url = saved.get('thumbnail_url')
+                subject.extra.update(json_hash=saved['json_hash'], html_hash=saved.get('html_hash'))
+                staged.append((subject, saved['notes']))
+            elif saved.get('state') in ('unchanged', 'published'):
+                counts['success'] += 1
+                summary_lines.append(saved['line'])
+            else:
+                pending.append(subject)
+        await journal.save(job)
+
+        async def record(subject, state):
+            """Journal a finished subject so a resumed job does not redo it."""
+            job['subjects'][str(subject.index)] = state
+            job['cursor'] = executor.progress()['processed']
+            await journal.save(job)
+
+        def reuse(subject, msg):
+            slot = batch_checkpoint.reuse(subject.extra['checkpoint'], msg)
+            if slot is not None:
+                subject.extra['fingerprints'][msg.id] = batch_checkpoint.fingerprint(msg)
+            return slot
+
+        async def build(subject, msg, thumbnail_url):
+            subject.extra['fingerprints'][msg.id] = batch_checkpoint.fingerprint(msg)
+            entries, skipped = [], []
+            # client=None: thumbnails are produced by the executor's thumbnail stage
+            await process_message(msg, entries, skipped, subject.extra['folder'], None, thumbnail_url)
+            return entries, skipped
+
+        async def thumbnail(subject, msg):
+            media = get_media_from_message(msg)
+            # file_ids are per bot: download with the client that fetched this message
+            fetched_by = getattr(msg, '_client', None) or client
+            return await thumbnails.get(
+                media.file_unique_id, fetched_by, msg, subject.extra['folder'], batch_caption(msg, media)
+            )
+
+        async def publish(subject):
+            clean_output = [{k: v for k, v in e.items() if k != '_thumb_error'} for e in subject.lectures]
+            skipped_messages = subject.skipped
 
-                batch_size = 50
-                processed_count = 0
-                shared_thumbnail_url = None
-                thumb_warning = None
+            output_data = {
+                "subjectName": subject.name.lower().replace(" ", ""),
+                "lectures": clean_output,
+                "skipped": skipped_messages
+            }
 
-                for batch_start in range(start_id, end_id + 1, batch_size):
-                    batch_end = min(batch_start + batch_size - 1, end_id)
-                    msg_ids = list(range(batch_start, batch_end + 1))
+            json_filename, json_repo_path, html_repo_path = subject_paths(subject)
+            json_content = json.dumps(output_data, indent=4, ensure_ascii=False)
+            github_file_path = f"{publisher.full_name}/{json_repo_path}"
+            html_content = generate_lecture_html(json_filename)
+            github_html_path = f"{publisher.full_name}/{html_repo_path}"
 
-                    try:
-                        messages = await get_messages(client, msg_ids)
-                    except Exception:
-                        messages = []
-                        for msg_id in msg_ids:
-                            try:
-                                msg = (await get_messages(client, [msg_id]))[0]
-                                messages.append(msg)
-                            except:
-                                messages.append(None)
-
-                    for msg in messages:
-                        processed_count += 1
-                        if not msg:
-                            skipped_messages.append({
-                                "id": "Unknown",
-                                "file_name": "Unknown",
-                                "reason": "Message not found"
-                            })
-                            continue
+            checkpoint = subject.extra['checkpoint'] or {}
+            json_hash = batch_checkpoint.content_hash(json_content)
+            html_hash = batch_checkpoint.content_hash(html_content)
+            subject.extra['json_hash'] = json_hash
+            unchanged = checkpoint.get('json_hash') == json_hash
+            html_unchanged = checkpoint.get('html_hash') == html_hash
 
-                        thumbnail_folder = subject_name.lower().replace(" ", "_")
-                        await process_message(msg, json_output, skipped_messages, thumbnail_folder, client, shared_thumbnail_url)
-
-                        if json_output:
-                            last_entry = json_output[-1]
-                            if not shared_thumbnail_url and 'thumbnailUrl' in last_entry:
-                                shared_thumbnail_url = last_entry['thumbnailUrl']
-                                logging.info(f"✅ Thumbnail reused for remaining videos in {subject_name}: {shared_thumbnail_url}")
-                            if not thumb_warning and '_thumb_error' in last_entry:
-                                thumb_warning = last_entry.pop('_thumb_error')
-                            elif '_thumb_error' in last_entry:
-                                last_entry.pop('_thumb_error')
-
-                clean_output = [{k: v for k, v in e.items() if k != '_thumb_error'} for e in json_output]
-
-                output_data = {
-                    "subjectName": subject_name.lower().replace(" ", ""),
-                    "lectures": clean_output,
-                    "skipped": skipped_messages
-                }
-
-                json_filename = f"{subject_name}.json"
-                json_content = json.dumps(output_data, indent=4, ensure_ascii=False)
-                github_file_path = f"{github_dest_folder}/{json_filename}".replace('//', '/')
-                commit_msg_json = f"Add {json_filename} - {len(clean_output)} lectures"
-
-                logging.info(f"Uploading JSON to GitHub: {github_file_path}")
-                upload_success, upload_error = await upload_to_github(
-                    json_content,
-                    github_file_path,
-                    commit_msg_json,
-                    git_token
-                )
+            async def skip():
+                return True, None
 
-                html_filename = f"{subject_name}.html"
-                html_content = generate_lecture_html(json_filename)
-                github_html_path = f"{github_dest_folder}/{html_filename}".replace('//', '/')
-                logging.info(f"Uploading HTML to GitHub: {github_html_path}")
-                html_upload_success, html_upload_error = await upload_to_github(
-                    html_content,
-                    github_html_path,
-                    f"Add {html_filename}",
-                    git_token
-                )
+            if unchanged:
+                logging.info(f"{subject.name}: JSON unchanged since last run, nothing to publish")
+            else:
+                logging.info(f"Staging JSON and HTML for GitHub: {github_file_path}, {github_html_path}")
+            (upload_success, upload_error), (html_upload_success, html_upload_error) = await asyncio.gather(
+                skip() if unchanged else publisher.stage(json_repo_path, json_content),
+                skip() if html_unchanged else publisher.stage(html_repo_path, html_content),
+            )
+            if html_upload_success:
+                subject.extra['html_hash'] = html_hash
+            return {
+                'unchanged': unchanged and html_unchanged,
+                'lectures': len(clean_output),
+                'skipped': len(skipped_messages),
+                'json_ok': upload_success, 'json_error': upload_error, 'json_path': github_file_path,
+                'html_ok': html_upload_success, 'html_error': html_upload_error, 'html_path': github_html_path,
+            }
 
-                if upload_success:
-                    success_count += 1
-                    # Build success note with any warnings
-                    notes = []
-                    if thumb_warning:
-                        notes.append(f"⚠️ Thumb: {thumb_warning[:150]}")
-                    if not html_upload_success:
-                        notes.append(f"⚠️ HTML upload failed: {(html_upload_error or '')[:150]}")
-                    note_text = "\n" + "\n".join(notes) if notes else ""
-                    await status_msg.edit_text(
-                        f"✅ [{idx}/{len(subjects_data)}] {subject_name} done!\n"
-                        f"Lectures: {len(clean_output)} | Skipped: {len(skipped_messages)}\n"
-                        f"JSON: ✅  HTML: {'✅' if html_upload_success else '❌'}"
-                        f"{note_text}\n\n"
-                        f"Overall: ✅ {success_count} | ❌ {fail_count}"
+        async def on_subject_done(subject):
+            tag = f"[{subject.index}/{total_subjects}] {subject.name}"
+            result = subject.result
+            if subject.state == "failed":
+                counts['fail'] += 1
+                summary_lines.append(f"❌ {subject.name} — exception")
+                # Send as NEW message so it stays visible
+                await message.reply_text(f"❌ {tag} — Exception\n\n{subject.error}")
+            elif result['unchanged']:
+                counts['success'] += 1
+                line = f"⏸ {subject.name} — unchanged, {result['lectures']} lectures"
+                summary_lines.append(line)
+                await save_checkpoint(subject)
+                await record(subject, {'state': 'unchanged', 'line': line})
+            elif result['json_ok']:
+                notes = []
+                if subject.thumbnail_error and not subject.thumbnail_url:
+                    notes.append(f"⚠️ thumb: {subject.thumbnail_error[:100]}")
+                if not result['html_ok']:
+                    notes.append("⚠️ HTML")
+                staged.append((subject, notes))
+                _, json_repo_path, html_repo_path = subject_paths(subject)
+                await record(subject, {
+                    'state': 'staged',
+                    'files': publisher.staged_files([json_repo_path, html_repo_path]),
+                    'result': result,
+                    'notes': notes,
+                    'json_hash': subject.extra['json_hash'],
+                    'html_hash': subject.extra.get('html_hash'),
+                    'thumbnail_url': subject.thumbnail_url,
+                })
+                if not result['html_ok']:
+                    await message.reply_text(
+                        f"⚠️ {tag} — HTML upload failed\n\n"
+                        f"📁 Path: {result['html_path']}\n\n"
+                        f"🔍 Error:\n{(result['html_error'] or '')[:300]}"
                     )
-                else:
-                    fail_count += 1
-                    error_detail = upload_error or "Unknown error"
-                    logging.error(f"GitHub JSON upload failed for {subject_name}: {error_detail}")
-                    # Send error as a NEW separate message — it will NOT be overwritten
+                await commit_staged()
+            else:
+                counts['fail'] += 1
+                error_detail = result['json_error'] or "Unknown error"
+                logging.error(f"GitHub JSON upload failed for {subject.name}: {error_detail}")
+                summary_lines.append(f"❌ {subject.name} — JSON upload failed")
+                # Send error as a NEW separate message — it will NOT be overwritten
+                await message.reply_text(
+                    f"❌ {tag} — JSON upload failed\n\n"
+                    f"📁 Path: {result['json_path']}\n\n"
+                    f"🔍 Error:\n{error_detail}"
+                )
+                if not result['html_ok'] and result['html_error']:
+                    logging.error(f"GitHub HTML upload also failed for {subject.name}: {result['html_error']}")
                     await message.reply_text(
-                        f"❌ [{idx}/{len(subjects_data)}] {subject_name} — JSON upload failed\n\n"
-                        f"📁 Path: {github_file_path}\n\n"
-                        f"🔍 Error:\n{error_detail}"
+                        f"❌ {tag} — HTML upload also failed\n\n"
+                        f"📁 Path: {result['html_path']}\n\n"
+                        f"🔍 Error:\n{result['html_error']}"
                     )
-                    if not html_upload_success and html_upload_error:
-                        logging.error(f"GitHub HTML upload also failed for {subject_name}: {html_upload_error}")
-                        await message.reply_text(
-                            f"❌ [{idx}/{len(subjects_data)}] {subject_name} — HTML upload also failed\n\n"
-                            f"📁 Path: {github_html_path}\n\n"
-                            f"🔍 Error:\n{html_upload_error}"
-                        )
-                    await status_msg.edit_text(
-                        f"⏳ [{idx}/{len(subjects_data)}] {subject_name} failed — see error above\n\n"
-                        f"Overall: ✅ {success_count} | ❌ {fail_count}"
+
+        commit_lock = asyncio.Lock()
+        last_commit = time.monotonic()
+        commit_state = {'error': None}
+
+        async def commit_staged(final: bool = False):
+            """Commit staged subjects once BATCH_COMMIT_EVERY of them or
+            BATCH_COMMIT_INTERVAL seconds have piled up, or on the final call.
+            A failed commit keeps its subjects staged for the next one."""
+            nonlocal last_commit
+            async with commit_lock:
+                due = (len(staged) >= Var.BATCH_COMMIT_EVERY
+                       or time.monotonic() - last_commit >= Var.BATCH_COMMIT_INTERVAL)
+                if not staged or not (final or due):
+                    return
+                chunk = list(staged)
+                last_commit = time.monotonic()
+                lecture_total = sum(subject.result['lectures'] for subject, _ in chunk)
+                commit_ok, commit_error = await publisher.commit(
+                    f"Add {len(chunk)} subjects - {lecture_total} lectures\n\n"
+                    + "\n".join(f"{subject.name}: {subject.result['lectures']} lectures" for subject, _ in chunk)
+                )
+                if not commit_ok:
+                    commit_state['error'] = commit_error
+                    logging.error(f"GitHub commit failed for {len(chunk)} subjects: {commit_error}")
+                    return
+                commit_state['error'] = None
+                for subject, notes in chunk:
+                    staged.remove((subject, notes))
+                    counts['success'] += 1
+                    if subject.reused:
+                        notes.insert(0, f"{subject.total - subject.reused} new/changed")
+                    line = (
+                        f"✅ {subject.name} — {subject.result['lectures']} lectures, {subject.result['skipped']} skipped"
+                        + (f" ({', '.join(notes)})" if notes else "")
                     )
+                    summary_lines.append(line)
+                    await save_checkpoint(subject)
+                    await record(subject, {'state': 'published', 'line': line})
+
+        governor = RateGovernor(Var.BATCH_RATE)
+        # Every bot can read DB_CHANNEL, so page fetches are spread across all of them
+        paginator = MessagePaginator(
+            multi_clients if Var.BATCH_SHARD_CLIENTS and multi_clients else {0: client},
+            Var.DB_CHANNEL,
+            concurrency=Var.BATCH_FETCH_CONCURRENCY,
+            governor=governor,
+        )
+        executor = BatchExecutor(
+            paginator,
+            build=build,
+            publish=publish,
+            thumbnail=thumbnail,
+            wants_thumbnail=_wants_batch_thumbnail,
+            reuse=reuse,
+            subjects=Var.BATCH_SUBJECT_CONCURRENCY,
+            linkers=Var.BATCH_LINK_CONCURRENCY,
+            uploaders=Var.BATCH_UPLOAD_CONCURRENCY,
+            governor=governor,
+            on_subject_done=on_subject_done,
+        )
 
-                await asyncio.sleep(1)
+        def progress_text():
+            p = executor.progress()
+            running = ", ".join(p['running'][:5]) or "—"
+            return (
+                f"🔄 Batch: {p['done'] + p['failed'] + len(subjects) - len(pending)}/{len(subjects)} subjects | "
+                f"✅ {counts['success']} | ❌ {counts['fail']}\n"
+                f"Messages: {p['processed']}/{p['messages']}"
+                + (f" ({p['reused']} unchanged)" if p['reused'] else "") + "\n"
+                f"Working on: {running}"
+            )
 
-            except Exception as e:
-                fail_count += 1
-                err_text = f"{type(e).__name__}: {e}"
-                logging.error(f"Exception processing {subject_name}: {err_text}", exc_info=True)
-                # Send as NEW message so it stays visible
-                await message.reply_text(
-                    f"❌ [{idx}/{len(subjects_data)}] {subject_name} — Exception\n\n{err_text}"
-                )
-                await status_msg.edit_text(
-                    f"⏳ [{idx}/{len(subjects_data)}] {subject_name} failed — see error above\n\n"
-                    f"Overall: ✅ {success_count} | ❌ {fail_count}"
-                )
-                continue
+        reporter = ProgressReporter(status_msg, Var.PROGRESS_EDIT_INTERVAL, render=progress_text).start()
+        try:
+            await executor.run(pending)
+            await commit_staged(final=True)
+        finally:
+            await reporter.stop()
+
+        for subject, notes in staged:
+            counts['fail'] += 1
+            summary_lines.append(f"❌ {subject.name} — commit failed")
+        if staged:
+            await message.reply_text(
+                f"❌ GitHub commit failed — {len(staged)} subjects were not published\n\n"
+                f"📁 Repo: {publisher.full_name}\n\n"
+                f"🔍 Error:\n{commit_state['error']}"
+            )
+
+        success_count = counts['success']
+        fail_count = counts['fail']
 
         # Final summary — always a new message so it appears after all error messages
         summary = (
             f"🏁 Batch complete!\n"
-            f"Total: {len(subjects_data)} | ✅ Success: {success_count} | ❌ Failed: {fail_count}"
+            f"Total: {total_subjects} | ✅ Success: {success_count} | ❌ Failed: {fail_count}"
         )
-        await message.reply_text(summary)
-        await status_msg.edit_text(f"✅ Done — {success_count}/{len(subjects_data)} uploaded successfully.")
+        if summary_lines:
+            summary += "\n\n" + "\n".join(summary_lines)
+        await message.reply_text(summary[:4096])
+        await reporter.stop(f"✅ Done — {success_count}/{total_subjects} uploaded successfully.")
+        await journal.finish(job)
 
     except Exception as e:
         logging.error(f"Fatal error in _run_batch_processing: {e}", exc_info=True)
         await message.reply(f"❌ Fatal error: {type(e).__name__}: {e}")
+        if job is not None:
+            await journal.finish(job)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1304,6 +1428,119 @@ async def _get_chat_latest_msg_id(client: Client, chat_id: int) -> int:
     return 0
 
 
+def _forum_topic_title(msg) -> "str | None":
+    """Title of a topic-creation service message, None for any other message."""
+    ftc = getattr(msg, "forum_topic_created", None) or getattr(msg, "new_forum_topic", None)
+    if ftc is None:
+        return None
+    return getattr(ftc, "name", None) or getattr(ftc, "title", None)
+
+
+def _content_topic_id(msg) -> "int | None":
+    """Topic ID of a message that carries text or media, None for service/empty ones."""
+    # Skip topic-creation service messages (no content)
+    if (getattr(msg, "forum_topic_created", None) is not None
+            or getattr(msg, "new_forum_topic", None) is not None):
+        return None
+
+    # Skip other service/empty messages that carry no media or text
+    has_content = bool(
+        msg.text or msg.media or msg.document or msg.video
+        or msg.audio or msg.photo or msg.voice
+        or msg.video_note or msg.sticker or msg.animation
+    )
+    if not has_content:
+        return None
+    return _get_topic_id_from_msg(msg)
+
+
+async def _scan_forum_indexed(
+    client: Client,
+    chat_id: int,
+    start_topic: int,
+    scan_start: int,
+    end_topic: int,
+    scan_end: int,
+    progress: ProgressReporter,
+) -> "dict[int, dict]":
+    """
+    Topics in [start_topic, end_topic], reusing the chat's scan index.
+
+    When a previous scan's index covers the range, only messages above its
+    watermark are scanned and folded in (see forum_index.py). Otherwise the
+    range gets a full scan, which replaces the index.
+    """
+    latest_id = await _get_chat_latest_msg_id(client, chat_id)
+    try:
+        index = await forum_index.load(db, chat_id)
+    except Exception as exc:
+        logging.warning(f"fbatch index load error: {exc}")
+        index = None
+
+    if latest_id > 0 and forum_index.covers(index, start_topic, end_topic):
+        watermark = index["watermark"]
+        if latest_id > watermark:
+            await _scan_forum_since(client, chat_id, index, latest_id, progress)
+            try:
+                await forum_index.save(db, chat_id, index)
+            except Exception as exc:
+                logging.warning(f"fbatch index save error: {exc}")
+        logging.info(f"fbatch: {chat_id} index reused, scanned {max(0, latest_id - watermark)} new message id(s)")
+        return forum_index.topics_in(index, start_topic, end_topic)
+
+    topics = await _scan_forum_topics(
+        client, chat_id, start_topic, scan_start, end_topic, scan_end, progress
+    )
+    # Without the chat's latest message there is no watermark to resume from
+    if latest_id > 0:
+        try:
+            await forum_index.save(db, chat_id, forum_index.build(topics, start_topic, end_topic, latest_id))
+        except Exception as exc:
+            logging.warning(f"fbatch index save error: {exc}")
+    return topics
+
+
+async def _scan_forum_since(
+    client: Client,
+    chat_id: int,
+    index: dict,
+    latest_id: int,
+    progress: ProgressReporter,
+) -> None:
+    """Fold messages in (index watermark, latest_id] into index."""
+    start_id = index["watermark"] + 1
+    names: dict = {}
+
+    def topic_of(msg):
+        title = _forum_topic_title(msg)
+        if title:
+            names[msg.id] = title
+            return None
+        tid = _content_topic_id(msg)
+        return tid if tid is not None and forum_index.tracks(index, tid) else None
+
+    total_est = max(1, latest_id - start_id + 1)
+    progress.update(f"🔍 Scanning {total_est} new message ID(s) since the last scan…")
+
+    def on_page(scan: HistoryScanner):
+        pct = min(99, scan.scanned * 100 // total_est)
+        progress.update(f"🔍 New messages — {pct}% (~{scan.scanned} msgs)")
+
+    scanner = HistoryScanner(
+        multi_clients if Var.FBATCH_SHARD_CLIENTS and multi_clients else {0: client},
+        chat_id,
+        key=topic_of,
+        page_size=_FBATCH_CHUNK,
+        delay=_FBATCH_DELAY,
+        on_page=on_page,
+    )
+    bounds = await scanner.scan(start_id, latest_id)
+    if scanner.failed:
+        # Leave the watermark alone so the next run rescans this stretch
+        raise RuntimeError(f"{scanner.failed}/{scanner.shards} shard(s) of new messages failed")
+    forum_index.fold(index, bounds, names, latest_id)
+
+
 async def _scan_forum_topics(
     client: Client,
     chat_id: int,
@@ -1311,7 +1548,39 @@ async def _scan_forum_topics(
     scan_start: int,
     end_topic: int,
     scan_end: int,
-    status_msg,
+    progress: ProgressReporter,
+) -> "dict[int, dict]":
+    """
+    Topics in [start_topic, end_topic] with their first and last content message.
+
+    Asks the forum topics API first (a few calls per topic, names included,
+    see forum_topics.py). When Telegram refuses it, falls back to the
+    two-phase history scan below.
+
+    Returns { topic_id: {'min': int, 'max': int, 'name': str | None} }
+    """
+    progress.update(f"🔍 Listing forum topics {start_topic} → {end_topic}…")
+    try:
+        topics = await forum_topics.discover(
+            client, chat_id, start_topic, end_topic,
+            on_topic=lambda done, total: progress.update(f"🔍 Reading topic bounds — {done}/{total} topics"),
+        )
+    except Exception as exc:
+        logging.warning(f"fbatch topic API error: {exc}")
+        topics = None
+    if topics is not None:
+        return topics
+    return await _scan_forum_history(client, chat_id, start_topic, scan_start, end_topic, scan_end, progress)
+
+
+async def _scan_forum_history(
+    client: Client,
+    chat_id: int,
+    start_topic: int,
+    scan_start: int,
+    end_topic: int,
+    scan_end: int,
+    progress: ProgressReporter,
 ) -> "dict[int, dict]":
     """
     Two-phase forum topic scan.
@@ -1324,6 +1593,8 @@ async def _scan_forum_topics(
         Fetch all regular (non-service) messages and group them by their
         reply_to_top_message_id (= topic ID).  Only keeps topics discovered in
         Phase 1.  Tracks the first and last content message for each topic.
+        The range is split into shards scanned concurrently, one worker per
+        bot client, and the per-topic bounds are merged at the end.
 
     Returns { topic_id: {'min': int, 'max': int, 'name': None} }
     """
@@ -1338,12 +1609,7 @@ async def _scan_forum_topics(
     # ─────────────────────────────────────────────────────────────────────────
 
     # ── Phase 1: use get_chat_history to find topic-creation service messages ─
-    try:
-        await status_msg.edit_text(
-            f"🔍 Phase 1/2 — discovering topics {start_topic} → {end_topic}…"
-        )
-    except Exception:
-        pass
+    progress.update(f"🔍 Phase 1/2 — discovering topics {start_topic} → {end_topic}…")
 
     phase1_end = max(end_topic, scan_end)
     phase1_limit = phase1_end - start_topic + 100
@@ -1361,7 +1627,7 @@ async def _scan_forum_topics(
             )
             if is_topic_creation and start_topic <= msg.id <= end_topic:
                 valid_topic_ids.add(msg.id)
-                topics[msg.id] = {"min": None, "max": None, "name": None}
+                topics[msg.id] = {"min": None, "max": None, "name": _forum_topic_title(msg)}
     except Exception as exc:
         logging.warning(f"fbatch phase1 get_chat_history error: {exc}")
 
@@ -1377,117 +1643,75 @@ async def _scan_forum_topics(
     wide_start = min(start_topic, scan_start)
     wide_end   = max(scan_end, latest_id)
 
-    try:
-        await status_msg.edit_text(
-            f"🔍 Phase 2/2 — scanning {wide_start}→{wide_end} "
-            f"for {len(valid_topic_ids) or '?'} topic(s)…"
-        )
-    except Exception:
-        pass
-
-    # Iterate newest→oldest in chunks via get_chat_history
-    offset_id = wide_end + 1
-    processed = 0
-    total_est = max(1, wide_end - wide_start + 1)
-    last_pct  = -10
-
-    while offset_id > wide_start:
-        batch = []
-        try:
-            async for msg in client.get_chat_history(
-                chat_id, limit=_FBATCH_CHUNK, offset_id=offset_id
-            ):
-                batch.append(msg)
-                if msg.id <= wide_start:
-                    break
-        except FloodWait as fw:
-            await asyncio.sleep(fw.value + 1)
-            continue
-        except Exception as exc:
-            logging.warning(f"fbatch phase2 get_chat_history error: {exc}")
-            break
-
-        if not batch:
-            break
-
-        for msg in batch:
-            if msg.id < wide_start:
-                continue
-
-            # Skip topic-creation service messages (no content)
-            if (getattr(msg, "forum_topic_created", None) is not None
-                    or getattr(msg, "new_forum_topic", None) is not None):
-                continue
+    progress.update(
+        f"🔍 Phase 2/2 — scanning {wide_start}→{wide_end} "
+        f"for {len(valid_topic_ids) or '?'} topic(s)…"
+    )
 
-            # Skip other service/empty messages that carry no media or text
-            has_content = bool(
-                msg.text or msg.media or msg.document or msg.video
-                or msg.audio or msg.photo or msg.voice
-                or msg.video_note or msg.sticker or msg.animation
-            )
-            if not has_content:
-                continue
+    def topic_of(msg):
+        tid = _content_topic_id(msg)
+        if tid is None:
+            return None
 
-            tid = _get_topic_id_from_msg(msg)
-            if tid is None:
-                continue
+        # Filter: Phase-1 topics take priority
+        if valid_topic_ids:
+            return tid if tid in valid_topic_ids else None
+        # Fallback: accept any topic whose ID falls in [start, end]
+        return tid if start_topic <= tid <= end_topic else None
 
-            # Filter: Phase-1 topics take priority
-            if valid_topic_ids:
-                if tid not in valid_topic_ids:
-                    continue
-            else:
-                # Fallback: accept any topic whose ID falls in [start, end]
-                if not (start_topic <= tid <= end_topic):
-                    continue
+    total_est = max(1, wide_end - wide_start + 1)
 
-            mid = msg.id
-            if tid not in topics:
-                topics[tid] = {"min": mid, "max": mid, "name": None}
-            else:
-                if mid < topics[tid]["min"]:
-                    topics[tid]["min"] = mid
-                if mid > topics[tid]["max"]:
-                    topics[tid]["max"] = mid
-
-        processed += len(batch)
-        pct = min(99, processed * 100 // total_est)
-        if pct >= last_pct + 10:
-            last_pct = pct
-            active = sum(1 for v in topics.values() if v["min"] is not None)
-            try:
-                await status_msg.edit_text(
-                    f"🔍 Phase 2/2 — {pct}% (~{processed} msgs)\n"
-                    f"Topics with content: {active}"
-                )
-            except Exception:
-                pass
+    def on_page(scan: HistoryScanner):
+        pct = min(99, scan.scanned * 100 // total_est)
+        progress.update(
+            f"🔍 Phase 2/2 — {pct}% (~{scan.scanned} msgs)\n"
+            f"Shards: {scan.done}/{scan.shards} across {len(scan.clients)} client(s)"
+        )
 
-        # Move the window: next batch starts just below the oldest msg in this batch
-        oldest_id = batch[-1].id
-        if oldest_id <= wide_start:
-            break
-        offset_id = oldest_id
-        await asyncio.sleep(_FBATCH_DELAY)
+    # Shards of the range are paged newest→oldest at the same time, one worker per bot
+    scanner = HistoryScanner(
+        multi_clients if Var.FBATCH_SHARD_CLIENTS and multi_clients else {0: client},
+        chat_id,
+        key=topic_of,
+        page_size=_FBATCH_CHUNK,
+        delay=_FBATCH_DELAY,
+        on_page=on_page,
+    )
+    for tid, (lo, hi) in (await scanner.scan(wide_start, wide_end)).items():
+        topics[tid] = {"min": lo, "max": hi, "name": topics.get(tid, {}).get("name")}
+    if scanner.failed:
+        # A partial result would be indexed as complete, so the scan fails instead
+        raise RuntimeError(f"{scanner.failed}/{scanner.shards} history shard(s) failed")
 
     # Drop any topic entries where no content message was found
     return {tid: info for tid, info in topics.items() if info["min"] is not None}
 
 
 async def _fetch_topic_names(client: Client, chat_id: int, topics: dict) -> None:
-    """Fetch topic title by reading the topic-header service message for each topic."""
-    for tid in list(topics.keys()):
+    """
+    Fill in unnamed topics from the chat's scan index. Topics the index has
+    no name for fall back to reading their topic-header service message, and
+    the names found that way are stored back in the index.
+    """
+    index = await forum_index.load(db, chat_id)
+    known = forum_index.names(index)
+    found = {}
+    for tid in [tid for tid, info in topics.items() if not info["name"]]:
+        if tid in known:
+            topics[tid]["name"] = known[tid]
+            continue
         try:
             msg = await client.get_messages(chat_id, tid)
             if msg and not getattr(msg, "empty", True):
-                ftc = getattr(msg, "forum_topic_created", None)
-                if ftc:
-                    name = getattr(ftc, "name", None) or getattr(ftc, "title", None)
-                    if name:
-                        topics[tid]["name"] = name
+                name = _forum_topic_title(msg)
+                if name:
+                    topics[tid]["name"] = found[tid] = name
         except Exception:
             pass
         await asyncio.sleep(0.2)
+    if index and found:
+        forum_index.set_names(index, found)
+        await forum_index.save(db, chat_id, index)
 
 
 @StreamBot.on_message(filters.private & filters.user(list(Var.ADMIN_IDS)) & filters.command('fbatch'))
@@ -1502,13 +1726,13 @@ async def fbatch_command(client: Client, message: Message):
         "`https://t.me/c/3950094573/5-https://t.me/c/3950094573/9`\n\n"
         "3-part (specific message in topic):\n"
         "`https://t.me/c/2932205861/116/117-https://t.me/c/2932205861/1040/1642`\n\n"
-        "The bot will find all topics created between those two IDs, then scan "
-        "the entire chat history to find the first and last message in each topic."
+        "The bot will find all topics created between those two IDs and the "
+        "first and last message in each topic."
     )
 
 
 async def _run_fbatch_scan(client: Client, message: Message):
-    """Core logic: parse range → 2-phase scan → build topic map → send result."""
+    """Core logic: parse range → discover topics and bounds → build topic map → send result."""
     raw = message.text.strip()
 
     parsed = _parse_fbatch_range(raw)
@@ -1532,23 +1756,24 @@ async def _run_fbatch_scan(client: Client, message: Message):
         f"Chat   : -100{_raw_chat(chat_id)}\n"
         f"Topics : {start_topic} → {end_topic}\n"
         f"Msgs   : {scan_start} → {scan_end}\n\n"
-        f"⏳ Phase 1: discovering topics…"
+        f"⏳ Discovering topics…"
     )
 
+    progress = ProgressReporter(status_msg, Var.PROGRESS_EDIT_INTERVAL).start()
     try:
-        topics = await _scan_forum_topics(
+        topics = await _scan_forum_indexed(
             client, chat_id,
             start_topic, scan_start,
             end_topic, scan_end,
-            status_msg,
+            progress,
         )
     except Exception as exc:
         logging.error(f"fbatch scan error: {exc}", exc_info=True)
-        await status_msg.edit_text(f"❌ Scan failed: {type(exc).__name__}: {exc}")
+        await progress.stop(f"❌ Scan failed: {type(exc).__name__}: {exc}")
         return
 
     if not topics:
-        await status_msg.edit_text(
+        await progress.stop(
             f"⚠️ No forum topics found in range {start_topic} → {end_topic}.\n\n"
             "• Confirm the bot can read this supergroup.\n"
             "• Confirm Topics are enabled in the group.\n"
@@ -1557,10 +1782,9 @@ async def _run_fbatch_scan(client: Client, message: Message):
         return
 
     try:
-        await status_msg.edit_text(
-            f"✅ Found {len(topics)} topic(s) — fetching names…"
-        )
-        await _fetch_topic_names(client, chat_id, topics)
+        if any(not info["name"] for info in topics.values()):
+            progress.update(f"✅ Found {len(topics)} topic(s) — fetching names…")
+            await _fetch_topic_names(client, chat_id, topics)
     except Exception as exc:
         logging.warning(f"fbatch name fetch error: {exc}")
 
@@ -1641,6 +1865,7 @@ async def _run_fbatch_scan(client: Client, message: Message):
             except Exception:
                 pass
 
+    await progress.stop()
     try:
         await status_msg.delete()
     except Exception:
@@ -1698,52 +1923,75 @@ async def fwd_command(client: Client, message: Message):
             filters=filters.text,
             timeout=120
         )
+        await _run_fwd_processing(client, message, links_msg.text.strip())
 
-        links_text = links_msg.text.strip()
-        subjects_data = []
-        current_subject = None
-        current_first = None
-        current_last = None
+    except asyncio.TimeoutError:
+        await message.reply("⏱️ Request timeout. Please try again.")
+    except Exception as e:
+        await message.reply(f"❌ Error: {str(e)}")
 
-        for line in links_text.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-            if not line.startswith('F -') and not line.startswith('L -'):
-                if current_subject and current_first and current_last:
-                    subjects_data.append({
-                        'subject': current_subject,
-                        'first': current_first,
-                        'last': current_last
-                    })
-                current_subject = line
-                current_first = None
-                current_last = None
-            elif line.startswith('F -'):
-                current_first = line.replace('F -', '').strip()
-            elif line.startswith('L -'):
-                current_last = line.replace('L -', '').strip()
 
-        if current_subject and current_first and current_last:
-            subjects_data.append({
-                'subject': current_subject,
-                'first': current_first,
-                'last': current_last
-            })
+async def _run_fwd_processing(client: Client, message: Message, links_text: str, job: dict = None):
+    """Copy every subject's F..L range into the DB channel and reply with the new F/L links.
 
-        if not subjects_data:
-            await message.reply("❌ No valid subjects found. Check the format and try again.")
-            return
+    Progress is journaled after every copied message (copies are not
+    idempotent), so a job resumed after a restart continues where it stopped.
+    """
+    subjects_data = []
+    current_subject = None
+    current_first = None
+    current_last = None
+
+    for line in links_text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith('F -') and not line.startswith('L -'):
+            if current_subject and current_first and current_last:
+                subjects_data.append({
+                    'subject': current_subject,
+                    'first': current_first,
+                    'last': current_last
+                })
+            current_subject = line
+            current_first = None
+            current_last = None
+        elif line.startswith('F -'):
+            current_first = line.replace('F -', '').strip()
+        elif line.startswith('L -'):
+            current_last = line.replace('L -', '').strip()
+
+    if current_subject and current_first and current_last:
+        subjects_data.append({
+            'subject': current_subject,
+            'first': current_first,
+            'last': current_last
+        })
+
+    if not subjects_data:
+        await message.reply("❌ No valid subjects found. Check the format and try again.")
+        return
 
+    if job is None:
+        job = await journal.create('fwd', message.chat.id, message.id, {'links_text': links_text})
+
+    progress = None
+    try:
         status_msg = await message.reply_text(
             f"🚀 Starting forward of {len(subjects_data)} subject(s) to DB channel..."
         )
+        progress = ProgressReporter(status_msg, Var.PROGRESS_EDIT_INTERVAL).start()
 
         db_short = db_channel_short_id(Var.DB_CHANNEL)
         result_lines = []
 
         for idx, subject_info in enumerate(subjects_data, 1):
             subject_name = subject_info['subject']
+            # Journaled state: cursor is the last source message id handled
+            state = job['subjects'].setdefault(str(idx), {'state': 'running', 'cursor': None})
+            if state['state'] == 'done':
+                result_lines.append(state['line'])
+                continue
             try:
                 src_chat_id, first_msg_id = parse_tme_link(subject_info['first'])
                 _, last_msg_id = parse_tme_link(subject_info['last'])
@@ -1752,21 +2000,32 @@ async def fwd_command(client: Client, message: Message):
                 end_id = max(first_msg_id, last_msg_id)
                 total = end_id - start_id + 1
 
-                await status_msg.edit_text(
+                progress.update(
                     f"📤 Forwarding {subject_name}...\n"
                     f"Subject {idx}/{len(subjects_data)} | Messages: {total}"
                 )
 
-                fwd_first_id = None
-                fwd_last_id = None
-                forwarded_count = 0
-                failed_count = 0
-                skipped_count = 0   # service/empty messages — not a real failure
-                first_error = None
+                fwd_first_id = state.get('first')
+                fwd_last_id = state.get('last')
+                forwarded_count = state.get('forwarded', 0)
+                failed_count = state.get('failed', 0)
+                skipped_count = state.get('skipped', 0)   # service/empty messages — not a real failure
+                first_error = state.get('first_error')
+
+                async def checkpoint(msg_id):
+                    state.update(
+                        cursor=msg_id, first=fwd_first_id, last=fwd_last_id, forwarded=forwarded_count,
+                        failed=failed_count, skipped=skipped_count, first_error=first_error,
+                    )
+                    job['cursor'] = {'subject': idx, 'message_id': msg_id}
+                    await journal.save(job)
+
+                resume_from = start_id if state['cursor'] is None else state['cursor'] + 1
 
                 # Forward one message at a time — batch forwarding fails entirely
                 # if any single message in the batch is missing/deleted.
-                for msg_id in range(start_id, end_id + 1):
+                for msg_id in range(resume_from, end_id + 1):
+                    copied_before = forwarded_count
                     try:
                         # ── Pre-fetch to detect and skip service/empty messages ──
                         src_msg = await client.get_messages(src_chat_id, msg_id)
@@ -1838,10 +2097,13 @@ async def fwd_command(client: Client, message: Message):
                         if first_error is None:
                             first_error = err_str
                         failed_count += 1
+                    finally:
+                        if forwarded_count != copied_before or (msg_id - start_id + 1) % 20 == 0:
+                            await checkpoint(msg_id)
 
                     # Update status every 20 messages
                     if (msg_id - start_id + 1) % 20 == 0:
-                        await status_msg.edit_text(
+                        progress.update(
                             f"📤 {subject_name}: {forwarded_count} copied, "
                             f"{skipped_count} skipped, {failed_count} failed\n"
                             f"Progress: {msg_id - start_id + 1}/{total} | "
@@ -1851,12 +2113,12 @@ async def fwd_command(client: Client, message: Message):
                 if fwd_first_id and fwd_last_id:
                     f_link = f"https://t.me/c/{db_short}/{fwd_first_id}"
                     l_link = f"https://t.me/c/{db_short}/{fwd_last_id}"
-                    result_lines.append(
+                    result_line = (
                         f"{subject_name}\n"
                         f"F - {f_link}\n"
                         f"L - {l_link}"
                     )
-                    await status_msg.edit_text(
+                    progress.update(
                         f"✅ {subject_name} done!\n"
                         f"Copied: {forwarded_count} | Skipped: {skipped_count} | Failed: {failed_count}\n"
                         f"F - {f_link}\n"
@@ -1877,8 +2139,8 @@ async def fwd_command(client: Client, message: Message):
                             f"\n🔍 {skipped_count} skipped (service msgs), "
                             f"{failed_count} failed — check bot permissions in source chat."
                         )
-                    result_lines.append(f"{subject_name}\n❌ No messages forwarded{error_hint}")
-                    await status_msg.edit_text(
+                    result_line = f"{subject_name}\n❌ No messages forwarded{error_hint}"
+                    progress.update(
                         f"❌ {subject_name}: nothing forwarded\n"
                         f"Attempted: {total} | Skipped: {skipped_count} | Failed: {failed_count}"
                         f"{error_hint}\n\n"
@@ -1889,20 +2151,57 @@ async def fwd_command(client: Client, message: Message):
 
             except Exception as e:
                 logging.error(f"Error forwarding {subject_name}: {e}", exc_info=True)
-                result_lines.append(f"{subject_name}\n❌ Error: {str(e)}")
-                await status_msg.edit_text(
+                result_line = f"{subject_name}\n❌ Error: {str(e)}"
+                progress.update(
                     f"❌ Error on {subject_name}: {str(e)}\n\n"
                     f"Progress: {idx}/{len(subjects_data)}"
                 )
 
-        # Send final summary with all new F/L links
+            result_lines.append(result_line)
+            state.update(state='done', line=result_line)
+            await journal.save(job)
+
+        # Show the last subject's result, then send the summary with all new F/L links
+        await progress.flush()
         final_text = "✅ Forward complete! New DB channel links:\n\n" + "\n\n".join(result_lines)
         await message.reply_text(final_text, disable_web_page_preview=True)
+        await journal.finish(job)
+    except Exception:
+        if progress is not None:
+            await progress.stop()
+        await journal.finish(job)
+        raise
 
-    except asyncio.TimeoutError:
-        await message.reply("⏱️ Request timeout. Please try again.")
+
+async def _resume_job(job: dict):
+    """Continue a journaled /batch or /fwd job after a restart."""
+    kind = "/batch" if job['kind'] == 'batch' else "/fwd"
+    try:
+        message = await StreamBot.get_messages(job['chat_id'], job['message_id'])
     except Exception as e:
-        await message.reply(f"❌ Error: {str(e)}")
+        logging.error(f"Cannot fetch the message for job {job['id']}: {e}")
+        message = None
+    if not message or message.empty:
+        await StreamBot.send_message(job['chat_id'], f"⚠️ Could not resume {kind} job `{job['id']}`: its message is gone.")
+        await journal.finish(job)
+        return
+    done = sum(1 for state in job['subjects'].values() if state.get('state') in ('done', 'staged', 'unchanged'))
+    await StreamBot.send_message(
+        job['chat_id'],
+        f"♻️ Resuming {kind} job `{job['id']}` after a restart — {done} subject(s) already finished.",
+        reply_to_message_id=message.id,
+    )
+    if job['kind'] == 'batch':
+        await _run_batch_processing(StreamBot, message, job['definition']['github_dest_folder'], job)
+    else:
+        try:
+            await _run_fwd_processing(StreamBot, message, job['definition']['links_text'], job)
+        except Exception as e:
+            await message.reply(f"❌ Error: {str(e)}")
+
+
+journal.register('batch', _resume_job)
+journal.register('fwd', _resume_job)
 
 
 @StreamBot.on_message((filters.private) & (filters.document | filters.audio | filters.photo), group=3)
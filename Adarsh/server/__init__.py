@@ -1,10 +1,26 @@
 # © NobiDeveloper
 
 from aiohttp import web
-from .stream_routes import routes
+from .stream_routes import routes, download_queue, registry
+from .rate_limiter import rate_limiter
+from .range_reader import routes as range_routes
+from Adarsh.utils.github_client import github
+
+
+async def _background_tasks(app):
+    rate_limiter.start()
+    download_queue.start()
+    registry.start()
+    yield
+    await registry.stop()
+    await download_queue.stop()
+    await rate_limiter.stop()
+    await github.close()
 
 
 async def web_server():
     web_app = web.Application(client_max_size=30000000)
+    web_app.add_routes(range_routes)
     web_app.add_routes(routes)
+    web_app.cleanup_ctx.append(_background_tasks)
     return web_app
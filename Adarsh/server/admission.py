@@ -0,0 +1,151 @@
+"""
+Admission control for media streams.
+
+Every stream pins one bot client for its whole transfer. Once all clients
+are saturated, admitting more streams only divides the same Telegram
+throughput among more viewers, so everyone stalls. The controller caps
+concurrent streams per bot client (STREAM_MAX_PER_CLIENT) and per process
+(STREAM_MAX_PER_PROCESS) and sheds the excess with a fast 503 + Retry-After.
+
+A slice of each cap (STREAM_PRIORITY_RESERVE) is held back for range
+continuations: a request for a file this client key was already streaming
+within the last few minutes (a player seeking or refilling its buffer).
+New viewers are turned away before people already watching lose their
+stream.
+
+Per-client counts go through the rate limiter backend keyed by bot id, so
+with LIMITER_BACKEND=mongo the web and webx deployments sharing the same
+bot tokens respect one cap per bot.
+"""
+import math
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+log = logging.getLogger("stream.admission")
+
+
+class StreamSlot:
+    """An admitted stream. Release exactly once via AdmissionController.release()."""
+
+    __slots__ = ("index", "session", "priority", "released")
+
+    def __init__(self, index: int, session: Tuple[str, int], priority: bool):
+        self.index = index
+        self.session = session
+        self.priority = priority
+        self.released = False
+
+
+class AdmissionController:
+    def __init__(self, clients: dict, backend, per_client: int, per_process: int,
+                 reserve: float = 0.1, session_ttl: float = 300, retry_after: int = 5):
+        """
+        Args:
+            clients: the live multi_clients mapping (index -> Client)
+            backend: limiter backend (see limiter_backend.py) holding per-bot counters
+            per_client: concurrent streams allowed per bot client (0 = unlimited)
+            per_process: concurrent streams allowed in this process (0 = unlimited)
+            reserve: fraction of each cap only range continuations may use
+            session_ttl: seconds after its last request a viewer still counts as watching
+            retry_after: Retry-After seconds suggested to shed requests
+        """
+        self.clients = clients
+        self.backend = backend
+        self.per_client = per_client
+        self.per_process = per_process
+        self.reserve = reserve
+        self.session_ttl = session_ttl
+        self.retry_after = retry_after
+        self.active: Dict[int, int] = {}
+        self.total = 0
+        self.shed = 0
+        self._sessions: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._max_sessions = 50000
+
+    # ── Caps ─────────────────────────────────────────────────────────────
+
+    def _limit(self, cap: int, priority: bool) -> float:
+        if cap <= 0:
+            return math.inf
+        if priority:
+            return cap
+        return max(1, cap - math.ceil(cap * self.reserve))
+
+    def _bot_key(self, index: int) -> str:
+        me = getattr(self.clients.get(index), 'me', None)
+        return f"bot:{getattr(me, 'id', index)}"
+
+    # ── Sessions ─────────────────────────────────────────────────────────
+
+    def is_continuation(self, key: str, message_id: int) -> bool:
+        seen = self._sessions.get((key, message_id))
+        return seen is not None and time.monotonic() - seen < self.session_ttl
+
+    def _touch(self, session: Tuple[str, int]):
+        self._sessions[session] = time.monotonic()
+        self._sessions.move_to_end(session)
+        while len(self._sessions) > self._max_sessions:
+            self._sessions.popitem(last=False)
+
+    # ── Admission ────────────────────────────────────────────────────────
+
+    async def _take_client(self, index: int, priority: bool) -> bool:
+        if self.active.get(index, 0) >= self._limit(self.per_client, priority):
+            return False
+        if self.per_client > 0 and not await self.backend.acquire(
+            self._bot_key(index), self._limit(self.per_client, priority)
+        ):
+            return False
+        self.active[index] = self.active.get(index, 0) + 1
+        return True
+
+    async def _give_client(self, index: int):
+        self.active[index] = max(0, self.active.get(index, 0) - 1)
+        if self.per_client > 0:
+            await self.backend.release(self._bot_key(index))
+
+    async def admit(self, key: str, message_id: int) -> Optional[StreamSlot]:
+        """Admit a stream of message_id for client key on the least-loaded
+        client with room, or return None when it should be shed."""
+        priority = self.is_continuation(key, message_id)
+        if self.total >= self._limit(self.per_process, priority):
+            self.shed += 1
+            return None
+        # Reserve the process slot before awaiting the shared backend
+        self.total += 1
+        for index in sorted(self.clients, key=lambda i: self.active.get(i, 0)):
+            if await self._take_client(index, priority):
+                session = (key, message_id)
+                self._touch(session)
+                return StreamSlot(index, session, priority)
+        self.total -= 1
+        self.shed += 1
+        return None
+
+    async def move(self, slot: StreamSlot, index: int) -> bool:
+        """Move slot to another client if that client has room."""
+        if index == slot.index:
+            return True
+        if not await self._take_client(index, slot.priority):
+            return False
+        await self._give_client(slot.index)
+        slot.index = index
+        return True
+
+    async def release(self, slot: StreamSlot):
+        if slot.released:
+            return
+        slot.released = True
+        self.total = max(0, self.total - 1)
+        self._touch(slot.session)
+        await self._give_client(slot.index)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.total,
+            "per_client": dict(self.active),
+            "shed": self.shed,
+        }
@@ -0,0 +1,94 @@
+"""
+Optional bandwidth shaping for the stream path (BANDWIDTH_SHAPING=True).
+
+Each response body is a flow. Before a chunk is written the flow draws
+that many bytes from its own token bucket, whose rate is re-derived on
+every chunk as the smallest of:
+
+- BANDWIDTH_PER_CONNECTION_KBPS;
+- its weighted share of BANDWIDTH_PER_IP_KBPS among the active flows of
+  the same client key;
+- its weighted share of BANDWIDTH_PER_CLIENT_KBPS among the active flows
+  on the same bot client.
+
+Interactive playback (inline disposition) gets BANDWIDTH_INTERACTIVE_WEIGHT
+and bulk downloads (download=1) BANDWIDTH_BULK_WEIGHT, so under contention
+a player keeps a larger slice while a 16-connection download manager
+shares what is left. A flow counts as active only while it is pulling
+data; paused players drop out of the split and bulk transfers soak up the
+spare capacity.
+"""
+import math
+import time
+from typing import Dict, Set
+from Adarsh.utils.token_bucket import TokenBucket
+
+
+# A flow that has not asked for data for this long no longer claims a share
+_ACTIVE_WINDOW = 2.0
+
+
+class Flow:
+    __slots__ = ("key", "client", "weight", "bucket", "last_active")
+
+    def __init__(self, key: str, client: int, weight: float):
+        self.key = key
+        self.client = client
+        self.weight = weight
+        self.bucket = TokenBucket(math.inf)
+        self.last_active = time.monotonic()
+
+
+class BandwidthShaper:
+    def __init__(self, per_connection: float = 0, per_ip: float = 0, per_client: float = 0,
+                 interactive_weight: float = 4, bulk_weight: float = 1):
+        """Rates are bytes per second; 0 disables that level."""
+        self.per_connection = per_connection or math.inf
+        self.per_ip = per_ip or math.inf
+        self.per_client = per_client or math.inf
+        self.interactive_weight = interactive_weight
+        self.bulk_weight = bulk_weight
+        self._by_key: Dict[str, Set[Flow]] = {}
+        self._by_client: Dict[int, Set[Flow]] = {}
+
+    def open(self, key: str, client: int, interactive: bool) -> Flow:
+        flow = Flow(key, client, self.interactive_weight if interactive else self.bulk_weight)
+        self._by_key.setdefault(key, set()).add(flow)
+        self._by_client.setdefault(client, set()).add(flow)
+        return flow
+
+    def close(self, flow: Flow):
+        for index, group in ((self._by_key, flow.key), (self._by_client, flow.client)):
+            flows = index.get(group)
+            if flows is not None:
+                flows.discard(flow)
+                if not flows:
+                    del index[group]
+
+    @staticmethod
+    def _share(flow: Flow, flows: Set[Flow], rate: float, now: float) -> float:
+        if rate == math.inf:
+            return math.inf
+        weights = sum(f.weight for f in flows if f is flow or now - f.last_active < _ACTIVE_WINDOW)
+        return rate * flow.weight / weights
+
+    def rate_for(self, flow: Flow) -> float:
+        now = time.monotonic()
+        return min(
+            self.per_connection,
+            self._share(flow, self._by_key.get(flow.key, {flow}), self.per_ip, now),
+            self._share(flow, self._by_client.get(flow.client, {flow}), self.per_client, now),
+        )
+
+    async def consume(self, flow: Flow, nbytes: int):
+        """Wait until flow may send nbytes more."""
+        flow.last_active = time.monotonic()
+        rate = self.rate_for(flow)
+        if rate == math.inf:
+            return
+        bucket = flow.bucket
+        if bucket.rate != rate:
+            # Room for one chunk at a time so a flow cannot bank a burst
+            bucket.set_rate(rate, max(nbytes, rate * 0.25))
+        await bucket.acquire(min(nbytes, bucket.capacity))
+        flow.last_active = time.monotonic()
@@ -0,0 +1,278 @@
+"""
+Server-side admission queue for download-link generation.
+
+Every /api/download request copies a message into BIN_CHANNEL, which costs
+Telegram API calls on the bot clients. Instead of letting browsers hammer
+the endpoint and bounce off 429s, the prepare page asks for a ticket and
+listens on an event stream while the ticket waits its turn:
+
+- tickets are grouped per client key (IP, /64 for IPv6) and served
+  round-robin across keys, so one visitor opening twenty tabs cannot push
+  everyone else back;
+- at most `capacity` jobs run at once, sized for the main bot, which does
+  every copy;
+- a job that comes back FloodWaited (HTTP 429) is put back at the head of
+  its line and dispatch pauses instead of failing the visitor;
+- waiting tickets nobody is listening to are dropped, finished tickets are
+  kept briefly so a reconnecting page still receives its result.
+
+The queue is per process; each web dyno admits against its own main bot.
+"""
+import time
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+log = logging.getLogger("stream.queue")
+
+
+class Ticket:
+    __slots__ = ("id", "key", "payload", "state", "result", "created", "last_seen",
+                 "watchers", "requeues")
+
+    def __init__(self, key: str, payload: dict):
+        self.id = secrets.token_urlsafe(12)
+        self.key = key
+        self.payload = payload
+        self.state = "waiting"          # waiting -> running -> done | failed
+        self.result: Optional[Tuple[int, dict]] = None
+        self.created = time.monotonic()
+        self.last_seen = self.created
+        self.watchers = 0
+        self.requeues = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+
+class DownloadQueue:
+    def __init__(self, job: Callable[[dict], Awaitable[Tuple[int, dict]]],
+                 capacity: Callable[[], int], per_key: int = 3,
+                 abandon_after: float = 30, keep_finished: float = 300,
+                 max_requeues: int = 3):
+        """
+        Args:
+            job: coroutine run for each admitted ticket with its payload;
+                returns (http_status, response_data)
+            capacity: callable returning how many jobs may run concurrently
+            per_key: maximum unfinished tickets per client key
+            abandon_after: seconds a waiting ticket may go unwatched
+            keep_finished: seconds a finished ticket's result stays available
+            max_requeues: how often a FloodWaited job is retried before failing
+        """
+        self.job = job
+        self.capacity = capacity
+        self.per_key = per_key
+        self.abandon_after = abandon_after
+        self.keep_finished = keep_finished
+        self.max_requeues = max_requeues
+        self.tickets: Dict[str, Ticket] = {}
+        self.lines: "OrderedDict[str, deque]" = OrderedDict()   # key -> waiting ticket ids
+        self.running = 0
+        self._paused_until = 0.0
+        self._resume_handle = None
+        self.version = 0                # bumped on every change, for watchers
+        self._changed = asyncio.Condition()
+        self._tasks = set()
+        self._sweeper = None
+
+    # ── Submission ───────────────────────────────────────────────────────
+
+    def submit(self, key: str, payload: dict) -> Optional[Ticket]:
+        """Queue a job for key. Returns None when key already has per_key
+        unfinished tickets."""
+        pending = sum(1 for t in self.tickets.values() if t.key == key and not t.finished)
+        if pending >= self.per_key:
+            return None
+        ticket = Ticket(key, payload)
+        self.tickets[ticket.id] = ticket
+        self.lines.setdefault(key, deque()).append(ticket.id)
+        self._dispatch()
+        self._notify()
+        return ticket
+
+    def get(self, ticket_id: str) -> Optional[Ticket]:
+        return self.tickets.get(ticket_id)
+
+    def cancel(self, ticket_id: str) -> bool:
+        ticket = self.tickets.get(ticket_id)
+        if ticket is None or ticket.state != "waiting":
+            return False
+        self._drop(ticket)
+        self._notify()
+        return True
+
+    # ── Positions ────────────────────────────────────────────────────────
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(line) for line in self.lines.values())
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the round-robin order (0 once admitted)."""
+        if ticket.state != "waiting":
+            return 0
+        line = self.lines.get(ticket.key)
+        if not line:
+            return 0
+        index = line.index(ticket.id)
+        ahead = index
+        before_us = True
+        for key, other in self.lines.items():
+            if key == ticket.key:
+                before_us = False
+                continue
+            # Keys earlier in the rotation get one extra turn before ours
+            ahead += min(len(other), index + (1 if before_us else 0))
+        return ahead + 1
+
+    def status(self, ticket: Ticket) -> dict:
+        return {
+            "state": ticket.state,
+            "position": self.position(ticket),
+            "waiting": self.waiting,
+            "running": self.running,
+        }
+
+    async def wait_for_change(self, seen_version: int, timeout: float) -> bool:
+        """Block until the queue has moved past seen_version or timeout elapses."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.version != seen_version), timeout
+                )
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def watch(self, ticket: Ticket):
+        ticket.watchers += 1
+        ticket.last_seen = time.monotonic()
+
+    def unwatch(self, ticket: Ticket):
+        ticket.watchers = max(0, ticket.watchers - 1)
+        ticket.last_seen = time.monotonic()
+
+    # ── Dispatch ─────────────────────────────────────────────────────────
+
+    def _notify(self):
+        self.version += 1
+
+        async def _wake():
+            async with self._changed:
+                self._changed.notify_all()
+        task = asyncio.ensure_future(_wake())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _drop(self, ticket: Ticket):
+        self.tickets.pop(ticket.id, None)
+        line = self.lines.get(ticket.key)
+        if line is not None:
+            try:
+                line.remove(ticket.id)
+            except ValueError:
+                pass
+            if not line:
+                del self.lines[ticket.key]
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        while self.lines:
+            key, line = next(iter(self.lines.items()))
+            ticket_id = line.popleft()
+            # Rotate: this key goes to the back of the round-robin order
+            del self.lines[key]
+            if line:
+                self.lines[key] = line
+            ticket = self.tickets.get(ticket_id)
+            if ticket is not None:
+                return ticket
+        return None
+
+    def _dispatch(self):
+        now = time.monotonic()
+        if now < self._paused_until:
+            return
+        while self.running < max(1, self.capacity()):
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            ticket.state = "running"
+            self.running += 1
+            task = asyncio.ensure_future(self._run(ticket))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+        self._resume_handle = asyncio.get_running_loop().call_later(seconds, self._resume)
+
+    def _resume(self):
+        self._resume_handle = None
+        self._dispatch()
+        # Tickets admitted after the pause have moved; tell their watchers
+        self._notify()
+
+    async def _run(self, ticket: Ticket):
+        try:
+            status, data = await self.job(ticket.payload)
+        except Exception as e:
+            log.error(f"Download queue job failed: {e}", exc_info=True)
+            status, data = 500, {"success": False, "error": "Server error. Please try again later."}
+        self.running -= 1
+
+        if status == 429 and ticket.requeues < self.max_requeues and ticket.id in self.tickets:
+            # Telegram pushed back: keep the visitor's place and slow down
+            ticket.requeues += 1
+            ticket.state = "waiting"
+            line = self.lines.pop(ticket.key, deque())
+            line.appendleft(ticket.id)
+            self.lines[ticket.key] = line
+            self.lines.move_to_end(ticket.key, last=False)
+            self._pause(float(data.get("retry_after", 5)))
+        else:
+            ticket.result = (status, data)
+            ticket.state = "done" if status == 200 else "failed"
+            ticket.last_seen = time.monotonic()
+        self._dispatch()
+        self._notify()
+
+    # ── Housekeeping ─────────────────────────────────────────────────────
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        stale = [
+            t for t in self.tickets.values()
+            if (t.finished and now - t.last_seen > self.keep_finished)
+            or (t.state == "waiting" and not t.watchers and now - t.last_seen > self.abandon_after)
+        ]
+        for ticket in stale:
+            self._drop(ticket)
+        if stale:
+            self._notify()
+        return len(stale)
+
+    async def _sweep_forever(self, interval: float = 10):
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                log.debug(f"Dropped {removed} abandoned or expired queue tickets")
+
+    def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+            self._resume_handle = None
@@ -0,0 +1,218 @@
+"""
+Storage for rate-limit and stream-concurrency counters.
+
+LocalLimiterBackend keeps everything in this process. MongoLimiterBackend
+keeps it in the shared Mongo database, so the web and webx apps (and any
+extra dynos) make admission decisions against the same numbers.
+
+Both expose:
+
+    await take(key, rate, burst)      -> (allowed, retry_after_seconds)
+    await acquire(key, cap)           -> allowed
+    await release(key)
+    await count(key)                  -> current holders of key
+    sweep()                           -> number of idle keys dropped
+"""
+import time
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+from pymongo.errors import DuplicateKeyError
+from Adarsh.utils.token_bucket import TokenBucket
+
+
+log = logging.getLogger("stream.limiter")
+
+
+class LocalLimiterBackend:
+    def __init__(self, idle_ttl: float = 600):
+        self.idle_ttl = idle_ttl
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.slots: Dict[str, int] = {}
+
+    async def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate, burst)
+        wait = bucket.try_consume()
+        return not wait, wait
+
+    async def acquire(self, key: str, cap: int) -> bool:
+        active = self.slots.get(key, 0)
+        if active >= cap:
+            return False
+        self.slots[key] = active + 1
+        return True
+
+    async def release(self, key: str):
+        active = self.slots.get(key, 0) - 1
+        if active > 0:
+            self.slots[key] = active
+        else:
+            self.slots.pop(key, None)
+
+    async def count(self, key: str) -> int:
+        return self.slots.get(key, 0)
+
+    def sweep(self) -> int:
+        stale = [
+            key for key, bucket in self.buckets.items()
+            if bucket.idle_for() > self.idle_ttl and bucket.full
+        ]
+        for key in stale:
+            del self.buckets[key]
+        return len(stale)
+
+
+class MongoLimiterBackend:
+    """Counters in the `limits` collection, updated with single-document
+    conditional writes so concurrent instances cannot overshoot a limit.
+
+    Token buckets are stored as GCRA state (one "theoretical arrival time"
+    per key), which is equivalent to a token bucket but needs a single
+    field. A concurrency slot is a lease {id, exp} in the key's `leases`
+    array. Each instance refreshes the leases it holds every lease_ttl / 3
+    seconds, so the leases of a crashed instance lapse after lease_ttl even
+    while other holders keep the key busy; expired leases are pulled before
+    every acquire. A TTL index drops documents nobody has touched since.
+
+    Errors fail open: if Mongo is unreachable, requests are admitted.
+    """
+
+    def __init__(self, db, lease_ttl: float = 120, bucket_ttl: float = 600):
+        self.col = db.db.limits
+        self.lease_ttl = lease_ttl
+        self.bucket_ttl = bucket_ttl
+        self._indexes_ready = False
+        self._instance = secrets.token_hex(4)
+        self._next_lease = 0
+        self._held: Dict[str, List[str]] = {}      # key -> lease ids held by this instance
+        self._refresher = None
+
+    async def _ensure_indexes(self):
+        if not self._indexes_ready:
+            await self.col.create_index('expireAt', expireAfterSeconds=0)
+            self._indexes_ready = True
+
+    @staticmethod
+    def _expire_at(seconds: float):
+        return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+    async def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        try:
+            await self._ensure_indexes()
+            _id = f"bucket:{key}"
+            now = time.time()
+            interval = 1.0 / rate
+            tolerance = (burst - 1) * interval
+            expire = {'expireAt': self._expire_at(self.bucket_ttl + burst * interval)}
+            for _ in range(2):
+                # Bucket full (TAT in the past): restart from now
+                res = await self.col.update_one(
+                    {'_id': _id, 'tat': {'$lte': now}},
+                    {'$set': {'tat': now + interval, **expire}}
+                )
+                if res.matched_count:
+                    return True, 0.0
+                # Tokens left: push TAT forward by one interval
+                res = await self.col.update_one(
+                    {'_id': _id, 'tat': {'$gt': now, '$lte': now + tolerance}},
+                    {'$inc': {'tat': interval}, '$set': expire}
+                )
+                if res.matched_count:
+                    return True, 0.0
+                doc = await self.col.find_one({'_id': _id})
+                if doc is None:
+                    try:
+                        await self.col.insert_one({'_id': _id, 'tat': now + interval, **expire})
+                        return True, 0.0
+                    except DuplicateKeyError:
+                        continue  # another instance created it first
+                return False, max(0.0, doc['tat'] - tolerance - now)
+            return False, interval
+        except Exception as exc:
+            log.warning(f"Shared limiter unavailable, admitting request: {exc}")
+            return True, 0.0
+
+    async def acquire(self, key: str, cap: int) -> bool:
+        if cap <= 0:
+            return False
+        try:
+            await self._ensure_indexes()
+            self._start_refresher()
+            _id = f"slots:{key}"
+            now = time.time()
+            await self.col.update_one({'_id': _id}, {'$pull': {'leases': {'exp': {'$lte': now}}}})
+            self._next_lease += 1
+            lease = f"{self._instance}:{self._next_lease}"
+            # The filter only matches while fewer than cap leases are held;
+            # at cap the upsert collides with the existing _id and is
+            # rejected atomically.
+            await self.col.update_one(
+                {'_id': _id, f'leases.{cap - 1}': {'$exists': False}},
+                {'$push': {'leases': {'id': lease, 'exp': now + self.lease_ttl}},
+                 '$max': {'expireAt': self._expire_at(self.lease_ttl)}},
+                upsert=True
+            )
+            self._held.setdefault(key, []).append(lease)
+            return True
+        except DuplicateKeyError:
+            return False
+        except Exception as exc:
+            log.warning(f"Shared limiter unavailable, admitting stream: {exc}")
+            return True
+
+    async def release(self, key: str):
+        # Leases of one key are interchangeable; give back any held here
+        held = self._held.get(key)
+        if not held:
+            return      # admitted while Mongo was unreachable
+        lease = held.pop()
+        if not held:
+            del self._held[key]
+        try:
+            await self.col.update_one({'_id': f"slots:{key}"}, {'$pull': {'leases': {'id': lease}}})
+        except Exception as exc:
+            log.warning(f"Shared limiter release failed for {key}: {exc}")
+
+    async def count(self, key: str) -> int:
+        try:
+            doc = await self.col.find_one({'_id': f"slots:{key}"})
+        except Exception:
+            return 0
+        now = time.time()
+        return sum(1 for lease in (doc or {}).get('leases', []) if lease['exp'] > now)
+
+    def _start_refresher(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_forever())
+
+    async def _refresh_forever(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            for key, leases in list(self._held.items()):
+                try:
+                    await self.col.update_one(
+                        {'_id': f"slots:{key}"},
+                        {'$set': {'leases.$[lease].exp': time.time() + self.lease_ttl},
+                         '$max': {'expireAt': self._expire_at(self.lease_ttl)}},
+                        array_filters=[{'lease.id': {'$in': list(leases)}}]
+                    )
+                except Exception as exc:
+                    log.warning(f"Shared limiter lease refresh failed for {key}: {exc}")
+
+    def sweep(self) -> int:
+        # Expiry is handled by the TTL index
+        return 0
+
+
+def get_limiter_backend(kind: str, db=None):
+    if kind == 'mongo':
+        if db is not None and db.enabled:
+            return MongoLimiterBackend(db)
+        log.warning("LIMITER_BACKEND=mongo needs DATABASE_URL; falling back to local limits")
+    elif kind != 'local':
+        log.warning(f"Unknown LIMITER_BACKEND {kind!r}; using local limits")
+    return LocalLimiterBackend()
@@ -0,0 +1,122 @@
+"""
+Loopback-only HTTP range reader for Telegram media.
+
+Tools that understand HTTP (ffmpeg, ffprobe) can read a Telegram file
+without it ever being downloaded in full:
+
+    url = register(client, message)
+    try:
+        run ffmpeg -ss 10 -i url ...
+    finally:
+        unregister(url)
+
+The returned URL points at /internal/range/{nonce} on this process's own
+web server. Each request is answered from ByteStreamer with only the byte
+ranges asked for, so ffmpeg's probe of the container header plus its seek
+to the wanted frame cost a few MB instead of the whole video. Nonces are
+random, short-lived, and only served to loopback peers.
+"""
+import math
+import time
+import secrets
+import logging
+from typing import Dict
+from aiohttp import web
+from Adarsh.vars import Var
+from Adarsh.utils.custom_dl import ByteStreamer
+from Adarsh.utils.file_properties import get_media_from_message, parse_file_id
+
+
+log = logging.getLogger("stream.range_reader")
+
+routes = web.RouteTableDef()
+
+_LOOPBACK = {"127.0.0.1", "::1"}
+_CHUNK = 1024 * 1024
+
+# nonce -> (client, FileId, size, mime_type, expires_at)
+_sources: Dict[str, tuple] = {}
+_streamers: Dict[object, ByteStreamer] = {}
+
+
+def _local_host() -> str:
+    bind = Var.BIND_ADDRESS
+    return "127.0.0.1" if bind in ("", "0.0.0.0", "::") or Var.ON_HEROKU else bind
+
+
+async def register(client, message, ttl: float = 600) -> str:
+    """Expose message's media on a private loopback URL for ttl seconds."""
+    media = get_media_from_message(message)
+    if not media:
+        raise ValueError("No media found in message")
+    file_id = await parse_file_id(message)
+    now = time.monotonic()
+    for nonce in [n for n, source in _sources.items() if source[4] < now]:
+        del _sources[nonce]
+    nonce = secrets.token_urlsafe(16)
+    _sources[nonce] = (client, file_id, getattr(media, 'file_size', 0), getattr(media, 'mime_type', None), now + ttl)
+    return f"http://{_local_host()}:{Var.PORT}/internal/range/{nonce}"
+
+
+def unregister(url: str):
+    _sources.pop(url.rsplit("/", 1)[-1], None)
+
+
+def _streamer(client) -> ByteStreamer:
+    if client not in _streamers:
+        _streamers[client] = ByteStreamer(client)
+    return _streamers[client]
+
+
+@routes.get(r"/internal/range/{nonce}", allow_head=True)
+async def range_handler(request: web.Request):
+    if request.remote not in _LOOPBACK | {_local_host()}:
+        raise web.HTTPNotFound()
+    source = _sources.get(request.match_info["nonce"])
+    if source is None or source[4] < time.monotonic():
+        raise web.HTTPNotFound()
+    client, file_id, file_size, mime_type, _ = source
+
+    if request.http_range.start is not None or request.http_range.stop is not None:
+        from_bytes = request.http_range.start or 0
+        until_bytes = (request.http_range.stop or file_size) - 1
+        status = 206
+    else:
+        from_bytes, until_bytes, status = 0, file_size - 1, 200
+    until_bytes = min(until_bytes, file_size - 1)
+    if from_bytes < 0 or from_bytes > until_bytes:
+        return web.Response(status=416, headers={"Content-Range": f"bytes */{file_size}"})
+
+    offset = from_bytes - (from_bytes % _CHUNK)
+    first_part_cut = from_bytes - offset
+    last_part_cut = until_bytes % _CHUNK + 1
+    part_count = math.ceil((until_bytes + 1) / _CHUNK) - math.floor(offset / _CHUNK)
+
+    headers = {
+        "Content-Type": mime_type or "application/octet-stream",
+        "Content-Length": str(until_bytes - from_bytes + 1),
+        "Accept-Ranges": "bytes",
+    }
+    if status == 206:
+        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+
+    response = web.StreamResponse(status=status, headers=headers)
+    await response.prepare(request)
+    if request.method == "HEAD":
+        await response.write_eof()
+        return response
+
+    body = _streamer(client).yield_file(file_id, 0, offset, first_part_cut, last_part_cut, part_count, _CHUNK)
+    sent = 0
+    try:
+        async for chunk in body:
+            await response.write(chunk)
+            sent += len(chunk)
+    except ConnectionResetError:
+        # ffmpeg hangs up as soon as it has the frame it wanted
+        return response
+    finally:
+        await body.aclose()
+        log.debug(f"Range {from_bytes}-{until_bytes} of {file_size}: sent {sent} bytes")
+    await response.write_eof()
+    return response
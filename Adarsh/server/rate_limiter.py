@@ -1,66 +1,97 @@
 """
-Rate limiter for download requests to prevent Telegram timeout errors
+Rate limiting for the web server.
+
+Two independent limits are enforced per client key (the IP address, or the
+/64 network for IPv6 so one host cannot rotate through its prefix):
+
+- link generation draws from an O(1) token bucket; /api/download and
+  download-queue tickets (/api/queue) each have their own bucket;
+- media streams hold a concurrency slot for the whole lifetime of the
+  media_streamer response and give it back when the transfer ends.
+
+Counters live in a pluggable backend (LIMITER_BACKEND): 'local' keeps them
+in this process, 'mongo' shares them through DATABASE_URL so the web and
+webx deployments enforce one global allowance per client.
+
+Idle local keys are swept periodically so memory stays flat under scans.
 """
-import time
-from collections import defaultdict
-from typing import Dict, Tuple
+import asyncio
+import ipaddress
+import logging
+from typing import Tuple
+from Adarsh.vars import Var
+from Adarsh.utils.database import Database
+from Adarsh.server.limiter_backend import get_limiter_backend
+
+
+log = logging.getLogger("stream.limiter")
+
+
+def client_key(ip: str) -> str:
+    """Collapse an address to the unit we rate limit: /32 for IPv4, /64 for IPv6."""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip or "unknown"
+    if addr.version == 6:
+        if addr.ipv4_mapped:
+            return str(addr.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{addr}/64", strict=False))
+    return str(addr)
 
 
 class RateLimiter:
-    def __init__(self):
-        # Track requests per IP: {ip: [(timestamp, count), ...]}
-        self.ip_requests: Dict[str, list] = defaultdict(list)
-        # Maximum requests per IP in time window
-        self.max_requests_per_window = 2  # Max 2 concurrent downloads per IP
-        self.time_window = 60  # 60 seconds window
-        # Cooldown between requests from same IP
-        self.min_delay_between_requests = 5  # 5 seconds between requests
-        
-    def clean_old_entries(self, ip: str):
-        """Remove entries older than time window"""
-        current_time = time.time()
-        if ip in self.ip_requests:
-            self.ip_requests[ip] = [
-                (timestamp, count) for timestamp, count in self.ip_requests[ip]
-                if current_time - timestamp < self.time_window
-            ]
-            
-    def can_proceed(self, ip: str) -> Tuple[bool, str]:
+    def __init__(self, backend):
+        self.backend = backend
+        # Link generation: LINK_BURST requests at once, refilled at LINK_RATE per minute
+        self.link_rate = Var.LINK_RATE_PER_MINUTE / 60.0
+        self.link_burst = Var.LINK_BURST
+        # Concurrent media streams per client key
+        self.max_streams = Var.STREAMS_PER_IP
+        self.sweep_interval = 60
+        self._sweeper = None
+
+    async def _take(self, bucket: str, ip: str) -> Tuple[bool, str, int]:
+        allowed, wait = await self.backend.take(f"{bucket}:{client_key(ip)}", self.link_rate, self.link_burst)
+        if allowed:
+            return True, "OK", 0
+        retry_after = max(1, int(wait + 0.999))
+        return False, f"Please wait {retry_after} seconds before next request", retry_after
+
+    async def can_proceed(self, ip: str) -> Tuple[bool, str, int]:
         """
-        Check if request can proceed
-        Returns: (can_proceed: bool, message: str)
+        Check (and consume) a link-generation token.
+        Returns: (can_proceed: bool, message: str, retry_after: int seconds)
         """
-        current_time = time.time()
-        self.clean_old_entries(ip)
-        
-        # Check if there's a recent request from this IP
-        if ip in self.ip_requests and self.ip_requests[ip]:
-            last_request_time, _ = self.ip_requests[ip][-1]
-            time_since_last = current_time - last_request_time
-            
-            # Enforce minimum delay between requests
-            if time_since_last < self.min_delay_between_requests:
-                wait_time = int(self.min_delay_between_requests - time_since_last)
-                return False, f"Please wait {wait_time} seconds before next request"
-        
-        # Count active requests in current window
-        active_count = len(self.ip_requests.get(ip, []))
-        
-        if active_count >= self.max_requests_per_window:
-            return False, "Too many active downloads. Please wait for current downloads to finish."
-        
-        return True, "OK"
-    
-    def add_request(self, ip: str):
-        """Record a new request"""
-        current_time = time.time()
-        self.ip_requests[ip].append((current_time, 1))
-        
-    def remove_request(self, ip: str):
-        """Remove completed request"""
-        if ip in self.ip_requests and self.ip_requests[ip]:
-            self.ip_requests[ip].pop()
-            
+        return await self._take("link", ip)
+
+    async def can_enqueue(self, ip: str) -> Tuple[bool, str, int]:
+        """Like can_proceed(), for taking a download-queue ticket."""
+        return await self._take("queue", ip)
+
+    async def acquire_stream(self, ip: str) -> bool:
+        """Take a concurrent-stream slot for ip. Pair with release_stream()."""
+        return await self.backend.acquire(f"stream:{client_key(ip)}", self.max_streams)
+
+    async def release_stream(self, ip: str):
+        await self.backend.release(f"stream:{client_key(ip)}")
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.backend.sweep()
+            if removed:
+                log.debug(f"Swept {removed} idle rate-limit keys")
+
+    def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
 
 # Global rate limiter instance
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(get_limiter_backend(Var.LIMITER_BACKEND, Database(Var.DATABASE_URL, Var.name)))
@@ -0,0 +1,120 @@
+"""
+Registry of in-flight media transfers.
+
+The registry owns the work_loads accounting: a transfer is counted from the
+moment _serve_media starts sending its body until the handler finishes,
+whether the body generator was fully iterated, abandoned, or never started.
+
+Each transfer records bytes sent and the time of its last progress. The
+reaper cancels handlers that made no progress for `stall_timeout` seconds
+(a client that stopped reading, or a GetFile that never returns), which
+frees their admission and per-IP slots through the normal finally blocks.
+"""
+import time
+import asyncio
+import logging
+import itertools
+from typing import Dict, Optional
+
+
+log = logging.getLogger("stream.registry")
+
+
+class Transfer:
+    __slots__ = ("id", "message_id", "index", "ip", "kind", "length", "bytes_sent",
+                 "started", "last_progress", "task", "closed")
+
+    def __init__(self, id: int, message_id: int, index: int, ip: str, kind: str, length: int):
+        self.id = id
+        self.message_id = message_id
+        self.index = index
+        self.ip = ip
+        self.kind = kind
+        self.length = length
+        self.bytes_sent = 0
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.task: Optional[asyncio.Task] = asyncio.current_task()
+        self.closed = False
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "id": self.id,
+            "message_id": self.message_id,
+            "client": self.index,
+            "ip": self.ip,
+            "kind": self.kind,
+            "length": self.length,
+            "bytes_sent": self.bytes_sent,
+            "age": round(now - self.started, 1),
+            "idle": round(now - self.last_progress, 1),
+        }
+
+
+class StreamRegistry:
+    def __init__(self, work_loads: Dict[int, int], stall_timeout: float = 60, interval: float = 15):
+        self.work_loads = work_loads
+        self.stall_timeout = stall_timeout
+        self.interval = interval
+        self.transfers: Dict[int, Transfer] = {}
+        self.reaped = 0
+        self._ids = itertools.count(1)
+        self._reaper = None
+
+    def open(self, message_id: int, index: int, ip: str, kind: str, length: int) -> Transfer:
+        transfer = Transfer(next(self._ids), message_id, index, ip, kind, length)
+        self.transfers[transfer.id] = transfer
+        self.work_loads[index] = self.work_loads.get(index, 0) + 1
+        return transfer
+
+    @staticmethod
+    def progress(transfer: Transfer, nbytes: int):
+        transfer.bytes_sent += nbytes
+        transfer.last_progress = time.monotonic()
+
+    def close(self, transfer: Transfer):
+        if transfer.closed:
+            return
+        transfer.closed = True
+        self.transfers.pop(transfer.id, None)
+        self.work_loads[transfer.index] = max(0, self.work_loads.get(transfer.index, 0) - 1)
+
+    def reap(self) -> int:
+        """Cancel transfers that made no progress within stall_timeout."""
+        now = time.monotonic()
+        stalled = [t for t in self.transfers.values() if now - t.last_progress > self.stall_timeout]
+        for transfer in stalled:
+            log.warning(
+                f"Reaping stalled transfer msg={transfer.message_id} client={transfer.index} "
+                f"ip={transfer.ip} sent={transfer.bytes_sent} idle={now - transfer.last_progress:.0f}s"
+            )
+            if transfer.task is not None and not transfer.task.done():
+                transfer.task.cancel()
+            # Count it gone now; the handler's own close() is then a no-op
+            self.close(transfer)
+        self.reaped += len(stalled)
+        return len(stalled)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "active": len(self.transfers),
+            "reaped": self.reaped,
+            "stall_timeout": self.stall_timeout,
+            "work_loads": dict(self.work_loads),
+            "transfers": [t.as_dict(now) for t in self.transfers.values()],
+        }
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.reap()
+
+    def start(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
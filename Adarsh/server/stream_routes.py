@@ -1,11 +1,11 @@
 import re
+import json
 import time
 import math
 import logging
 import secrets
 import mimetypes
 import asyncio
-import aiohttp as aiohttp_client
 from datetime import datetime, timezone
 from aiohttp import web
 from aiohttp.http_exceptions import BadStatusLine
@@ -22,7 +22,12 @@ from Adarsh.utils.database import Database
 from Adarsh.utils.file_properties import get_name, get_hash
 from Adarsh.utils.human_readable import humanbytes
 from Adarsh.vars import Var
-from Adarsh.server.rate_limiter import rate_limiter
+from Adarsh.server.rate_limiter import rate_limiter, client_key
+from Adarsh.server.download_queue import DownloadQueue
+from Adarsh.server.admission import AdmissionController
+from Adarsh.server.bandwidth import BandwidthShaper
+from Adarsh.server.stream_registry import StreamRegistry
+from Adarsh.utils.github_client import github
 
 # Dedicated logger for stream route diagnostics
 stream_log = logging.getLogger("stream.routes")
@@ -32,6 +37,12 @@ routes = web.RouteTableDef()
 # Initialize database conditionally - use a global instance
 db = Database(Var.DATABASE_URL, Var.name)
 
+
+def _client_ip(request: web.Request) -> str:
+    """First hop of X-Forwarded-For (set by the Heroku router), else the peer address."""
+    return request.headers.get('X-Forwarded-For', request.remote or '').split(',')[0].strip()
+
+
 async def render_prepare_page(temp_data):
     """Render the intermediate page template"""
     try:
@@ -107,6 +118,11 @@ async def root_route_handler(_):
                     sorted(work_loads.items(), key=lambda x: x[1], reverse=True)
                 )
             ),
+            "streams": admission.stats(),
+            "download_queue": {
+                "waiting": download_queue.waiting,
+                "running": download_queue.running,
+            },
             "version": __version__,
         }
     )
@@ -244,141 +260,281 @@ async def generate_stream_handler(request: web.Request):
         )
 
 
+def _base_url(request: web.Request) -> str:
+    """Public base URL of this request, honouring X-Forwarded-Proto behind Heroku's router."""
+    forwarded_proto = request.headers.get('X-Forwarded-Proto', '').lower()
+    if forwarded_proto in ('https', 'http'):
+        scheme = forwarded_proto
+    elif Var.HAS_SSL:
+        scheme = 'https'
+    else:
+        scheme = request.scheme if request.scheme else 'http'
+    return f"{scheme}://{request.host}/"
+
+
+async def _build_download_link(token: str, base_url: str):
+    """Copy the file behind token to BIN_CHANNEL and build its download URL.
+
+    Returns:
+        (http_status, response_data)
+    """
+    serve_domain = Var.SERVE_DOMAIN if Var.SERVE_DOMAIN in ('web', 'webx') else None
+
+    temp_data = await db.get_temp_file(token, serve_domain=serve_domain)
+    if not temp_data:
+        return 404, {"success": False, "error": "Link expired or not found"}
+
+    # Get the original message from Telegram
+    client = StreamBot  # Use the main bot client
+    original_msg = await client.get_messages(temp_data['from_chat_id'], temp_data['message_id'])
+
+    if not original_msg:
+        return 404, {"success": False, "error": "Original message not found"}
+
+    # Copy message to BIN_CHANNEL with retry logic for FloodWait
+    max_retries = 3
+    log_msg = None
+    for attempt in range(max_retries):
+        try:
+            log_msg = await original_msg.copy(
+                chat_id=Var.BIN_CHANNEL,
+                caption=temp_data['caption'][:1024],
+                parse_mode=ParseMode.HTML
+            )
+            break
+        except FloodWait as e:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(e.value)
+            else:
+                return 429, {
+                    "success": False,
+                    "error": "Server is busy. Please try again in a few seconds.",
+                    "retry_after": int(e.value) or 5,
+                }
+        except Exception as copy_error:
+            logging.error(f"Error copying message (attempt {attempt + 1}): {copy_error}")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(2)
+            else:
+                return 500, {"success": False, "error": "Failed to process file. Please try again."}
+
+    if not log_msg:
+        return 500, {"success": False, "error": "Failed to process file after retries"}
+
+    # Generate download URL with download=1 parameter (direct file link, not /watch/)
+    file_name = get_name(log_msg) or temp_data['file_name'] or "NEXTPULSE"
+    if isinstance(file_name, bytes):
+        file_name = file_name.decode('utf-8', errors='ignore')
+    file_name = str(file_name)
+    file_hash = get_hash(log_msg)
+
+    download_link = f"{base_url}{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}&download=1"
+
+    # Keep temporary data for permanent links (don't delete)
+    # await db.delete_temp_file(token)  # Commented out to make links permanent
+
+    # Prepare response with download URL
+    response_data = {
+        "success": True,
+        "download_url": download_link,
+        "file_name": file_name
+    }
+
+    # Include thumbnail URL if available
+    if temp_data.get('thumbnail_url'):
+        response_data['thumbnail_url'] = temp_data['thumbnail_url']
+
+    return 200, response_data
+
+
+async def _queued_download(payload: dict):
+    return await _build_download_link(payload['token'], payload['base_url'])
+
+
+# Caps on concurrent streams per bot client and per process (see admission.py)
+admission = AdmissionController(
+    multi_clients,
+    rate_limiter.backend,
+    per_client=Var.STREAM_MAX_PER_CLIENT,
+    per_process=Var.STREAM_MAX_PER_PROCESS,
+    reserve=Var.STREAM_PRIORITY_RESERVE,
+)
+
+# In-flight transfers; owns work_loads and reaps stalled streams (see stream_registry.py)
+registry = StreamRegistry(work_loads, stall_timeout=Var.STREAM_STALL_TIMEOUT)
+
+# Optional weighted bandwidth sharing between playback and bulk downloads (see bandwidth.py)
+shaper = BandwidthShaper(
+    per_connection=Var.BANDWIDTH_PER_CONNECTION_KBPS * 1024,
+    per_ip=Var.BANDWIDTH_PER_IP_KBPS * 1024,
+    per_client=Var.BANDWIDTH_PER_CLIENT_KBPS * 1024,
+    interactive_weight=Var.BANDWIDTH_INTERACTIVE_WEIGHT,
+    bulk_weight=Var.BANDWIDTH_BULK_WEIGHT,
+) if Var.BANDWIDTH_SHAPING else None
+
+# Fair, capacity-bound admission for download-link generation (see download_queue.py)
+download_queue = DownloadQueue(
+    job=_queued_download,
+    # _build_download_link copies with StreamBot only, so extra clients add no capacity
+    capacity=lambda: Var.DOWNLOAD_QUEUE_PER_CLIENT,
+    per_key=Var.DOWNLOAD_QUEUE_PER_IP,
+)
+
+
 @routes.get(r"/api/download/{token}")
 async def generate_download_handler(request: web.Request):
     """API endpoint to generate download link by copying to BIN_CHANNEL"""
     try:
         # Get client IP for rate limiting
-        client_ip = request.headers.get('X-Forwarded-For', request.remote).split(',')[0].strip()
+        client_ip = _client_ip(request)
         
-        # Check rate limit
-        can_proceed, message = rate_limiter.can_proceed(client_ip)
+        # Check rate limit (consumes a token when allowed)
+        can_proceed, message, retry_after = await rate_limiter.can_proceed(client_ip)
         if not can_proceed:
             return web.json_response(
-                {"success": False, "error": message}, 
+                {"success": False, "error": message, "retry_after": retry_after}, 
                 status=429,
+                headers={"Retry-After": str(retry_after)},
                 content_type='application/json'
             )
         
-        # Add request to rate limiter
-        rate_limiter.add_request(client_ip)
-        
-        token = request.match_info["token"]
-        
-        serve_domain = Var.SERVE_DOMAIN if Var.SERVE_DOMAIN in ('web', 'webx') else None
+        status, response_data = await _build_download_link(request.match_info["token"], _base_url(request))
+        return web.json_response(response_data, status=status, content_type='application/json')
         
-        temp_data = await db.get_temp_file(token, serve_domain=serve_domain)
-        if not temp_data:
+    except Exception as e:
+        logging.error(f"Error in generate_download_handler: {e}", exc_info=True)
+        return web.json_response(
+            {"success": False, "error": "Server error. Please try again later."}, 
+            status=500,
+            content_type='application/json'
+        )
+
+
+@routes.post(r"/api/queue/{token}")
+async def queue_download_handler(request: web.Request):
+    """Take a download-queue ticket for token; progress is pushed on /api/queue/events/{ticket}"""
+    try:
+        # Own per-IP allowance, so a queued visitor keeps their /api/download tokens
+        can_proceed, message, retry_after = await rate_limiter.can_enqueue(_client_ip(request))
+        if not can_proceed:
             return web.json_response(
-                {"success": False, "error": "Link expired or not found"}, 
-                status=404,
+                {"success": False, "error": message, "retry_after": retry_after},
+                status=429,
+                headers={"Retry-After": str(retry_after)},
                 content_type='application/json'
             )
-        
-        # Get the original message from Telegram
-        client = StreamBot  # Use the main bot client
-        original_msg = await client.get_messages(temp_data['from_chat_id'], temp_data['message_id'])
-        
-        if not original_msg:
+
+        token = request.match_info["token"]
+        serve_domain = Var.SERVE_DOMAIN if Var.SERVE_DOMAIN in ('web', 'webx') else None
+        if not await db.get_temp_file(token, serve_domain=serve_domain):
             return web.json_response(
-                {"success": False, "error": "Original message not found"}, 
+                {"success": False, "error": "Link expired or not found"},
                 status=404,
                 content_type='application/json'
             )
-        
-        # Copy message to BIN_CHANNEL with retry logic for FloodWait
-        max_retries = 3
-        log_msg = None
-        for attempt in range(max_retries):
-            try:
-                log_msg = await original_msg.copy(
-                    chat_id=Var.BIN_CHANNEL,
-                    caption=temp_data['caption'][:1024],
-                    parse_mode=ParseMode.HTML
-                )
-                break
-            except FloodWait as e:
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(e.value)
-                else:
-                    return web.json_response(
-                        {"success": False, "error": "Server is busy. Please try again in a few seconds."}, 
-                        status=429,
-                        content_type='application/json'
-                    )
-            except Exception as copy_error:
-                logging.error(f"Error copying message (attempt {attempt + 1}): {copy_error}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2)
-                else:
-                    return web.json_response(
-                        {"success": False, "error": "Failed to process file. Please try again."}, 
-                        status=500,
-                        content_type='application/json'
-                    )
-        
-        if not log_msg:
+
+        ticket = download_queue.submit(
+            client_key(_client_ip(request)),
+            {'token': token, 'base_url': _base_url(request)}
+        )
+        if ticket is None:
             return web.json_response(
-                {"success": False, "error": "Failed to process file after retries"}, 
-                status=500,
+                {"success": False, "error": "You already have downloads waiting. Please let them finish first.",
+                 "retry_after": 10},
+                status=429,
+                headers={"Retry-After": "10"},
                 content_type='application/json'
             )
-        
-        # Generate download URL with download=1 parameter (direct file link, not /watch/)
-        file_name = get_name(log_msg) or temp_data['file_name'] or "NEXTPULSE"
-        if isinstance(file_name, bytes):
-            file_name = file_name.decode('utf-8', errors='ignore')
-        file_name = str(file_name)
-        file_hash = get_hash(log_msg)
-        
-        # Use the same domain from the incoming request for consistent subdomain routing
-        # Check X-Forwarded-Proto for proper HTTPS detection behind reverse proxies (Heroku, etc.)
-        request_host = request.host
-        forwarded_proto = request.headers.get('X-Forwarded-Proto', '').lower()
-        if forwarded_proto in ('https', 'http'):
-            scheme = forwarded_proto
-        elif Var.HAS_SSL:
-            scheme = 'https'
-        else:
-            scheme = request.scheme if request.scheme else 'http'
-        base_url = f"{scheme}://{request_host}/"
-        
-        download_link = f"{base_url}{log_msg.id}/{quote_plus(file_name)}?hash={file_hash}&download=1"
-        
-        # Keep temporary data for permanent links (don't delete)
-        # await db.delete_temp_file(token)  # Commented out to make links permanent
-        
-        # Prepare response with download URL
-        response_data = {
-            "success": True,
-            "download_url": download_link,
-            "file_name": file_name
-        }
-        
-        # Include thumbnail URL if available
-        if temp_data.get('thumbnail_url'):
-            response_data['thumbnail_url'] = temp_data['thumbnail_url']
-        
-        # Remove from rate limiter when done
-        rate_limiter.remove_request(client_ip)
-        
-        return web.json_response(response_data, content_type='application/json')
-        
+
+        return web.json_response(
+            {"success": True, "ticket": ticket.id, **download_queue.status(ticket)},
+            content_type='application/json'
+        )
+
     except Exception as e:
-        logging.error(f"Error in generate_download_handler: {e}", exc_info=True)
-        # Remove from rate limiter on error
-        try:
-            client_ip = request.headers.get('X-Forwarded-For', request.remote).split(',')[0].strip()
-            rate_limiter.remove_request(client_ip)
-        except:
-            pass
+        logging.error(f"Error in queue_download_handler: {e}", exc_info=True)
         return web.json_response(
-            {"success": False, "error": "Server error. Please try again later."}, 
+            {"success": False, "error": "Server error. Please try again later."},
             status=500,
             content_type='application/json'
         )
 
 
+@routes.get(r"/api/queue/events/{ticket}")
+async def queue_events_handler(request: web.Request):
+    """Server-sent events for one ticket: 'position' while waiting, then 'ready' or 'failed'"""
+    ticket = download_queue.get(request.match_info["ticket"])
+    if ticket is None:
+        return web.json_response(
+            {"success": False, "error": "Queue ticket expired"},
+            status=404,
+            content_type='application/json'
+        )
+
+    resp = web.StreamResponse(
+        status=200,
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    await resp.prepare(request)
+
+    download_queue.watch(ticket)
+    last_status = None
+    try:
+        while True:
+            if ticket.finished:
+                _, data = ticket.result
+                event = "ready" if ticket.state == "done" else "failed"
+                await resp.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                break
+            if ticket.id not in download_queue.tickets:
+                await resp.write(b'event: failed\ndata: {"success": false, "error": "Queue ticket expired"}\n\n')
+                break
+            version = download_queue.version
+            status = download_queue.status(ticket)
+            if status != last_status:
+                await resp.write(f"event: position\ndata: {json.dumps(status)}\n\n".encode())
+                last_status = status
+            if not await download_queue.wait_for_change(version, timeout=15):
+                # Keep proxies (Heroku closes idle connections after 55s) from dropping us
+                await resp.write(b": keep-alive\n\n")
+    except ConnectionResetError:
+        pass
+    finally:
+        download_queue.unwatch(ticket)
+    return resp
+
+
+@routes.post(r"/api/queue/cancel/{ticket}")
+async def queue_cancel_handler(request: web.Request):
+    """Give up a waiting ticket (sent with navigator.sendBeacon when the page closes)"""
+    cancelled = download_queue.cancel(request.match_info["ticket"])
+    return web.json_response({"success": cancelled}, content_type='application/json')
+
+
+@routes.get("/api/admin/streams")
+async def admin_streams_handler(request: web.Request):
+    """Active transfers, loads, admission and GitHub quota counters. Needs ADMIN_API_KEY (X-Admin-Key header or ?key=)."""
+    if not Var.ADMIN_API_KEY:
+        raise web.HTTPNotFound()
+    supplied = request.headers.get("X-Admin-Key") or request.query.get("key", "")
+    if not secrets.compare_digest(supplied.encode(), Var.ADMIN_API_KEY.encode()):
+        return web.json_response({"success": False, "error": "Forbidden"}, status=403)
+    return web.json_response({
+        "success": True,
+        **registry.snapshot(),
+        "admission": admission.stats(),
+        "github": github.snapshot(),
+        "download_queue": {
+            "waiting": download_queue.waiting,
+            "running": download_queue.running,
+        },
+    })
+
+
 @routes.get(r"/watch/{path:\S+}", allow_head=True)
 async def watch_handler(request: web.Request):
     try:
@@ -480,15 +636,44 @@ async def _home_dc(index: int) -> int:
 _LOG_MSG_ID = 1118050  # Only this message gets verbose INFO logging; others use DEBUG
 
 async def media_streamer(request: web.Request, id: int, secure_hash: str):
+    # The per-IP stream slot and the admission slot are held until the last
+    # byte is written (or the client goes away), not just until the handler
+    # returns headers.
+    client_ip = _client_ip(request)
+    if not await rate_limiter.acquire_stream(client_ip):
+        stream_log.warning(f"[MSG={id}] ❌ Too many concurrent streams ip={client_ip}")
+        return web.Response(
+            status=429,
+            text="Too many concurrent streams from your network. Close other players or downloads and retry.",
+            headers={"Retry-After": "5"},
+        )
+    try:
+        slot = await admission.admit(client_key(client_ip), id)
+        if slot is None:
+            stream_log.warning(f"[MSG={id}] ❌ Shedding stream, all clients at capacity {admission.stats()}")
+            return web.Response(
+                status=503,
+                text="Server is at capacity. Please retry in a few seconds.",
+                headers={"Retry-After": str(admission.retry_after)},
+            )
+        try:
+            return await _serve_media(request, id, secure_hash, slot)
+        finally:
+            await admission.release(slot)
+    finally:
+        await rate_limiter.release_stream(client_ip)
+
+
+async def _serve_media(request: web.Request, id: int, secure_hash: str, slot):
     req_start = time.monotonic()
     _log = stream_log.info if id == _LOG_MSG_ID else stream_log.debug
     range_header = request.headers.get("Range", 0)
     is_download = request.query.get("download") == "1"
 
-    _log(f"[MSG={id}] ▶ REQUEST range={range_header!r} download={is_download}")
+    _log(f"[MSG={id}] ▶ REQUEST range={range_header!r} download={is_download} priority={slot.priority}")
 
-    # ── Initial client selection (least loaded) ───────────────────────────────
-    index = min(work_loads, key=work_loads.get)
+    # ── Initial client selection (least loaded with room, picked at admission) ─
+    index = slot.index
     faster_client = multi_clients[index]
 
     if faster_client in class_cache:
@@ -507,12 +692,12 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
     file_dc = file_id.dc_id
     selected_home_dc = await _home_dc(index)
     if selected_home_dc == file_dc:
-        for alt_idx in sorted(multi_clients.keys(), key=lambda i: work_loads.get(i, 0)):
+        for alt_idx in sorted(multi_clients.keys(), key=lambda i: admission.active.get(i, 0)):
             if alt_idx == index:
                 continue
             try:
                 alt_home_dc = await _home_dc(alt_idx)
-                if alt_home_dc != file_dc:
+                if alt_home_dc != file_dc and await admission.move(slot, alt_idx):
                     index = alt_idx
                     faster_client = multi_clients[alt_idx]
                     if faster_client in class_cache:
@@ -573,10 +758,6 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
         f"first_cut={first_part_cut} last_cut={last_part_cut} length={req_length//1024}KB"
     )
 
-    body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
-
     # ── MIME / filename ──────────────────────────────────────────────────────
     mime_type = file_id.mime_type
     file_name = file_id.file_name
@@ -625,11 +806,35 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
         f"mime={mime_type} dc={file_id.dc_id} parts={part_count} setup={setup_ms:.0f}ms"
     )
 
-    return web.Response(
-        status=status_code,
-        body=body,
-        headers=headers,
+    response = web.StreamResponse(status=status_code, headers=headers)
+    await response.prepare(request)
+    if request.method == "HEAD":
+        await response.write_eof()
+        return response
+
+    body = tg_connect.yield_file(
+        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
     )
+    client_ip = _client_ip(request)
+    transfer = registry.open(id, index, client_ip, "download" if is_download else disposition, req_length)
+    flow = shaper.open(client_key(client_ip), index, disposition == "inline") if shaper else None
+    try:
+        async for chunk in body:
+            if flow is not None:
+                await shaper.consume(flow, len(chunk))
+            await response.write(chunk)
+            registry.progress(transfer, len(chunk))
+    except ConnectionResetError:
+        _log(f"[MSG={id}] Client disconnected mid-stream")
+        return response
+    finally:
+        # Stop pulling from Telegram as soon as the transfer ends
+        await body.aclose()
+        if flow is not None:
+            shaper.close(flow)
+        registry.close(transfer)
+    await response.write_eof()
+    return response
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -725,29 +930,25 @@ async def root_tree_handler(request: web.Request) -> web.Response:
             content_type="text/html", status=500
         )
 
-    api_url = f"https://api.github.com/repos/{_ROOT_REPO}/git/trees/HEAD?recursive=1"
-    headers_gh = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github.v3+json",
-        "User-Agent": "StreamBot-FileIndex/1.0",
-    }
-
     try:
-        async with aiohttp_client.ClientSession() as session:
-            async with session.get(api_url, headers=headers_gh, timeout=aiohttp_client.ClientTimeout(total=15)) as resp:
-                if resp.status != 200:
-                    body = await resp.text()
-                    return web.Response(
-                        text=f"<h2>GitHub API error {resp.status}</h2><pre>{body[:500]}</pre>",
-                        content_type="text/html", status=502
-                    )
-                data = await resp.json()
+        # Conditional GET: an unchanged tree costs a 304 and no rate-limit quota.
+        # A page load gets one quick retry, not the bot's minutes-long budget.
+        resp = await github.request(
+            "GET", f"/repos/{_ROOT_REPO}/git/trees/HEAD", token, params={"recursive": "1"},
+            max_retries=1, max_delay=3, timeout=15,
+        )
     except Exception as exc:
         logging.error(f"root-tree GitHub fetch error: {exc}")
         return web.Response(
             text=f"<h2>Fetch error</h2><pre>{exc}</pre>",
             content_type="text/html", status=502
         )
+    if resp.status != 200 or resp.data is None:
+        return web.Response(
+            text=f"<h2>GitHub API error {resp.status}</h2><pre>{resp.text[:500]}</pre>",
+            content_type="text/html", status=502
+        )
+    data = resp.data
 
     truncated = data.get("truncated", False)
     flat_items = data.get("tree", [])
@@ -0,0 +1,83 @@
+"""
+Per-subject checkpoints for incremental /batch runs.
+
+After a subject is published, its checkpoint is stored in the
+'batch_subject' state namespace under the subject's GitHub JSON path:
+
+    {
+        "start_id": 1200, "last_id": 1480,
+        "json_hash": "...", "html_hash": "...", "thumbnail_url": "...",
+        "messages": {"1200": {"fp": "<file_unique_id>:<edit time>",
+                              "entries": [...], "skipped": [...]}, ...}
+    }
+
+On the next run for the same path and first message, each fetched message
+whose fingerprint matches the stored one reuses its stored entries; only
+new or edited messages get tokens, links and thumbnails. If the rebuilt
+JSON hashes the same as what was published, the subject is not staged and
+no commit is made for it.
+"""
+import time
+import hashlib
+from typing import Optional, Tuple
+from Adarsh.utils.file_properties import get_media_from_message
+
+
+NS = "batch_subject"
+
+
+def fingerprint(msg) -> Optional[str]:
+    """What a message's entries depend on: its file and its last edit."""
+    if msg is None:
+        return None
+    if getattr(msg, 'empty', False):
+        return "empty"
+    media = get_media_from_message(msg)
+    edited = msg.edit_date or msg.date
+    return f"{getattr(media, 'file_unique_id', '')}:{int(edited.timestamp()) if edited else 0}"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+async def load(db, key: str, start_id: int) -> Optional[dict]:
+    """The stored checkpoint for key, or None if there is none or F moved."""
+    checkpoint = await db.get_state(NS, key)
+    if not checkpoint or checkpoint.get('start_id') != start_id:
+        return None
+    return checkpoint
+
+
+def reuse(checkpoint: Optional[dict], msg) -> Optional[Tuple[list, list]]:
+    """Stored (entries, skipped) for msg if it is unchanged since the checkpoint."""
+    if not checkpoint or msg is None:
+        return None
+    stored = checkpoint['messages'].get(str(msg.id))
+    if stored is None or stored['fp'] != fingerprint(msg):
+        return None
+    return stored['entries'], stored['skipped']
+
+
+async def save(db, key: str, subject, fingerprints: dict, json_hash: str, html_hash: Optional[str]):
+    """Store subject's slots; fingerprints maps message id -> fingerprint() at build time."""
+    messages = {}
+    for position, slot in enumerate(subject.slots):
+        msg_id = subject.start_id + position
+        # Messages that failed are left out so the next run retries them
+        if slot is None or slot[1] or fingerprints.get(msg_id) is None:
+            continue
+        messages[str(msg_id)] = {
+            'fp': fingerprints[msg_id],
+            'entries': [{k: v for k, v in e.items() if k != '_thumb_error'} for e in slot[0]],
+            'skipped': slot[1],
+        }
+    await db.set_state(NS, key, {
+        'start_id': subject.start_id,
+        'last_id': subject.end_id,
+        'json_hash': json_hash,
+        'html_hash': html_hash,
+        'thumbnail_url': subject.thumbnail_url,
+        'messages': messages,
+        'updated_at': time.time(),
+    })
@@ -0,0 +1,212 @@
+"""
+Pipelined executor for /batch.
+
+A batch is a list of subjects, each a contiguous range of DB_CHANNEL
+message ids. Instead of walking subjects and messages one at a time, the
+executor runs every stage behind its own semaphore so the slow stages
+(video download + ffmpeg, GitHub uploads) overlap with the fast ones:
+
+    fetch      get_messages() pages of ids, prefetched by MessagePaginator
+    thumbnail  one thumbnail per subject, reused by its other videos; the
+               caller's coroutine usually goes through ThumbnailService,
+               which bounds ffmpeg processes across all batches
+    link       intermediate link / token creation for each message
+    upload     publishing the subject's JSON and HTML
+
+Subjects run concurrently up to `subjects`. While one page of a subject
+is being processed the paginator is already fetching the next, and a
+subject pulls a new page only once the page before the current one is
+done, so prefetching stays bounded. Telegram
+calls (fetch pages, thumbnail downloads) draw from one shared RateGovernor,
+and a FloodWait seen by any stage pauses all of them. Within a subject
+every result is slotted by message position, so lectures come out in
+channel order no matter which message finished first. Messages the
+optional `reuse` callback already has a result for (unchanged since an
+earlier run) skip the thumbnail and link stages entirely.
+
+The executor knows nothing about Telegram objects or GitHub; the caller
+supplies the stage coroutines.
+"""
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from pyrogram.errors import FloodWait
+from Adarsh.utils.token_bucket import TokenBucket
+
+
+log = logging.getLogger("batch.executor")
+
+
+class RateGovernor:
+    """Shared pacing for Telegram calls: a token bucket plus a global pause
+    that any caller can extend after a FloodWait."""
+
+    def __init__(self, rate: float):
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def wait(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+
+    async def call(self, fn: Callable[[], Awaitable], retries: int = 3):
+        """Run fn() under the governor, absorbing FloodWait up to retries times."""
+        for attempt in range(retries + 1):
+            await self.wait()
+            try:
+                return await fn()
+            except FloodWait as e:
+                if attempt == retries:
+                    raise
+                log.warning(f"FloodWait {e.value}s, pausing batch Telegram calls")
+                self.pause(e.value)
+
+
+class Subject:
+    def __init__(self, index: int, name: str, start_id: int, end_id: int, **extra):
+        self.index = index
+        self.name = name
+        self.start_id = start_id
+        self.end_id = end_id
+        self.extra = extra
+        self.total = end_id - start_id + 1
+        self.slots: List[Optional[tuple]] = [None] * self.total   # (entries, skipped) per message
+        self.processed = 0
+        self.reused = 0                 # messages whose slot came from reuse()
+        self.thumbnail_url: Optional[str] = None
+        self.thumbnail_error: Optional[str] = None
+        self.thumb_lock = asyncio.Lock()
+        self.state = "queued"           # queued -> running -> uploading -> done | failed
+        self.error: Optional[str] = None
+        self.result = None
+
+    @property
+    def lectures(self) -> list:
+        return [entry for slot in self.slots if slot for entry in slot[0]]
+
+    @property
+    def skipped(self) -> list:
+        return [item for slot in self.slots if slot for item in slot[1]]
+
+
+class BatchExecutor:
+    def __init__(self, paginator, build, publish, thumbnail=None, wants_thumbnail=None,
+                 reuse=None, subjects: int = 3, linkers: int = 8, uploaders: int = 1, governor: RateGovernor = None, on_subject_done=None):
+        """
+        Args:
+            paginator: object with pages(start_id, end_id) yielding
+                (offset, messages) in order, None for missing ids
+            build: async (subject, msg, thumbnail_url) -> (entries, skipped)
+            publish: async (subject) -> result stored on subject.result; raise to fail
+            thumbnail: async (subject, msg) -> url, or None to disable the stage
+            wants_thumbnail: (msg) -> bool, whether msg should carry a thumbnail
+            reuse: (subject, msg) -> (entries, skipped) from an earlier run, or None
+                to build msg; reused messages skip the thumbnail and link stages
+            on_subject_done: async (subject) called once a subject is done or failed
+        """
+        self.paginator = paginator
+        self.build = build
+        self.publish = publish
+        self.thumbnail = thumbnail
+        self.wants_thumbnail = wants_thumbnail or (lambda msg: False)
+        self.reuse = reuse or (lambda subject, msg: None)
+        self.on_subject_done = on_subject_done
+        self.governor = governor or RateGovernor(20)
+        self._subjects = asyncio.Semaphore(subjects)
+        self._link = asyncio.Semaphore(linkers)
+        self._upload = asyncio.Semaphore(uploaders)
+        self.subjects: List[Subject] = []
+
+    # ── Stages ───────────────────────────────────────────────────────────
+
+    async def _thumbnail_for(self, subject: Subject, msg) -> Optional[str]:
+        if self.thumbnail is None or not self.wants_thumbnail(msg):
+            return subject.thumbnail_url
+        # One extraction per subject; later videos wait for it and reuse the URL.
+        # If it fails, the next waiting video tries in turn.
+        async with subject.thumb_lock:
+            if subject.thumbnail_url:
+                return subject.thumbnail_url
+            try:
+                subject.thumbnail_url = await self.governor.call(lambda: self.thumbnail(subject, msg))
+                log.info(f"Thumbnail for {subject.name}: {subject.thumbnail_url}")
+            except Exception as e:
+                log.error(f"Thumbnail failed in {subject.name}: {e}")
+                if not subject.thumbnail_error:
+                    subject.thumbnail_error = str(e)
+        return subject.thumbnail_url
+
+    async def _process(self, subject: Subject, position: int, msg):
+        reused = self.reuse(subject, msg)
+        if reused is not None:
+            subject.slots[position] = reused
+            subject.reused += 1
+        elif msg is None:
+            subject.slots[position] = ([], [{"id": "Unknown", "file_name": "Unknown", "reason": "Message not found"}])
+        else:
+            thumbnail_url = await self._thumbnail_for(subject, msg)
+            async with self._link:
+                subject.slots[position] = await self.build(subject, msg, thumbnail_url)
+        subject.processed += 1
+
+    async def _run_subject(self, subject: Subject):
+        async with self._subjects:
+            subject.state = "running"
+            try:
+                inflight: List[list] = []      # tasks of each page not yet awaited
+                try:
+                    async for offset, messages in self.paginator.pages(subject.start_id, subject.end_id):
+                        inflight.append([
+                            asyncio.ensure_future(self._process(subject, offset + i, msg))
+                            for i, msg in enumerate(messages)
+                        ])
+                        # Backpressure: the next page is only pulled once the one
+                        # before this has been processed
+                        if len(inflight) > 1:
+                            await asyncio.gather(*inflight.pop(0))
+                    while inflight:
+                        await asyncio.gather(*inflight.pop(0))
+                finally:
+                    for page in inflight:
+                        for task in page:
+                            task.cancel()
+                subject.state = "uploading"
+                async with self._upload:
+                    subject.result = await self.publish(subject)
+                subject.state = "done"
+            except Exception as e:
+                log.error(f"Subject {subject.name} failed: {e}", exc_info=True)
+                subject.state = "failed"
+                subject.error = f"{type(e).__name__}: {e}"
+        if self.on_subject_done is not None:
+            try:
+                await self.on_subject_done(subject)
+            except Exception as e:
+                log.error(f"on_subject_done failed for {subject.name}: {e}")
+
+    async def run(self, subjects: List[Subject]) -> List[Subject]:
+        self.subjects = subjects
+        await asyncio.gather(*[self._run_subject(subject) for subject in subjects])
+        return subjects
+
+    # ── Progress ─────────────────────────────────────────────────────────
+
+    def progress(self) -> dict:
+        states = [s.state for s in self.subjects]
+        return {
+            "subjects": len(self.subjects),
+            "done": states.count("done"),
+            "failed": states.count("failed"),
+            "running": [s.name for s in self.subjects if s.state in ("running", "uploading")],
+            "messages": sum(s.total for s in self.subjects),
+            "processed": sum(s.processed for s in self.subjects),
+            "reused": sum(s.reused for s in self.subjects),
+        }
@@ -1,20 +1,216 @@
+import time
 import asyncio
+import logging
 import traceback
+from collections import OrderedDict
 from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
+from Adarsh.utils.token_bucket import TokenBucket
+from Adarsh.vars import Var
 
 
-async def send_msg(user_id, message):
-    try:
-        await message.forward(chat_id=user_id)
-        return 200, None
-    except FloodWait as e:
-        await asyncio.sleep(e.x)
-        return send_msg(user_id, message)
-    except InputUserDeactivated:
-        return 400, f"{user_id} : deactivated\n"
-    except UserIsBlocked:
-        return 400, f"{user_id} : blocked the bot\n"
-    except PeerIdInvalid:
-        return 400, f"{user_id} : user id invalid\n"
-    except Exception as e:
-        return 500, f"{user_id} : {traceback.format_exc()}\n"
+_DEAD_USER_ERRORS = {
+    InputUserDeactivated: "deactivated",
+    UserIsBlocked: "blocked the bot",
+    PeerIdInvalid: "user id invalid",
+}
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+class BroadcastEngine:
+    """Deliver one message to many users with a bounded pool of workers.
+
+    - Each client has its own token bucket (BROADCAST_RATE), so every bot
+      stays under Telegram's bulk-message limits however many of them are
+      paused or left.
+    - A FloodWait pauses only the client that received it; the user is
+      retried on the next available client.
+    - With several clients, secondary bots forward a mirror of the message
+      kept in BIN_CHANNEL. A user who never started a secondary bot is
+      retried on the primary bot before being treated as dead.
+    - Dead users are removed in batches through Database.delete_users.
+    - Every `checkpoint_every` deliveries `checkpoint(cursor, stats)` is
+      awaited, where cursor is the _id of the last user such that every
+      user up to and including it has been handled. Resuming from that
+      cursor never skips anyone and resends to at most one batch.
+    """
+
+    DELETE_BATCH = 100
+
+    def __init__(self, clients: dict, message, db, workers: int = None, rate: float = None,
+                 log_file=None, is_cancelled=None, on_progress=None,
+                 checkpoint=None, checkpoint_every: int = None, stats: dict = None):
+        self.clients = dict(clients)
+        self.primary = min(self.clients)
+        self.message = message
+        self.db = db
+        self.workers = workers or Var.BROADCAST_WORKERS
+        per_client = rate or Var.BROADCAST_RATE
+        self.buckets = {idx: TokenBucket(per_client, per_client) for idx in self.clients}
+        self.log_file = log_file
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.on_progress = on_progress
+        self._sources = {}
+        self._paused_until = {idx: 0.0 for idx in self.clients}
+        self._next_client = 0
+        self._dead = []
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every or Var.BROADCAST_CHECKPOINT_EVERY
+        self.cursor = None
+        self._inflight = OrderedDict()   # seq -> [user _id, done]
+        self._since_checkpoint = 0
+        self.stats = dict(total=0, current=0, success=0, failed=0, dead=0, flood_waits=0, elapsed=0.0, rate=0.0)
+        if stats:
+            self.stats.update({k: stats[k] for k in ('current', 'success', 'failed', 'dead') if k in stats})
+
+    async def _prepare_sources(self):
+        self._sources[self.primary] = (self.message.chat.id, self.message.id)
+        if len(self.clients) > 1:
+            mirror = await self.message.forward(chat_id=Var.BIN_CHANNEL)
+            for idx in self.clients:
+                if idx != self.primary:
+                    self._sources[idx] = (Var.BIN_CHANNEL, mirror.id)
+
+    async def _pick_client(self, only_primary: bool = False) -> int:
+        """A client that is not paused, with a send token taken from its own bucket."""
+        while True:
+            now = time.monotonic()
+            candidates = [self.primary] if only_primary else sorted(self.clients)
+            ready = [idx for idx in candidates if self._paused_until[idx] <= now]
+            if not ready:
+                await asyncio.sleep(min(self._paused_until[idx] for idx in candidates) - now)
+                continue
+            self._next_client += 1
+            start = self._next_client % len(ready)
+            wait = float("inf")
+            for idx in ready[start:] + ready[:start]:
+                token_wait = self.buckets[idx].try_consume()
+                if not token_wait:
+                    return idx
+                wait = min(wait, token_wait)
+            await asyncio.sleep(wait)
+
+    async def _log(self, line: str):
+        if self.log_file is not None:
+            await self.log_file.write(line)
+
+    async def _deliver(self, user_id: int) -> int:
+        only_primary = False
+        while True:
+            idx = await self._pick_client(only_primary)
+            from_chat_id, message_id = self._sources[idx]
+            try:
+                await self.clients[idx].forward_messages(
+                    chat_id=user_id, from_chat_id=from_chat_id, message_ids=message_id
+                )
+                return 200
+            except FloodWait as e:
+                self.stats['flood_waits'] += 1
+                self._paused_until[idx] = max(self._paused_until[idx], time.monotonic() + e.value)
+                logging.warning(f"Broadcast: client {idx} FloodWait {e.value}s, pausing it")
+            except tuple(_DEAD_USER_ERRORS) as e:
+                if idx != self.primary:
+                    # Most likely the user never started this secondary bot
+                    only_primary = True
+                    continue
+                await self._log(f"{user_id} : {_DEAD_USER_ERRORS[type(e)]}\n")
+                return 400
+            except Exception:
+                await self._log(f"{user_id} : {traceback.format_exc()}\n")
+                return 500
+
+    async def _flush_dead(self, force: bool = False):
+        if self._dead and (force or len(self._dead) >= self.DELETE_BATCH):
+            batch, self._dead = self._dead, []
+            await self.db.delete_users(batch)
+
+    async def _mark_done(self, seq: int):
+        self._inflight[seq][1] = True
+        while self._inflight:
+            first = next(iter(self._inflight.values()))
+            if not first[1]:
+                break
+            self.cursor = first[0]
+            self._inflight.popitem(last=False)
+        self._since_checkpoint += 1
+        if self.checkpoint is not None and self._since_checkpoint >= self.checkpoint_every:
+            self._since_checkpoint = 0
+            await self._flush_dead(force=True)
+            await self.checkpoint(self.cursor, self.stats)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            seq, user_id = item
+            status = await self._deliver(user_id)
+            if status == 200:
+                self.stats['success'] += 1
+            else:
+                self.stats['failed'] += 1
+            if status == 400:
+                self.stats['dead'] += 1
+                self._dead.append(user_id)
+                await self._flush_dead()
+            self.stats['current'] += 1
+            if self.on_progress is not None:
+                self.on_progress(self.stats)
+            await self._mark_done(seq)
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue, item, workers: list) -> bool:
+        """queue.put(item), or False as soon as a worker has died instead."""
+        if any(task.done() for task in workers):
+            return False
+        put = asyncio.ensure_future(queue.put(item))
+        await asyncio.wait([put, *workers], return_when=asyncio.FIRST_COMPLETED)
+        if put.done():
+            return True
+        put.cancel()
+        return False
+
+    async def run(self, users, total: int = 0) -> dict:
+        """Broadcast to every user yielded by the async iterable `users`
+        (documents with 'id' and '_id' fields, in _id order). Returns the
+        final stats dict."""
+        start = time.monotonic()
+        # Deliveries made before a resume do not count towards this run's rate
+        resumed_at = self.stats['current']
+        self.stats['total'] = total
+        await self._prepare_sources()
+
+        if not hasattr(users, '__aiter__'):
+            users = _iterate(users)
+
+        queue = asyncio.Queue(maxsize=self.workers * 4)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        seq = 0
+        try:
+            async for user in users:
+                if self.is_cancelled():
+                    break
+                seq += 1
+                self._inflight[seq] = [str(user.get('_id', '')), False]
+                if not await self._put(queue, (seq, int(user['id'])), workers):
+                    break
+        finally:
+            for _ in workers:
+                if not await self._put(queue, None, workers):
+                    # Workers only return on None, so one that is done early has died
+                    for task in workers:
+                        task.cancel()
+                    break
+            results = await asyncio.gather(*workers, return_exceptions=True)
+            await self._flush_dead(force=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+
+        elapsed = time.monotonic() - start
+        self.stats['elapsed'] = elapsed
+        self.stats['rate'] = (self.stats['current'] - resumed_at) / elapsed if elapsed > 0 else 0.0
+        return self.stats
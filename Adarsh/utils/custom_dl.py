@@ -3,7 +3,6 @@ import asyncio
 import logging
 from Adarsh.vars import Var
 from typing import Dict, Union
-from Adarsh.bot import work_loads
 from pyrogram import Client, utils, raw
 from .file_properties import get_file_ids
 from pyrogram.session import Session, Auth
@@ -142,7 +141,6 @@ class ByteStreamer:
         chunk_size: int,
     ) -> Union[str, None]:
         client = self.client
-        work_loads[index] += 1
         log.debug(f"Starting to yield file with client {index}.")
         media_session = await self.generate_media_session(client, file_id)
 
@@ -184,7 +182,6 @@ class ByteStreamer:
             pass
         finally:
             log.debug(f"Finished yielding file with {current_part} parts.")
-            work_loads[index] -= 1
 
     async def clean_cache(self) -> None:
         while True:
@@ -1,11 +1,25 @@
+import asyncio
 import datetime
 import motor.motor_asyncio
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import secrets
 import time
+from collections import OrderedDict
+from Adarsh.vars import Var
+from Adarsh.utils.storage import get_storage_backend
 
 
 class Database:
     def __init__(self, uri, database_name):
+        self._temp_indexes_ready = False
+        self._temp_index_lock = asyncio.Lock()
+        self._user_indexes_ready = False
+        self._user_index_lock = asyncio.Lock()
+        # Bounded LRU of user ids known to be registered
+        self._seen_users = OrderedDict()
+        self._seen_users_max = Var.SEEN_USERS_CACHE_SIZE
         # Check if URI is valid and not empty
         self.enabled = bool(uri and uri.strip() and (uri.startswith('mongodb://') or uri.startswith('mongodb+srv://')))
         if self.enabled:
@@ -14,6 +28,7 @@ class Database:
                 self.db = self._client[database_name]
                 self.col = self.db.users
                 self.temp_files = self.db.temp_files
+                self.state = self.db.state
             except Exception as e:
                 print(f"Database initialization error: {e}")
                 self.enabled = False
@@ -21,15 +36,24 @@ class Database:
                 self.db = None
                 self.col = None
                 self.temp_files = None
-                self._memory_temp_files = {}
+                self.state = None
+                self.backend = self._embedded_backend()
         else:
             self._client = None
             self.db = None
             self.col = None
             self.temp_files = None
-            # In-memory storage for development/testing
-            self._memory_temp_files = {}
-            print("Database disabled - no DATABASE_URL provided, using in-memory storage")
+            self.state = None
+            self.backend = self._embedded_backend()
+            print(f"Database disabled - no DATABASE_URL provided, using {Var.STORAGE_BACKEND} storage")
+
+    @staticmethod
+    def _embedded_backend():
+        return get_storage_backend(
+            Var.STORAGE_BACKEND,
+            path=Var.STORAGE_PATH,
+            cache_size=Var.STORAGE_CACHE_SIZE,
+        )
 
     def new_user(self, id):
         return dict(
@@ -37,11 +61,67 @@ class Database:
             join_date=datetime.date.today().isoformat()
         )
 
+    def _mark_seen(self, id):
+        self._seen_users[id] = None
+        self._seen_users.move_to_end(id)
+        while len(self._seen_users) > self._seen_users_max:
+            self._seen_users.popitem(last=False)
+
     async def add_user(self, id):
+        """Register a user. Idempotent; users already seen by this process cost
+        no database round trip."""
         if not self.enabled:
             return
-        user = self.new_user(id)
-        await self.col.insert_one(user)
+        id = int(id)
+        if id in self._seen_users:
+            self._seen_users.move_to_end(id)
+            return
+        await self._ensure_user_indexes()
+        try:
+            await self.col.update_one({'id': id}, {'$setOnInsert': self.new_user(id)}, upsert=True)
+        except DuplicateKeyError:
+            pass    # a concurrent registration of the same id won the insert
+        self._mark_seen(id)
+
+    async def _ensure_user_indexes(self):
+        """Unique index on users.id. Building it first merges away duplicates
+        registered before it existed; once it exists this is one cheap check."""
+        if self._user_indexes_ready:
+            return
+        async with self._user_index_lock:
+            if self._user_indexes_ready:
+                return
+            info = await self.col.index_information()
+            if not info.get('id_1', {}).get('unique'):
+                await self._merge_duplicate_users()
+                # Older deployments have a non-unique index under the same name
+                if 'id_1' in info:
+                    await self.col.drop_index('id_1')
+                await self.col.create_index('id', unique=True)
+            self._user_indexes_ready = True
+
+    async def _merge_duplicate_users(self):
+        """Keep the oldest document of every duplicated user id, carrying over
+        a password stored only on a newer one. Returns the documents removed."""
+        pipeline = [
+            {'$sort': {'_id': 1}},
+            {'$group': {
+                '_id': '$id',
+                'ids': {'$push': '$_id'},
+                'passes': {'$push': {'$ifNull': ['$ag_p', None]}},
+                'count': {'$sum': 1},
+            }},
+            {'$match': {'count': {'$gt': 1}}},
+        ]
+        removed = 0
+        async for group in self.col.aggregate(pipeline, allowDiskUse=True):
+            keep_id, drop_ids = group['ids'][0], group['ids'][1:]
+            passes = [ag_pass for ag_pass in group['passes'] if ag_pass]
+            if passes and not group['passes'][0]:
+                await self.col.update_one({'_id': keep_id}, {'$set': {'ag_p': passes[-1]}})
+            result = await self.col.delete_many({'_id': {'$in': drop_ids}})
+            removed += result.deleted_count
+        return removed
         
     async def add_user_pass(self, id, ag_pass):
         if not self.enabled:
@@ -58,54 +138,93 @@ class Database:
     async def is_user_exist(self, id):
         if not self.enabled:
             return False
-        user = await self.col.find_one({'id': int(id)})
+        if int(id) in self._seen_users:
+            return True
+        user = await self.col.find_one({'id': int(id)}, projection={'_id': 1})
+        if user:
+            self._mark_seen(int(id))
         return True if user else False
 
     async def total_users_count(self):
         if not self.enabled:
             return 0
-        count = await self.col.count_documents({})
+        # Metadata-based count; avoids a full collection scan
+        count = await self.col.estimated_document_count()
         return count
 
-    async def get_all_users(self):
+    async def get_all_users(self, after_id=None):
+        """Cursor over all users in _id order, optionally resuming after
+        the user whose _id (as a string) is after_id."""
         if not self.enabled:
             return []
-        all_users = self.col.find({})
+        query = {'_id': {'$gt': ObjectId(after_id)}} if after_id else {}
+        all_users = self.col.find(query).sort('_id', 1)
         return all_users
 
     async def delete_user(self, user_id):
         if not self.enabled:
             return
+        self._seen_users.pop(int(user_id), None)
         await self.col.delete_many({'id': int(user_id)})
 
+    async def delete_users(self, user_ids):
+        if not self.enabled or not user_ids:
+            return
+        ids = [int(user_id) for user_id in user_ids]
+        for user_id in ids:
+            self._seen_users.pop(user_id, None)
+        await self.col.delete_many({'id': {'$in': ids}})
+
+    @staticmethod
+    def _temp_file_key(message_data, domain):
+        """Identity of a stored file: the same Telegram file posted in the same
+        chat for the same domain always maps to one token."""
+        return {
+            'file_unique_id': message_data['file_unique_id'],
+            'from_chat_id': message_data['from_chat_id'],
+            'domain': domain,
+        }
+
+    _TEMP_FILE_KEY_INDEX = 'file_unique_id_1_from_chat_id_1_domain_1'
+
+    async def _ensure_temp_file_indexes(self):
+        """Lookup indexes, plus a unique index on the file identity. Building
+        that one first compacts duplicates issued before it existed; once it
+        exists this is one cheap check."""
+        if self._temp_indexes_ready:
+            return
+        async with self._temp_index_lock:
+            if self._temp_indexes_ready:
+                return
+            await self.temp_files.create_index('token')
+            await self.temp_files.create_index('aliases', sparse=True)
+            info = await self.temp_files.index_information()
+            if not info.get(self._TEMP_FILE_KEY_INDEX, {}).get('unique'):
+                await self._merge_duplicate_temp_files()
+                # Older deployments have a non-unique index under the same name
+                if self._TEMP_FILE_KEY_INDEX in info:
+                    await self.temp_files.drop_index(self._TEMP_FILE_KEY_INDEX)
+                await self.temp_files.create_index(
+                    [('file_unique_id', 1), ('from_chat_id', 1), ('domain', 1)],
+                    name=self._TEMP_FILE_KEY_INDEX,
+                    unique=True,
+                    # Files without a unique id are never deduplicated
+                    partialFilterExpression={'file_unique_id': {'$gt': ''}},
+                )
+            self._temp_indexes_ready = True
+
     async def store_temp_file(self, message_data, domain=None):
         """Store permanent file data and return a unique token.
-        
+
+        Token issuance is idempotent: storing the same file_unique_id from the
+        same chat for the same domain again returns the existing token.
+
         Args:
             message_data: Dict with file metadata
             domain: Optional domain identifier ('web' or 'webx') for independent token storage
         """
-        token = secrets.token_urlsafe(16)
-        
-        if not self.enabled:
-            temp_data = {
-                'token': token,
-                'domain': domain,
-                'message_id': message_data['message_id'],
-                'file_name': message_data['file_name'], 
-                'file_size': message_data['file_size'],
-                'mime_type': message_data['mime_type'],
-                'caption': message_data['caption'],
-                'from_chat_id': message_data['from_chat_id'],
-                'file_unique_id': message_data['file_unique_id'],
-                'thumbnail_url': message_data.get('thumbnail_url'),
-                'created_at': time.time()
-            }
-            self._memory_temp_files[token] = temp_data
-            return token
-        
         temp_data = {
-            'token': token,
+            'token': secrets.token_urlsafe(16),
             'domain': domain,
             'message_id': message_data['message_id'],
             'file_name': message_data['file_name'], 
@@ -117,34 +236,120 @@ class Database:
             'thumbnail_url': message_data.get('thumbnail_url'),
             'created_at': time.time()
         }
-        await self.temp_files.insert_one(temp_data)
-        return token
+        # Files without a unique id cannot be deduplicated safely
+        dedupe = bool(message_data.get('file_unique_id'))
+
+        if not self.enabled:
+            if dedupe:
+                # Lookup and insert happen as one step inside the backend
+                stored = await self.backend.store_temp_file(temp_data)
+                return stored['token']
+            await self.backend.put_temp_file(temp_data)
+            return temp_data['token']
+
+        await self._ensure_temp_file_indexes()
+        if not dedupe:
+            await self.temp_files.insert_one(temp_data)
+            return temp_data['token']
+
+        update = {'$setOnInsert': temp_data}
+        if temp_data['thumbnail_url']:
+            # Refresh the thumbnail on re-runs without clobbering anything else
+            thumbnail_url = temp_data.pop('thumbnail_url')
+            update['$set'] = {'thumbnail_url': thumbnail_url}
+        key = self._temp_file_key(message_data, domain)
+        try:
+            doc = await self.temp_files.find_one_and_update(
+                key,
+                update,
+                upsert=True,
+                projection={'token': 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # A concurrent store of the same file inserted first; use its token
+            doc = await self.temp_files.find_one_and_update(
+                key, update, projection={'token': 1}, return_document=ReturnDocument.AFTER,
+            )
+        return doc['token']
 
     async def get_temp_file(self, token, serve_domain=None):
         """Retrieve permanent file data by token.
-        
+
+        Tokens merged away by compact_temp_files() keep resolving through the
+        surviving record's aliases, so links published earlier stay valid.
+
         Args:
             token: The unique token to look up
             serve_domain: Optional domain filter - if set, only returns tokens for that domain
         """
         if not self.enabled:
-            data = self._memory_temp_files.get(token)
+            data = await self.backend.get_temp_file(token)
             if data and serve_domain and data.get('domain') and data['domain'] != serve_domain:
                 return None
             return data
         
-        query = {'token': token}
+        query = {'$or': [{'token': token}, {'aliases': token}]}
         if serve_domain:
             query['domain'] = serve_domain
         temp_data = await self.temp_files.find_one(query)
         return temp_data
 
+    async def compact_temp_files(self):
+        """Merge duplicate temp_files records left over from before token
+        issuance was idempotent.
+
+        For every (file_unique_id, from_chat_id, domain) group the oldest record
+        survives; the tokens of the others are kept as aliases on it and the
+        duplicate documents are removed.
+
+        Returns:
+            (groups_merged, records_removed)
+        """
+        if not self.enabled:
+            return await self.backend.compact_temp_files()
+
+        result = await self._merge_duplicate_temp_files()
+        await self._ensure_temp_file_indexes()
+        return result
+
+    async def _merge_duplicate_temp_files(self):
+        pipeline = [
+            {'$match': {'file_unique_id': {'$nin': [None, '']}}},
+            {'$sort': {'created_at': 1}},
+            {'$group': {
+                '_id': {
+                    'file_unique_id': '$file_unique_id',
+                    'from_chat_id': '$from_chat_id',
+                    'domain': '$domain',
+                },
+                'ids': {'$push': '$_id'},
+                'tokens': {'$push': '$token'},
+                'aliases': {'$push': {'$ifNull': ['$aliases', []]}},
+                'count': {'$sum': 1},
+            }},
+            {'$match': {'count': {'$gt': 1}}},
+        ]
+        groups = 0
+        removed = 0
+        async for group in self.temp_files.aggregate(pipeline, allowDiskUse=True):
+            keep_id, drop_ids = group['ids'][0], group['ids'][1:]
+            merged_aliases = set(group['tokens'][1:])
+            for alias_list in group['aliases']:
+                merged_aliases.update(alias_list)
+            await self.temp_files.update_one(
+                {'_id': keep_id},
+                {'$addToSet': {'aliases': {'$each': sorted(merged_aliases)}}}
+            )
+            result = await self.temp_files.delete_many({'_id': {'$in': drop_ids}})
+            groups += 1
+            removed += result.deleted_count
+        return groups, removed
+
     async def delete_temp_file(self, token):
         """Delete temporary file data after stream generation"""
         if not self.enabled:
-            # Delete from memory storage
-            if token in self._memory_temp_files:
-                del self._memory_temp_files[token]
+            await self.backend.delete_temp_file(token)
             return
         await self.temp_files.delete_one({'token': token})
 
@@ -152,3 +357,58 @@ class Database:
         """Clean up expired temporary files - DISABLED for permanent links"""
         # Links are now permanent, no cleanup needed
         return
+
+    # ── Namespaced state documents (broadcast checkpoints, job journals, ...) ─
+
+    async def get_state(self, ns, key):
+        if not self.enabled:
+            return await self.backend.get_state(ns, key)
+        doc = await self.state.find_one({'_id': f"{ns}:{key}"})
+        return doc['value'] if doc else None
+
+    async def set_state(self, ns, key, value):
+        if not self.enabled:
+            await self.backend.set_state(ns, key, value)
+            return
+        await self.state.update_one(
+            {'_id': f"{ns}:{key}"},
+            {'$set': {'ns': ns, 'value': value, 'updated_at': time.time()}},
+            upsert=True
+        )
+
+    async def delete_state(self, ns, key):
+        if not self.enabled:
+            await self.backend.delete_state(ns, key)
+            return
+        await self.state.delete_one({'_id': f"{ns}:{key}"})
+
+    async def list_state(self, ns):
+        if not self.enabled:
+            return await self.backend.list_state(ns)
+        return [doc['value'] async for doc in self.state.find({'ns': ns}).sort('updated_at', 1)]
+
+    async def claim_state(self, ns, key, owner, stale_before):
+        """Atomically take over a state document whose 'heartbeat' is older
+        than stale_before: its owner and heartbeat are set in the same
+        conditional write. Returns the claimed value, or None if it does not
+        exist or someone else holds it."""
+        if not self.enabled:
+            return await self.backend.claim_state(ns, key, owner, stale_before)
+        now = time.time()
+        doc = await self.state.find_one_and_update(
+            {'_id': f"{ns}:{key}", 'value.heartbeat': {'$not': {'$gte': stale_before}}},
+            {'$set': {'value.owner': owner, 'value.heartbeat': now, 'updated_at': now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc['value'] if doc else None
+
+    async def set_state_if(self, ns, key, value, expect):
+        """Replace a state document only while every field in expect still
+        has that value in the stored one. Returns whether it was written."""
+        if not self.enabled:
+            return await self.backend.set_state_if(ns, key, value, expect)
+        res = await self.state.update_one(
+            {'_id': f"{ns}:{key}", **{f'value.{k}': v for k, v in expect.items()}},
+            {'$set': {'value': value, 'updated_at': time.time()}}
+        )
+        return res.matched_count > 0
@@ -0,0 +1,103 @@
+"""
+Per-chat forum scan index for incremental /fbatch runs.
+
+After a scan, the chat's index is stored in the 'fscan' state namespace
+under the chat id:
+
+    {
+        "topic_lo": 5, "topic_hi": 900,   # topic ids the index is complete for
+        "watermark": 18250,               # every message up to here is folded in
+        "topics": {"12": {"name": "Season 1", "min": 14, "max": 17980}, ...},
+        "updated_at": ...
+    }
+
+Topic bounds only grow at the top: a message above the watermark can only
+raise a topic's max, and a topic created above the watermark has all of
+its messages above it. So a later /fbatch whose topics are covered scans
+just (watermark, latest] and folds that in. The index covers topic ids in
+[topic_lo, topic_hi] plus every topic created after the watermark; a range
+reaching outside that gets a full scan, which rebuilds the index.
+
+Deleted messages are not noticed: a topic whose last message was deleted
+keeps its old max until the index is rebuilt.
+"""
+import time
+from typing import Dict, Optional
+
+
+NS = "fscan"
+
+
+def build(topics: Dict[int, dict], topic_lo: int, topic_hi: int, watermark: int) -> dict:
+    """A fresh index from a full scan of [topic_lo, topic_hi] up to watermark."""
+    return {
+        'topic_lo': topic_lo,
+        'topic_hi': topic_hi,
+        'watermark': watermark,
+        'topics': {
+            str(tid): {'name': info['name'], 'min': info['min'], 'max': info['max']}
+            for tid, info in topics.items()
+        },
+    }
+
+
+async def load(db, chat_id: int) -> Optional[dict]:
+    return await db.get_state(NS, str(chat_id))
+
+
+async def save(db, chat_id: int, index: dict):
+    index['updated_at'] = time.time()
+    await db.set_state(NS, str(chat_id), index)
+
+
+def covers(index: Optional[dict], start_topic: int, end_topic: int) -> bool:
+    """Whether every topic in [start_topic, end_topic] is tracked by index."""
+    if not index or start_topic < index['topic_lo']:
+        return False
+    return end_topic <= index['topic_hi'] or index['topic_hi'] >= index['watermark']
+
+
+def tracks(index: dict, topic_id: int) -> bool:
+    if topic_id < index['topic_lo']:
+        return False
+    return topic_id <= index['topic_hi'] or topic_id > index['watermark']
+
+
+def fold(index: dict, bounds: Dict[int, list], names: Dict[int, str], watermark: int):
+    """Merge a scan of (index watermark, watermark] into index."""
+    topics = index['topics']
+    for tid, (lo, hi) in bounds.items():
+        if not tracks(index, tid):
+            continue
+        entry = topics.setdefault(str(tid), {'name': None, 'min': None, 'max': None})
+        entry['min'] = lo if entry['min'] is None else min(entry['min'], lo)
+        entry['max'] = hi if entry['max'] is None else max(entry['max'], hi)
+    for tid, name in names.items():
+        if tracks(index, tid):
+            topics.setdefault(str(tid), {'name': None, 'min': None, 'max': None})['name'] = name
+    # Topics created above the old watermark are now covered as well
+    if index['topic_hi'] >= index['watermark']:
+        index['topic_hi'] = max(index['topic_hi'], watermark)
+    index['watermark'] = max(index['watermark'], watermark)
+
+
+def topics_in(index: dict, start_topic: int, end_topic: int) -> Dict[int, dict]:
+    """Topics in [start_topic, end_topic] that hold content, in the scan result shape."""
+    return {
+        int(tid): dict(entry)
+        for tid, entry in index['topics'].items()
+        if start_topic <= int(tid) <= end_topic and entry['min'] is not None
+    }
+
+
+def names(index: Optional[dict]) -> Dict[int, str]:
+    if not index:
+        return {}
+    return {int(tid): entry['name'] for tid, entry in index['topics'].items() if entry['name']}
+
+
+def set_names(index: dict, found: Dict[int, str]):
+    for tid, name in found.items():
+        entry = index['topics'].get(str(tid))
+        if entry is not None:
+            entry['name'] = name
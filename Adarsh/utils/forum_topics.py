@@ -0,0 +1,145 @@
+"""
+Forum topic discovery through the topics API instead of history scans.
+
+    topics = await discover(client, chat_id, start_topic, end_topic)
+    # {topic_id: {'min': first msg, 'max': last msg, 'name': title}} or None
+
+- channels.GetForumTopics lists the forum's topics with id, title and top
+  message, 100 per call.
+- Each topic in [start_topic, end_topic] then costs two
+  messages.GetReplies calls on its thread: one from the newest end for the
+  last content message, one from the topic's creation message upwards for
+  the first. Service messages (topic created/edited, pins) are skipped the
+  way the history scan skips them, which can cost an extra page.
+- FloodWait is slept through.
+
+A 500-topic forum costs about 5 + 2 * (topics in range) calls, however
+many messages it holds.
+
+discover() returns None when Telegram refuses these methods (for example
+to a bot account, or for a chat that is not a forum), so the caller can
+fall back to scanning history.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Tuple
+from pyrogram import raw
+from pyrogram.errors import FloodWait, RPCError
+
+
+log = logging.getLogger("forum.topics")
+
+PAGE = 100
+
+
+async def _invoke(client, query, retries: int = 3):
+    for attempt in range(retries + 1):
+        try:
+            return await client.invoke(query)
+        except FloodWait as e:
+            if attempt == retries:
+                raise
+            log.info(f"FloodWait {e.value}s on {type(query).__name__}")
+            await asyncio.sleep(e.value + 1)
+
+
+def _is_content(msg) -> bool:
+    return isinstance(msg, raw.types.Message) and bool(msg.message or msg.media)
+
+
+async def list_topics(client, channel) -> Dict[int, dict]:
+    """Every live topic of channel (an InputChannel) as {id: {'title', 'top_message'}}."""
+    topics: Dict[int, dict] = {}
+    offset_date = offset_id = offset_topic = 0
+    while True:
+        page = await _invoke(client, raw.functions.channels.GetForumTopics(
+            channel=channel, offset_date=offset_date, offset_id=offset_id,
+            offset_topic=offset_topic, limit=PAGE,
+        ))
+        listed = [t for t in page.topics if isinstance(t, raw.types.ForumTopic)]
+        new = [t for t in listed if t.id not in topics]
+        for topic in new:
+            topics[topic.id] = {"title": topic.title, "top_message": topic.top_message}
+        if not new or len(page.topics) < PAGE or len(topics) >= page.count:
+            return topics
+        # The next page starts after the last topic of this one
+        last = listed[-1]
+        dates = {m.id: m.date for m in page.messages if isinstance(m, (raw.types.Message, raw.types.MessageService))}
+        offset_topic, offset_id, offset_date = last.id, last.top_message, dates.get(last.top_message, 0)
+
+
+async def _thread_page(client, peer, topic_id: int, offset_id: int, add_offset: int) -> list:
+    result = await _invoke(client, raw.functions.messages.GetReplies(
+        peer=peer, msg_id=topic_id, offset_id=offset_id, offset_date=0,
+        add_offset=add_offset, limit=PAGE, max_id=0, min_id=0, hash=0,
+    ))
+    return [m for m in getattr(result, "messages", []) if not isinstance(m, raw.types.MessageEmpty)]
+
+
+async def topic_bounds(client, peer, topic_id: int, max_pages: int = 10) -> Optional[Tuple[int, int]]:
+    """(first, last) content message ids of a topic, or None if it has none."""
+    last = None
+    offset_id = 0
+    for _ in range(max_pages):
+        page = await _thread_page(client, peer, topic_id, offset_id, 0)
+        content = [m.id for m in page if _is_content(m)]
+        if content:
+            last = max(content)
+            break
+        if len(page) < PAGE:
+            return None
+        offset_id = min(m.id for m in page)
+    if last is None:
+        return None
+
+    # A negative add_offset turns the window around: the messages just above offset_id
+    offset_id = topic_id
+    for _ in range(max_pages):
+        page = await _thread_page(client, peer, topic_id, offset_id, -PAGE)
+        content = [m.id for m in page if _is_content(m) and m.id > topic_id]
+        if content:
+            return min(content), last
+        if len(page) < PAGE:
+            break
+        offset_id = max(m.id for m in page)
+    return last, last
+
+
+async def discover(client, chat_id: int, start_topic: int, end_topic: int,
+                   on_topic: Callable[[int, int], None] = None,
+                   concurrency: int = 4) -> Optional[Dict[int, dict]]:
+    """Topics with ids in [start_topic, end_topic] that hold content, or None if the API is refused."""
+    try:
+        peer = await client.resolve_peer(chat_id)
+        if not isinstance(peer, raw.types.InputPeerChannel):
+            return None
+        listed = await list_topics(client, raw.types.InputChannel(
+            channel_id=peer.channel_id, access_hash=peer.access_hash,
+        ))
+    except RPCError as e:
+        log.info(f"Topic listing unavailable for {chat_id} ({e}); falling back to history")
+        return None
+
+    wanted = sorted(tid for tid in listed if start_topic <= tid <= end_topic)
+    topics: Dict[int, dict] = {}
+    gate = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def read(tid: int):
+        nonlocal done
+        async with gate:
+            bounds = await topic_bounds(client, peer, tid)
+        if bounds:
+            topics[tid] = {"min": bounds[0], "max": bounds[1], "name": listed[tid]["title"]}
+        done += 1
+        if on_topic is not None:
+            on_topic(done, len(wanted))
+
+    results = await asyncio.gather(*(read(tid) for tid in wanted), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        if isinstance(errors[0], RPCError):
+            log.info(f"Topic threads unavailable for {chat_id} ({errors[0]}); falling back to history")
+            return None
+        raise errors[0]
+    return topics
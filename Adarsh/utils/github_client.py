@@ -0,0 +1,211 @@
+"""
+Shared GitHub REST client.
+
+Every GitHub call in the bot and the web server goes through `github`:
+
+    resp = await github.request("GET", "/repos/owner/repo/git/trees/HEAD", token)
+    if resp.ok: use resp.data
+
+- One pooled aiohttp session, so calls reuse TLS connections.
+- GETs are conditional: the last ETag for (token, url) is sent as
+  If-None-Match and a 304 is answered from the cached body. GitHub does not
+  count 304s against the rate limit.
+- 429s and rate-limit 403s are retried after Retry-After, or after
+  X-RateLimit-Reset once the quota is spent; other waits use exponential
+  backoff with jitter. 5xx and connection errors are retried the same way.
+  A wait longer than `max_delay` is not slept; the response is returned.
+  Callers answering a web request pass a smaller max_retries, max_delay
+  and timeout, so one page load cannot sleep for minutes.
+- X-RateLimit-* headers are recorded per token and resource, and a spent
+  quota makes the next call wait for the reset instead of failing.
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+import aiohttp
+
+
+log = logging.getLogger("github.client")
+
+API = "https://api.github.com"
+
+
+class GitHubResponse:
+    __slots__ = ("status", "data", "text", "headers", "from_cache")
+
+    def __init__(self, status: int, text: str, headers: dict, from_cache: bool = False):
+        self.status = status
+        self.text = text
+        self.headers = headers
+        self.from_cache = from_cache
+        self.data = None
+        if text and headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                self.data = json.loads(text)
+            except ValueError:
+                pass
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (200, 201)
+
+
+def _fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:8] if token else "anonymous"
+
+
+class GitHubClient:
+    def __init__(self, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 60,
+                 timeout: float = 30, connections: int = 20, etag_cache: int = 256):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.connections = connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._etags: "OrderedDict[tuple, tuple]" = OrderedDict()    # (token, url) -> (etag, text, headers)
+        self._etag_max = etag_cache
+        self.quota: Dict[str, dict] = {}                             # "token/resource" -> limits
+        self.stats = dict(requests=0, retries=0, not_modified=0, rate_limited=0, errors=0)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "Accept": "application/vnd.github.v3+json",
+                    "User-Agent": "StreamBot/1.0",
+                },
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ── Rate-limit bookkeeping ───────────────────────────────────────────
+
+    def _record_quota(self, token: str, headers) -> Optional[dict]:
+        if "X-RateLimit-Remaining" not in headers:
+            return None
+        key = f"{_fingerprint(token)}/{headers.get('X-RateLimit-Resource', 'core')}"
+        try:
+            entry = {
+                "limit": int(headers.get("X-RateLimit-Limit", 0)),
+                "remaining": int(headers["X-RateLimit-Remaining"]),
+                "used": int(headers.get("X-RateLimit-Used", 0)),
+                "reset": int(headers.get("X-RateLimit-Reset", 0)),
+            }
+        except ValueError:
+            return None
+        self.quota[key] = entry
+        return entry
+
+    def _quota_wait(self, token: str) -> float:
+        """Seconds until a spent core quota for token resets, else 0."""
+        entry = self.quota.get(f"{_fingerprint(token)}/core")
+        if entry and entry["remaining"] == 0:
+            return max(0.0, entry["reset"] - time.time())
+        return 0.0
+
+    def _backoff(self, attempt: int, max_delay: float) -> float:
+        return min(max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _limited_delay(self, status: int, headers, text: str, attempt: int, max_delay: float) -> Optional[float]:
+        """Wait before retrying a rate-limited response, or None if it is not one."""
+        if status not in (403, 429):
+            return None
+        if "Retry-After" in headers:
+            try:
+                return float(headers["Retry-After"])
+            except ValueError:
+                pass
+        if headers.get("X-RateLimit-Remaining") == "0":
+            return max(1.0, float(headers.get("X-RateLimit-Reset", 0)) - time.time())
+        if status == 429 or "rate limit" in text.lower():
+            # Secondary limit without headers: GitHub asks for at least a minute
+            return max(60.0, self._backoff(attempt, max_delay))
+        return None
+
+    # ── Requests ─────────────────────────────────────────────────────────
+
+    async def request(self, method: str, url: str, token: str = None, payload: dict = None,
+                      params: dict = None, conditional: bool = True, max_retries: int = None,
+                      max_delay: float = None, timeout: float = None) -> GitHubResponse:
+        """Send one API call with retries. url may be a path under api.github.com.
+
+        max_retries, max_delay and timeout override the client's defaults for this call.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        max_delay = self.max_delay if max_delay is None else max_delay
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout is not None else None
+        if url.startswith("/"):
+            url = API + url
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        cache_key = (_fingerprint(token), url, tuple(sorted((params or {}).items())))
+        cached = self._etags.get(cache_key) if method == "GET" and conditional else None
+        if cached:
+            headers["If-None-Match"] = cached[0]
+
+        attempt = 0
+        while True:
+            wait = self._quota_wait(token)
+            if wait > max_delay:
+                return GitHubResponse(403, f"GitHub rate limit exhausted; resets in {wait:.0f}s", {})
+            if wait:
+                log.warning(f"GitHub quota spent, waiting {wait:.0f}s for reset")
+                await asyncio.sleep(wait)
+
+            self.stats["requests"] += 1
+            try:
+                async with self._get_session().request(method, url, headers=headers, json=payload,
+                                                       params=params, timeout=request_timeout) as resp:
+                    text = await resp.text()
+                    status, resp_headers = resp.status, resp.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.stats["errors"] += 1
+                if attempt >= max_retries:
+                    raise
+                delay = self._backoff(attempt, max_delay)
+                log.warning(f"GitHub {method} {url} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+            else:
+                self._record_quota(token, resp_headers)
+                if status == 304 and cached:
+                    self.stats["not_modified"] += 1
+                    self._etags.move_to_end(cache_key)
+                    return GitHubResponse(200, cached[1], cached[2], from_cache=True)
+
+                delay = self._limited_delay(status, resp_headers, text, attempt, max_delay)
+                if delay is not None:
+                    self.stats["rate_limited"] += 1
+                elif status >= 500:
+                    delay = self._backoff(attempt, max_delay)
+                else:
+                    response = GitHubResponse(status, text, resp_headers)
+                    if method == "GET" and status == 200 and "ETag" in resp_headers:
+                        self._etags[cache_key] = (resp_headers["ETag"], text, response.headers)
+                        self._etags.move_to_end(cache_key)
+                        while len(self._etags) > self._etag_max:
+                            self._etags.popitem(last=False)
+                    return response
+
+                if attempt >= max_retries or delay > max_delay:
+                    return GitHubResponse(status, text, resp_headers)
+                log.warning(f"GitHub {method} {url} returned {status}, retrying in {delay:.1f}s")
+
+            self.stats["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "etags": len(self._etags), "quota": dict(self.quota)}
+
+
+github = GitHubClient()
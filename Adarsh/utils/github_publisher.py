@@ -0,0 +1,210 @@
+"""
+Single-commit publishing through the GitHub Git Data API.
+
+The contents API costs a GET plus a PUT per file and makes one commit per
+file. A publisher instead stages blobs (created in parallel as soon as they
+are staged) and writes everything staged with one tree and one commit:
+
+    publisher = GitHubPublisher("owner", "repo", token)
+    await publisher.stage("folder/a.json", json_text)
+    await publisher.stage("folder/a.html", html_text)
+    ok, error = await publisher.commit("Add 2 subjects")
+
+That is one call per file plus four per commit (ref, base commit, tree,
+commit, with the ref update retried on a non-fast-forward), and the files
+land atomically.
+
+For producers that each want a URL back (thumbnails), publish() joins the
+file to a group commit: files published within `linger` seconds of each
+other share one commit, and every caller gets its result once it lands.
+If that commit fails, the group's files are unstaged along with the error,
+so they never land silently with a later group.
+"""
+import base64
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+from Adarsh.utils.github_client import github
+
+
+log = logging.getLogger("github.publisher")
+
+
+class GitHubError(RuntimeError):
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def describe(status: int, text: str, repo: str) -> str:
+    """Human readable reason for a failed GitHub call."""
+    if status == 401:
+        return "GitHub token is invalid or expired (401 Unauthorized)"
+    if status == 403:
+        return f"GitHub 403 Forbidden — token likely missing 'repo' write scope.\nRepo: {repo}\nDetail: {text[:300]}"
+    if status == 404:
+        return f"GitHub 404 — repo '{repo}' not found or token has no access to it."
+    if status == 409:
+        return f"GitHub 409 — repo '{repo}' is empty; push an initial commit first."
+    if status == 422:
+        return f"GitHub 422 Unprocessable — possibly wrong branch.\nDetail: {text[:300]}"
+    return f"HTTP {status}\nRepo: {repo}\nResponse: {text[:400]}"
+
+
+class GitHubPublisher:
+    def __init__(self, owner: str, repo: str, token: str, branch: str = None,
+                 blob_concurrency: int = 8, linger: float = 2.0, ref_retries: int = 3):
+        self.owner = owner
+        self.repo = repo
+        self.token = token
+        self.branch = branch
+        self.linger = linger
+        self.ref_retries = ref_retries
+        self._blobs = asyncio.Semaphore(blob_concurrency)
+        self._commit_lock = asyncio.Lock()
+        self._staged: Dict[str, str] = {}            # path -> blob sha
+        self._group: Optional[asyncio.Future] = None
+        self._group_messages: List[str] = []
+        self._group_files: Dict[str, str] = {}       # path -> blob sha, for the open group
+        self._flushes = set()                        # running _flush_group tasks
+        self.commits = 0
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner}/{self.repo}"
+
+    def raw_url(self, path: str) -> str:
+        return f"https://raw.githubusercontent.com/{self.owner}/{self.repo}/{self.branch or 'main'}/{path}"
+
+    @property
+    def pending(self) -> int:
+        return len(self._staged)
+
+    # ── HTTP ─────────────────────────────────────────────────────────────
+
+    async def _call(self, method: str, path: str, payload: dict = None) -> dict:
+        # The branch head must be read fresh each time; everything else may be revalidated
+        resp = await github.request(method, f"/repos/{self.owner}/{self.repo}{path}", self.token,
+                                    payload=payload, conditional=not path.startswith("/git/ref/"))
+        if resp.ok:
+            return resp.data
+        raise GitHubError(describe(resp.status, resp.text, self.full_name), resp.status)
+
+    async def _resolve_branch(self):
+        if not self.branch:
+            self.branch = (await self._call("GET", ""))["default_branch"]
+
+    # ── Staging ──────────────────────────────────────────────────────────
+
+    async def stage(self, path: str, content: Union[str, bytes]) -> Tuple[bool, Optional[str]]:
+        """Create the blob for path now; it is written by the next commit().
+
+        Returns (True, None) or (False, error_detail).
+        """
+        if not self.token:
+            return False, "GitHub token is empty or not set"
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        try:
+            async with self._blobs:
+                blob = await self._call("POST", "/git/blobs", {
+                    "content": base64.b64encode(data).decode("ascii"),
+                    "encoding": "base64",
+                })
+        except GitHubError as e:
+            return False, str(e)
+        except Exception as e:
+            return False, f"Exception during upload: {type(e).__name__}: {e}"
+        self._staged[path] = blob["sha"]
+        return True, None
+
+    async def commit(self, message: str) -> Tuple[bool, Optional[str]]:
+        """Write every staged blob with one tree and one commit.
+
+        Returns (True, None) or (False, error_detail). On failure the files
+        stay staged, so a later commit() retries them.
+        """
+        async with self._commit_lock:
+            if not self._staged:
+                return True, None
+            staged, self._staged = self._staged, {}
+            try:
+                await self._resolve_branch()
+                tree = [{"path": path, "mode": "100644", "type": "blob", "sha": sha}
+                        for path, sha in staged.items()]
+                for attempt in range(self.ref_retries + 1):
+                    ref = await self._call("GET", f"/git/ref/heads/{self.branch}")
+                    head = ref["object"]["sha"]
+                    base = await self._call("GET", f"/git/commits/{head}")
+                    new_tree = await self._call("POST", "/git/trees", {"base_tree": base["tree"]["sha"], "tree": tree})
+                    new_commit = await self._call("POST", "/git/commits", {
+                        "message": message, "tree": new_tree["sha"], "parents": [head],
+                    })
+                    try:
+                        await self._call("PATCH", f"/git/refs/heads/{self.branch}", {"sha": new_commit["sha"]})
+                        break
+                    except GitHubError as e:
+                        # 422: someone else moved the branch; rebuild on the new head
+                        if e.status != 422 or attempt == self.ref_retries:
+                            raise
+                        log.info(f"{self.full_name}@{self.branch} moved, retrying commit")
+            except Exception as e:
+                for path, sha in staged.items():
+                    self._staged.setdefault(path, sha)
+                if isinstance(e, GitHubError):
+                    return False, str(e)
+                return False, f"Exception during commit: {type(e).__name__}: {e}"
+            self.commits += 1
+            log.info(f"Committed {len(staged)} files to {self.full_name}@{self.branch}: {message}")
+            return True, None
+
+    def staged_files(self, paths) -> Dict[str, str]:
+        """Blob shas staged for paths, so they can be restage()d after a restart."""
+        return {path: self._staged[path] for path in paths if path in self._staged}
+
+    def restage(self, files: Dict[str, str]):
+        """Stage blobs created earlier without uploading them again."""
+        self._staged.update(files)
+
+    # ── Group commits ────────────────────────────────────────────────────
+
+    async def publish(self, path: str, content: Union[str, bytes], message: str) -> str:
+        """Stage path, wait for the group commit containing it, return its raw URL."""
+        ok, error = await self.stage(path, content)
+        if not ok:
+            raise GitHubError(error)
+        if self._group is None:
+            self._group = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(self._flush_group(self._group))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        self._group_messages.append(message)
+        self._group_files[path] = self._staged[path]
+        ok, error = await asyncio.shield(self._group)
+        if not ok:
+            raise GitHubError(error)
+        return self.raw_url(path)
+
+    def _close_group(self) -> Tuple[Dict[str, str], List[str]]:
+        # Files published from here on start the next group
+        self._group = None
+        files, self._group_files = self._group_files, {}
+        messages, self._group_messages = self._group_messages, []
+        return files, messages
+
+    async def _flush_group(self, group: asyncio.Future):
+        files: Dict[str, str] = {}
+        result = (False, "Group commit was interrupted")
+        try:
+            await asyncio.sleep(self.linger)
+            files, messages = self._close_group()
+            message = messages[0] if len(messages) == 1 else f"Add {len(messages)} files\n\n" + "\n".join(messages)
+            result = await self.commit(message)
+        finally:
+            if self._group is group:
+                files, _ = self._close_group()
+            if not result[0]:
+                # Callers get the error, so their blobs must not ride along with a later commit
+                for path, sha in files.items():
+                    if self._staged.get(path) == sha:
+                        del self._staged[path]
+            group.set_result(result)
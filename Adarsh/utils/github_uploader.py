@@ -1,8 +1,17 @@
-import base64
-import aiohttp
 import logging
 import secrets
-from pathlib import Path
+from Adarsh.utils.github_publisher import GitHubPublisher
+
+
+# (owner, repo, token) -> publisher; thumbnails from every batch share its group commits
+_publishers = {}
+
+
+def _publisher(repo_owner: str, repo_name: str, github_token: str) -> GitHubPublisher:
+    key = (repo_owner, repo_name, github_token)
+    if key not in _publishers:
+        _publishers[key] = GitHubPublisher(repo_owner, repo_name, github_token)
+    return _publishers[key]
 
 
 async def upload_image_to_github(
@@ -15,6 +24,9 @@ async def upload_image_to_github(
 ) -> str:
     """
     Upload an image to GitHub repository and return the raw URL.
+
+    Images uploaded within a couple of seconds of each other are written
+    with a single commit (see GitHubPublisher.publish).
     
     Args:
         image_path: Path to the image file to upload
@@ -39,46 +51,12 @@ async def upload_image_to_github(
         image_filename = f"{sanitized_title}_{unique_suffix}.jpg"
         
         github_path = f"{folder_name}/{image_filename}"
-        
-        api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{github_path}"
-        
-        content_encoded = base64.b64encode(image_data).decode('utf-8')
-        
-        headers = {
-            "Authorization": f"Bearer {github_token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            sha = None
-            async with session.get(api_url, headers=headers) as resp_get:
-                if resp_get.status == 200:
-                    data = await resp_get.json()
-                    sha = data.get('sha')
-                elif resp_get.status != 404:
-                    text = await resp_get.text()
-                    logging.warning(f"GitHub GET returned {resp_get.status}: {text}")
-            
-            payload = {
-                "message": f"Add thumbnail: {image_filename}",
-                "content": content_encoded
-            }
-            if sha:
-                payload["sha"] = sha
-            
-            async with session.put(api_url, headers=headers, json=payload) as resp_put:
-                if resp_put.status in (200, 201):
-                    data = await resp_put.json()
-                    
-                    raw_url = f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/main/{github_path}"
-                    
-                    logging.info(f"Successfully uploaded thumbnail to GitHub: {raw_url}")
-                    return raw_url
-                else:
-                    text = await resp_put.text()
-                    error_msg = f"GitHub upload failed with status {resp_put.status}: {text}"
-                    logging.error(error_msg)
-                    raise RuntimeError(error_msg)
+
+        raw_url = await _publisher(repo_owner, repo_name, github_token).publish(
+            github_path, image_data, f"Add thumbnail: {image_filename}"
+        )
+        logging.info(f"Successfully uploaded thumbnail to GitHub: {raw_url}")
+        return raw_url
         
     except Exception as e:
         logging.error(f"Error uploading image to GitHub: {e}")
@@ -0,0 +1,141 @@
+"""
+Chat history scan over a message id range, sharded across clients.
+
+    scanner = HistoryScanner(clients, chat_id, key=topic_of)
+    bounds = await scanner.scan(start_id, end_id)
+    # {key: [first msg id, last msg id]} for every message key() accepted
+
+- [start_id, end_id] is cut into `shards_per_client` shards per client.
+  Every client runs a worker that takes the next shard from a shared queue
+  and pages it newest→oldest with get_chat_history, `delay` seconds between
+  its pages. Spare shards keep fast clients busy while slow ones finish.
+- FloodWait only pauses the worker that got it; the others keep scanning.
+- A client that cannot read the chat is dropped and its shard goes back in
+  the queue. If the last client fails a shard, that shard is skipped and
+  counted in `failed`.
+- Each shard folds its messages into its own bounds, and the shards are
+  merged once all of them are done.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from pyrogram.errors import FloodWait
+
+
+log = logging.getLogger("history.scanner")
+
+
+def split(start_id: int, end_id: int, parts: int) -> List[Tuple[int, int]]:
+    """[start_id, end_id] as at most `parts` contiguous (lo, hi) shards, newest first."""
+    size = max(1, -(-(end_id - start_id + 1) // max(1, parts)))
+    shards = [(lo, min(lo + size - 1, end_id)) for lo in range(start_id, end_id + 1, size)]
+    return shards[::-1]
+
+
+def merge(into: Dict[Hashable, list], bounds: Dict[Hashable, list]) -> Dict[Hashable, list]:
+    for key, (lo, hi) in bounds.items():
+        if key in into:
+            into[key][0] = min(into[key][0], lo)
+            into[key][1] = max(into[key][1], hi)
+        else:
+            into[key] = [lo, hi]
+    return into
+
+
+class HistoryScanner:
+    def __init__(self, clients: Dict[int, object], chat_id: int,
+                 key: Callable[[object], Optional[Hashable]],
+                 page_size: int = 100, delay: float = 0.4, shards_per_client: int = 4,
+                 on_page: Callable[["HistoryScanner"], None] = None):
+        self.clients = dict(clients)
+        self.chat_id = chat_id
+        self.key = key
+        self.page_size = page_size
+        self.delay = delay
+        self.shards_per_client = max(1, shards_per_client)
+        self.on_page = on_page
+        self.shards = 0
+        self.done = 0
+        self.failed = 0
+        self.scanned = 0
+        self.flood_waits = 0
+
+    async def _page(self, client, offset_id: int, lo: int) -> list:
+        while True:
+            page = []
+            try:
+                async for msg in client.get_chat_history(
+                    self.chat_id, limit=self.page_size, offset_id=offset_id
+                ):
+                    page.append(msg)
+                    if msg.id <= lo:
+                        break
+                return page
+            except FloodWait as e:
+                self.flood_waits += 1
+                log.info(f"FloodWait {e.value}s scanning {self.chat_id} below {offset_id}")
+                await asyncio.sleep(e.value + 1)
+
+    async def _scan_shard(self, client, lo: int, hi: int) -> Dict[Hashable, list]:
+        bounds: Dict[Hashable, list] = {}
+        offset_id = hi + 1
+        while offset_id > lo:
+            page = await self._page(client, offset_id, lo)
+            if not page:
+                break
+            for msg in page:
+                if msg.id < lo:
+                    continue
+                self.scanned += 1
+                key = self.key(msg)
+                if key is None:
+                    continue
+                if key in bounds:
+                    bounds[key][0] = min(bounds[key][0], msg.id)
+                    bounds[key][1] = max(bounds[key][1], msg.id)
+                else:
+                    bounds[key] = [msg.id, msg.id]
+            if self.on_page is not None:
+                self.on_page(self)
+            offset_id = page[-1].id
+            if offset_id > lo:
+                await asyncio.sleep(self.delay)
+        return bounds
+
+    async def scan(self, start_id: int, end_id: int) -> Dict[Hashable, list]:
+        if end_id < start_id or not self.clients:
+            return {}
+        queue: asyncio.Queue = asyncio.Queue()
+        for shard in split(start_id, end_id, len(self.clients) * self.shards_per_client):
+            queue.put_nowait(shard)
+        self.shards = queue.qsize()
+        alive = set(self.clients)
+        results: List[Dict[Hashable, list]] = []
+
+        async def worker(index: int):
+            client = self.clients[index]
+            while index in alive:
+                try:
+                    lo, hi = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    results.append(await self._scan_shard(client, lo, hi))
+                except Exception as e:
+                    if len(alive) > 1:
+                        alive.discard(index)
+                        log.warning(f"Client {index} dropped from history scan of {self.chat_id}: {e}")
+                        queue.put_nowait((lo, hi))
+                        return
+                    log.warning(f"History shard {lo}-{hi} of {self.chat_id} failed: {e}")
+                    self.failed += 1
+                self.done += 1
+
+        # A dropped client may requeue its shard after the others ran dry
+        while not queue.empty() and alive:
+            await asyncio.gather(*(worker(index) for index in sorted(alive)))
+
+        merged: Dict[Hashable, list] = {}
+        for bounds in results:
+            merge(merged, bounds)
+        return merged
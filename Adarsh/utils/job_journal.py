@@ -0,0 +1,145 @@
+"""
+Journal of long-running admin jobs (/batch, /fwd) for resuming after a restart.
+
+Each job is one document in the 'jobs' state namespace (Mongo, or the
+embedded store without DATABASE_URL):
+
+    {
+        "id": "a1b2c3", "kind": "batch", "chat_id": ..., "message_id": ...,
+        "definition": {...},          # everything needed to start the job again
+        "subjects": {"1": {...}},     # per-subject state, owned by the runner
+        "cursor": ...,                # runner-defined progress marker
+        "owner": "<instance>", "heartbeat": 1700000000.0, "started_at": ...
+    }
+
+Runners save the job at their own chunk boundaries; while a job is active
+the journal also refreshes its heartbeat every `heartbeat` seconds. On
+startup resume_all() hands every job whose heartbeat is older than
+`stale_after` to the runner registered for its kind. A job with a fresh
+heartbeat may still belong to a live process, so it is checked again once
+it could have gone stale. Finished jobs are deleted.
+"""
+import time
+import asyncio
+import logging
+import secrets
+from typing import Awaitable, Callable, Dict
+from Adarsh.vars import Var
+from Adarsh.utils.database import Database
+
+
+log = logging.getLogger("jobs")
+
+NS = "jobs"
+
+
+class JobJournal:
+    def __init__(self, db, heartbeat: float = 60, stale_after: float = 180):
+        self.db = db
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self.instance = secrets.token_hex(4)
+        self.active: Dict[str, dict] = {}
+        self.runners: Dict[str, Callable[[dict], Awaitable]] = {}
+        self._beat = None
+        self._resuming = set()      # keeps resume tasks referenced while they run
+
+    def register(self, kind: str, runner: Callable[[dict], Awaitable]):
+        """runner(job) continues a job of this kind from its saved state."""
+        self.runners[kind] = runner
+
+    async def create(self, kind: str, chat_id: int, message_id: int, definition: dict) -> dict:
+        while True:
+            job_id = secrets.token_hex(3)
+            if job_id not in self.active and not await self.db.get_state(NS, job_id):
+                break
+        job = dict(
+            id=job_id, kind=kind, chat_id=chat_id, message_id=message_id,
+            definition=definition, subjects={}, cursor=None, started_at=time.time(),
+        )
+        await self.save(job)
+        return job
+
+    async def save(self, job: dict):
+        if job.get('finished'):
+            return
+        job.update(owner=self.instance, heartbeat=time.time())
+        self.active[job['id']] = job
+        self._ensure_beat()
+        try:
+            await self.db.set_state(NS, job['id'], job)
+        except Exception as e:
+            # The job itself keeps running; only its resumability suffers
+            log.warning(f"Could not save job {job['id']}: {e}")
+
+    async def finish(self, job: dict):
+        job['finished'] = True
+        self.active.pop(job['id'], None)
+        try:
+            await self.db.delete_state(NS, job['id'])
+        except Exception as e:
+            log.warning(f"Could not delete finished job {job['id']}: {e}")
+
+    # ── Heartbeat ────────────────────────────────────────────────────────
+
+    def _ensure_beat(self):
+        if self._beat is None or self._beat.done():
+            self._beat = asyncio.create_task(self._beat_forever())
+
+    async def _beat_forever(self):
+        while self.active:
+            await asyncio.sleep(self.heartbeat)
+            for job in list(self.active.values()):
+                await self.save(job)
+
+    # ── Resume ───────────────────────────────────────────────────────────
+
+    async def _claim(self, job_id: str):
+        """The stored job if it is stale (its process is gone), claimed for this one.
+
+        The staleness check and the takeover are one conditional write, so of
+        two instances racing for the same job only one gets it.
+        """
+        if job_id in self.active:
+            return None
+        job = await self.db.claim_state(NS, job_id, self.instance, time.time() - self.stale_after)
+        if job is None:
+            return None
+        await self.save(job)
+        return job
+
+    async def _resume(self, job_id: str, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        job = await self._claim(job_id)
+        if job is None:
+            return
+        runner = self.runners.get(job['kind'])
+        if runner is None:
+            log.warning(f"No runner for job {job_id} of kind {job['kind']}; leaving it")
+            self.active.pop(job_id, None)
+            return
+        log.info(f"Resuming {job['kind']} job {job_id}")
+        try:
+            await runner(job)
+        except Exception as e:
+            log.error(f"Resumed job {job_id} failed: {e}", exc_info=True)
+            self.active.pop(job_id, None)
+
+    async def resume_all(self) -> int:
+        """Start resuming every unfinished job; returns how many were found."""
+        try:
+            jobs = await self.db.list_state(NS)
+        except Exception as e:
+            log.error(f"Could not read job journal: {e}")
+            return 0
+        now = time.time()
+        for job in jobs:
+            wait = job.get('heartbeat', 0) + self.stale_after - now
+            task = asyncio.create_task(self._resume(job['id'], wait + 1 if wait > 0 else 0))
+            self._resuming.add(task)
+            task.add_done_callback(self._resuming.discard)
+        return len(jobs)
+
+
+journal = JobJournal(Database(Var.DATABASE_URL, Var.name))
@@ -0,0 +1,136 @@
+"""
+Prefetching paginator over a contiguous range of channel message ids.
+
+    async for offset, messages in paginator.pages(start_id, end_id):
+        ...
+
+- Pages are `page_size` ids (200, the get_messages maximum) and are yielded
+  in order. The next `prefetch` pages are already being fetched while the
+  caller works on the current one.
+- A page that fails on a per-message error (MESSAGE_IDS_EMPTY, a message
+  pyrogram cannot parse, ...) is split in half recursively. One bad id
+  costs about log2(page_size) extra calls, not page_size single-id calls,
+  and an id that still fails on its own comes back as None. Any other
+  failure on the primary client (it cannot read the chat, a Telegram
+  error) is not split: the whole page comes back as None. Deleted messages
+  come back as pyrogram's empty Message, like get_messages() returns them.
+- Pages are sharded round-robin across the given clients (every bot can
+  read the DB channel). A client refused access to the channel
+  (CHANNEL_INVALID, PEER_ID_INVALID, ...) is dropped and its pages go to the
+  primary client. Network errors are retried on the same client first; any
+  other failure on a secondary client sends just that page to the primary.
+- FloodWait goes through the optional RateGovernor, so all stages sharing
+  it back off together.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from pyrogram.errors import (
+    FloodWait, RPCError, ChannelInvalid, ChannelPrivate, ChannelBanned,
+    ChatAdminRequired, ChatForbidden, ChatIdInvalid, PeerIdInvalid, UserNotParticipant,
+    MessageIdsEmpty, MessageIdInvalid,
+)
+
+
+log = logging.getLogger("batch.paginator")
+
+# The client itself cannot read the chat; retrying it will not help.
+# pyrogram raises KeyError when a peer is missing from its storage.
+ACCESS_ERRORS = (
+    ChannelInvalid, ChannelPrivate, ChannelBanned, ChatAdminRequired, ChatForbidden,
+    ChatIdInvalid, PeerIdInvalid, UserNotParticipant, KeyError,
+)
+
+# Telegram errors caused by some ids of the page; splitting it isolates them
+MESSAGE_ERRORS = (MessageIdsEmpty, MessageIdInvalid)
+
+
+class MessagePaginator:
+    def __init__(self, clients: Dict[int, object], chat_id: int, page_size: int = 200,
+                 prefetch: int = 1, concurrency: int = 2, governor=None, retries: int = 2):
+        self.clients = dict(clients)
+        self.primary = min(self.clients)
+        self.chat_id = chat_id
+        self.page_size = page_size
+        self.prefetch = max(0, prefetch)
+        self.governor = governor
+        self.retries = retries
+        self._slots = asyncio.Semaphore(concurrency)
+        self._next_shard = 0
+        self._disabled = set()
+        self.calls = 0
+
+    def _shard(self) -> int:
+        usable = [idx for idx in sorted(self.clients) if idx not in self._disabled]
+        self._next_shard += 1
+        return usable[self._next_shard % len(usable)]
+
+    async def _get(self, index: int, ids: List[int]) -> list:
+        client = self.clients[index]
+
+        async def call():
+            self.calls += 1
+            return await client.get_messages(chat_id=self.chat_id, message_ids=ids)
+
+        if self.governor is not None:
+            messages = await self.governor.call(call)
+        else:
+            while True:
+                try:
+                    messages = await call()
+                    break
+                except FloodWait as e:
+                    await asyncio.sleep(e.value)
+        return messages if isinstance(messages, list) else [messages]
+
+    async def _get_retrying(self, index: int, ids: List[int]) -> list:
+        """_get, retrying network errors with backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._get(index, ids)
+            except (OSError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                log.info(f"Client {index} page fetch failed ({e}); retrying")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _fetch(self, index: int, ids: List[int]) -> List[Optional[object]]:
+        try:
+            return await self._get_retrying(index, ids)
+        except Exception as e:
+            if index != self.primary:
+                if isinstance(e, ACCESS_ERRORS):
+                    log.warning(f"Client {index} cannot read chat {self.chat_id} ({e}); using primary for its pages")
+                    self._disabled.add(index)
+                else:
+                    log.info(f"Client {index} failed a page of {self.chat_id} ({e}); fetching it with primary")
+                return await self._fetch(self.primary, ids)
+            if isinstance(e, ACCESS_ERRORS) or (isinstance(e, RPCError) and not isinstance(e, MESSAGE_ERRORS)):
+                log.warning(f"Messages {ids[0]}-{ids[-1]} of {self.chat_id} could not be fetched: {e}")
+                return [None] * len(ids)
+            if len(ids) == 1:
+                log.debug(f"Message {ids[0]} could not be fetched: {e}")
+                return [None]
+        mid = len(ids) // 2
+        return await self._fetch(index, ids[:mid]) + await self._fetch(index, ids[mid:])
+
+    async def fetch_page(self, ids: List[int]) -> List[Optional[object]]:
+        async with self._slots:
+            return await self._fetch(self._shard(), ids)
+
+    async def pages(self, start_id: int, end_id: int) -> AsyncIterator[Tuple[int, list]]:
+        """Yield (offset of the page's first id from start_id, messages) in order."""
+        pending: List[Tuple[int, asyncio.Future]] = []
+        try:
+            for page_start in range(start_id, end_id + 1, self.page_size):
+                ids = list(range(page_start, min(page_start + self.page_size, end_id + 1)))
+                pending.append((page_start, asyncio.ensure_future(self.fetch_page(ids))))
+                if len(pending) > self.prefetch:
+                    first, task = pending.pop(0)
+                    yield first - start_id, await task
+            while pending:
+                first, task = pending.pop(0)
+                yield first - start_id, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
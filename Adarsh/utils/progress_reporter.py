@@ -0,0 +1,91 @@
+"""
+Coalesced status-message updates for long admin jobs.
+
+    reporter = ProgressReporter(status_msg).start()
+    for ...:
+        reporter.update(f"{done}/{total}")      # never awaits Telegram
+    await reporter.stop("✅ Done")
+
+The producer only records the latest text. A background task edits the
+message with it at most once every `interval` seconds, skips text that is
+already shown, and absorbs FloodWait by holding off further edits for the
+requested time instead of stalling the caller. Intermediate texts that
+were superseded before the next edit are simply dropped.
+
+Instead of pushing text, a caller can pass `render`, a function the task
+calls at each tick to build the current text.
+"""
+import time
+import asyncio
+import logging
+from typing import Callable, Optional
+from pyrogram.errors import FloodWait, MessageNotModified
+
+
+log = logging.getLogger("progress")
+
+
+class ProgressReporter:
+    def __init__(self, message, interval: float = 5, render: Callable[[], str] = None):
+        self.message = message
+        self.interval = interval
+        self.render = render
+        self._text: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._changed = asyncio.Event()
+        self._hold_until = 0.0
+        self._task = None
+        self.stats = dict(edits=0, flood_waits=0, errors=0)
+
+    def update(self, text: str):
+        self._text = text
+        self._changed.set()
+
+    def start(self) -> "ProgressReporter":
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def _edit(self, text: str):
+        try:
+            await self.message.edit_text(text)
+            self.stats['edits'] += 1
+            self._shown = text
+        except MessageNotModified:
+            self._shown = text
+        except FloodWait as e:
+            self.stats['flood_waits'] += 1
+            self._hold_until = time.monotonic() + e.value
+            log.debug(f"Progress edit hit FloodWait {e.value}s; holding updates")
+        except Exception as e:
+            self.stats['errors'] += 1
+            log.debug(f"Progress edit failed: {e}")
+
+    async def _run(self):
+        while True:
+            if self.render is None:
+                await self._changed.wait()
+                self._changed.clear()
+            text = self.render() if self.render is not None else self._text
+            if text and text != self._shown:
+                await self._edit(text)
+            await asyncio.sleep(max(self.interval, self._hold_until - time.monotonic()))
+
+    async def stop(self, final_text: str = None):
+        """Stop the background task; optionally show final_text, waiting out a FloodWait."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if final_text is None or final_text == self._shown:
+            return
+        delay = self._hold_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._edit(final_text)
+        if self._shown != final_text and self._hold_until > time.monotonic():
+            await asyncio.sleep(self._hold_until - time.monotonic())
+            await self._edit(final_text)
+
+    async def flush(self):
+        """Stop, making sure the text of the last update() is shown."""
+        await self.stop(self._text)
@@ -0,0 +1,552 @@
+"""
+Embedded storage backends used by Database when no DATABASE_URL is set.
+
+Both backends expose the same async API so Database can treat them alike:
+
+    get_temp_file(token)       -> dict | None   (aliases resolved)
+    find_temp_file(file_key)   -> dict | None   (dedup lookup)
+    put_temp_file(doc)                          (insert or replace)
+    store_temp_file(doc)       -> dict          (insert unless the file_key
+                                                 exists; returns the stored record)
+    delete_temp_file(token)
+    compact_temp_files()       -> (groups_merged, records_removed)
+    flush()
+
+plus a small namespaced document store for job/checkpoint state:
+
+    get_state(ns, key) / set_state(ns, key, value) / delete_state(ns, key)
+    list_state(ns)             -> list of values
+    claim_state(ns, key, owner, stale_before) -> value | None  (atomic takeover)
+    set_state_if(ns, key, value, expect) -> bool  (write only while the stored
+                                                   value matches expect)
+
+file_key is the (file_unique_id, from_chat_id, domain) tuple, or None for
+files that cannot be deduplicated.
+"""
+import json
+import time
+import atexit
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+log = logging.getLogger("storage")
+
+
+class StorageBackend:
+    async def get_temp_file(self, token):
+        raise NotImplementedError
+
+    async def find_temp_file(self, file_key):
+        raise NotImplementedError
+
+    async def put_temp_file(self, doc):
+        raise NotImplementedError
+
+    async def store_temp_file(self, doc):
+        raise NotImplementedError
+
+    async def delete_temp_file(self, token):
+        raise NotImplementedError
+
+    async def compact_temp_files(self):
+        raise NotImplementedError
+
+    async def flush(self):
+        pass
+
+    async def get_state(self, ns, key):
+        raise NotImplementedError
+
+    async def set_state(self, ns, key, value):
+        raise NotImplementedError
+
+    async def delete_state(self, ns, key):
+        raise NotImplementedError
+
+    async def list_state(self, ns):
+        raise NotImplementedError
+
+    async def claim_state(self, ns, key, owner, stale_before):
+        raise NotImplementedError
+
+    async def set_state_if(self, ns, key, value, expect):
+        raise NotImplementedError
+
+    @staticmethod
+    def file_key(doc):
+        if not doc.get('file_unique_id'):
+            return None
+        return (doc['file_unique_id'], doc['from_chat_id'], doc.get('domain'))
+
+    @staticmethod
+    def _refresh(existing, doc) -> bool:
+        """Carry a new thumbnail over to an existing record; True if it changed."""
+        if doc.get('thumbnail_url') and existing.get('thumbnail_url') != doc['thumbnail_url']:
+            existing['thumbnail_url'] = doc['thumbnail_url']
+            return True
+        return False
+
+
+class MemoryBackend(StorageBackend):
+    """Process-local dicts. Nothing survives a restart."""
+
+    def __init__(self):
+        self._files = {}
+        self._keys = {}
+        self._aliases = {}
+        self._state = {}
+
+    async def get_temp_file(self, token):
+        data = self._files.get(token)
+        if data is None and token in self._aliases:
+            data = self._files.get(self._aliases[token])
+        return data
+
+    async def find_temp_file(self, file_key):
+        return self._files.get(self._keys.get(file_key))
+
+    async def put_temp_file(self, doc):
+        self._files[doc['token']] = doc
+        key = self.file_key(doc)
+        if key is not None:
+            self._keys.setdefault(key, doc['token'])
+
+    async def store_temp_file(self, doc):
+        # No await between the lookup and the insert, so stores cannot interleave
+        existing = self._files.get(self._keys.get(self.file_key(doc)))
+        if existing is None:
+            await self.put_temp_file(doc)
+            return doc
+        self._refresh(existing, doc)
+        return existing
+
+    async def delete_temp_file(self, token):
+        doc = self._files.pop(token, None)
+        if doc is not None and self._keys.get(self.file_key(doc)) == token:
+            del self._keys[self.file_key(doc)]
+
+    async def compact_temp_files(self):
+        survivors = {}
+        merged = {}
+        for token, data in sorted(self._files.items(), key=lambda kv: kv[1].get('created_at', 0)):
+            key = self.file_key(data)
+            if key is None:
+                continue
+            if key not in survivors:
+                survivors[key] = token
+            else:
+                merged[token] = survivors[key]
+        for token, target in merged.items():
+            del self._files[token]
+            self._aliases[token] = target
+        # Re-point aliases created by earlier compactions
+        for alias, target in self._aliases.items():
+            self._aliases[alias] = merged.get(target, target)
+        self._keys.update(survivors)
+        groups = len(set(merged.values()))
+        removed = len(merged)
+        return groups, removed
+
+    async def get_state(self, ns, key):
+        return self._state.get((ns, str(key)))
+
+    async def set_state(self, ns, key, value):
+        self._state[(ns, str(key))] = value
+
+    async def delete_state(self, ns, key):
+        self._state.pop((ns, str(key)), None)
+
+    async def list_state(self, ns):
+        return [v for (n, _), v in self._state.items() if n == ns]
+
+    async def claim_state(self, ns, key, owner, stale_before):
+        # No await between the check and the write, so claims cannot interleave
+        value = self._state.get((ns, str(key)))
+        if value is None or value.get('heartbeat', 0) >= stale_before:
+            return None
+        value.update(owner=owner, heartbeat=time.time())
+        return value
+
+    async def set_state_if(self, ns, key, value, expect):
+        stored = self._state.get((ns, str(key)))
+        if stored is None or any(stored.get(k) != v for k, v in expect.items()):
+            return False
+        self._state[(ns, str(key))] = value
+        return True
+
+
+class SQLiteBackend(StorageBackend):
+    """On-disk store in a single SQLite file (WAL mode).
+
+    Writes are buffered and committed in batches, either when batch_size
+    records are pending or flush_interval seconds after the first pending
+    write. Reads go through a bounded LRU cache, then the pending buffer,
+    then SQLite. All SQLite work runs on one dedicated thread.
+    """
+
+    def __init__(self, path, cache_size=10000, batch_size=200, flush_interval=0.5):
+        self.path = path
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._key_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._pending = {}
+        self._pending_deletes = set()
+        self._flush_task = None
+        self._lock = threading.Lock()
+        # Serializes dedup lookups and inserts within this process
+        self._store_lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS temp_files (
+                token      TEXT PRIMARY KEY,
+                file_key   TEXT,
+                created_at REAL,
+                data       TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS temp_files_file_key ON temp_files(file_key, created_at);
+            CREATE TABLE IF NOT EXISTS temp_file_aliases (
+                alias TEXT PRIMARY KEY,
+                token TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                ns         TEXT NOT NULL,
+                key        TEXT NOT NULL,
+                value      TEXT NOT NULL,
+                updated_at REAL,
+                PRIMARY KEY (ns, key)
+            );
+            """
+        )
+        # One record per file; other processes sharing the file hit it at flush time
+        try:
+            self._create_file_key_index()
+        except sqlite3.IntegrityError:
+            log.info("Compacting duplicate temp files before adding the unique file index")
+            self._compact()
+            self._create_file_key_index()
+        atexit.register(self._flush_sync)
+
+    def _create_file_key_index(self):
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS temp_files_file_key_unique "
+            "ON temp_files(file_key) WHERE file_key IS NOT NULL"
+        )
+
+    # ── helpers ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _encode_key(file_key):
+        return json.dumps(list(file_key)) if file_key is not None else None
+
+    def _remember(self, doc):
+        token = doc['token']
+        self._cache[token] = doc
+        self._cache.move_to_end(token)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        key = self.file_key(doc)
+        if key is not None:
+            # The oldest record is canonical for a key; keep the first one seen
+            self._key_cache.setdefault(key, token)
+            self._key_cache.move_to_end(key)
+            while len(self._key_cache) > self.cache_size:
+                self._key_cache.popitem(last=False)
+
+    def _forget(self, token):
+        doc = self._cache.pop(token, None)
+        if doc is not None:
+            key = self.file_key(doc)
+            if self._key_cache.get(key) == token:
+                del self._key_cache[key]
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _query_one(self, sql, params):
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # ── reads ────────────────────────────────────────────────────────────────
+
+    async def get_temp_file(self, token):
+        if token in self._pending_deletes:
+            return None
+        doc = self._pending.get(token) or self._cache.get(token)
+        if doc is not None:
+            self._remember(doc)
+            return doc
+        doc = await self._run(self._query_one, "SELECT data FROM temp_files WHERE token = ?", (token,))
+        if doc is None:
+            doc = await self._run(
+                self._query_one,
+                "SELECT t.data FROM temp_file_aliases a JOIN temp_files t ON t.token = a.token WHERE a.alias = ?",
+                (token,),
+            )
+            if doc is not None:
+                # Cache under the canonical token only; aliases are rare
+                return doc
+        if doc is not None:
+            self._remember(doc)
+        return doc
+
+    async def find_temp_file(self, file_key):
+        token = self._key_cache.get(file_key)
+        if token is not None:
+            doc = await self.get_temp_file(token)
+            if doc is not None:
+                return doc
+        for doc in self._pending.values():
+            if self.file_key(doc) == file_key:
+                return doc
+        doc = await self._run(
+            self._query_one,
+            "SELECT data FROM temp_files WHERE file_key = ? ORDER BY created_at LIMIT 1",
+            (self._encode_key(file_key),),
+        )
+        if doc is not None and doc['token'] not in self._pending_deletes:
+            self._remember(doc)
+            return doc
+        return None
+
+    # ── writes ───────────────────────────────────────────────────────────────
+
+    async def put_temp_file(self, doc):
+        token = doc['token']
+        self._pending_deletes.discard(token)
+        self._pending[token] = doc
+        self._remember(doc)
+        await self._schedule_flush()
+
+    async def store_temp_file(self, doc):
+        if self.file_key(doc) is None:
+            await self.put_temp_file(doc)
+            return doc
+        async with self._store_lock:
+            existing = await self.find_temp_file(self.file_key(doc))
+            if existing is None:
+                await self.put_temp_file(doc)
+                return doc
+            if self._refresh(existing, doc):
+                await self.put_temp_file(existing)
+            return existing
+
+    async def delete_temp_file(self, token):
+        self._pending.pop(token, None)
+        self._pending_deletes.add(token)
+        self._forget(token)
+        await self._schedule_flush()
+
+    async def _schedule_flush(self):
+        if len(self._pending) + len(self._pending_deletes) >= self.batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception:
+            log.error("Batched storage flush failed", exc_info=True)
+
+    def _take_pending(self):
+        writes, deletes = self._pending, self._pending_deletes
+        self._pending, self._pending_deletes = {}, set()
+        return writes, deletes
+
+    def _write_batch(self, writes, deletes):
+        rows = [
+            (token, self._encode_key(self.file_key(doc)), doc.get('created_at'), json.dumps(doc))
+            for token, doc in writes.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    try:
+                        self._conn.execute(
+                            "INSERT INTO temp_files (token, file_key, created_at, data) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT(token) DO UPDATE SET file_key = excluded.file_key, "
+                            "created_at = excluded.created_at, data = excluded.data",
+                            row,
+                        )
+                    except sqlite3.IntegrityError:
+                        # Another process stored this file first; our token resolves to its record
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO temp_file_aliases (alias, token) "
+                            "SELECT ?, token FROM temp_files WHERE file_key = ?",
+                            (row[0], row[1]),
+                        )
+                if deletes:
+                    self._conn.executemany("DELETE FROM temp_files WHERE token = ?", [(t,) for t in deletes])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def flush(self):
+        writes, deletes = self._take_pending()
+        if not writes and not deletes:
+            return
+        try:
+            await self._run(self._write_batch, writes, deletes)
+        except Exception:
+            # Put the batch back so the next flush retries it
+            for token, doc in writes.items():
+                self._pending.setdefault(token, doc)
+            self._pending_deletes |= deletes
+            raise
+
+    def _flush_sync(self):
+        writes, deletes = self._take_pending()
+        if writes or deletes:
+            try:
+                self._write_batch(writes, deletes)
+            except Exception:
+                log.error("Final storage flush failed", exc_info=True)
+
+    # ── maintenance ──────────────────────────────────────────────────────────
+
+    def _compact(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT token, file_key FROM temp_files WHERE file_key IS NOT NULL ORDER BY created_at"
+            ).fetchall()
+            survivors = {}
+            merged = {}
+            for token, file_key in rows:
+                if file_key not in survivors:
+                    survivors[file_key] = token
+                else:
+                    merged[token] = survivors[file_key]
+            if not merged:
+                return 0, 0
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO temp_file_aliases (alias, token) VALUES (?, ?)",
+                    list(merged.items()),
+                )
+                # Re-point aliases created by earlier compactions
+                self._conn.executemany(
+                    "UPDATE temp_file_aliases SET token = ? WHERE token = ?",
+                    [(target, dropped) for dropped, target in merged.items()],
+                )
+                self._conn.executemany("DELETE FROM temp_files WHERE token = ?", [(t,) for t in merged])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(set(merged.values())), len(merged)
+
+    async def compact_temp_files(self):
+        await self.flush()
+        groups, removed = await self._run(self._compact)
+        self._cache.clear()
+        self._key_cache.clear()
+        return groups, removed
+
+
+    # ── state (written through; checkpoints must be durable) ─────────────────
+
+    def _execute(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _query_all(self, sql, params):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def get_state(self, ns, key):
+        return await self._run(self._query_one, "SELECT value FROM state WHERE ns = ? AND key = ?", (ns, str(key)))
+
+    async def set_state(self, ns, key, value):
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO state (ns, key, value, updated_at) VALUES (?, ?, ?, strftime('%s','now'))",
+            (ns, str(key), json.dumps(value)),
+        )
+
+    async def delete_state(self, ns, key):
+        await self._run(self._execute, "DELETE FROM state WHERE ns = ? AND key = ?", (ns, str(key)))
+
+    async def list_state(self, ns):
+        return await self._run(self._query_all, "SELECT value FROM state WHERE ns = ? ORDER BY updated_at", (ns,))
+
+    def _claim_state(self, ns, key, owner, stale_before):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so other processes sharing the file wait
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM state WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+                value = json.loads(row[0]) if row else None
+                if value is None or value.get('heartbeat', 0) >= stale_before:
+                    value = None
+                else:
+                    value.update(owner=owner, heartbeat=time.time())
+                    self._conn.execute(
+                        "UPDATE state SET value = ?, updated_at = strftime('%s','now') WHERE ns = ? AND key = ?",
+                        (json.dumps(value), ns, key),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    async def claim_state(self, ns, key, owner, stale_before):
+        return await self._run(self._claim_state, ns, str(key), owner, stale_before)
+
+    def _set_state_if(self, ns, key, value, expect):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM state WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+                stored = json.loads(row[0]) if row else None
+                written = stored is not None and all(stored.get(k) == v for k, v in expect.items())
+                if written:
+                    self._conn.execute(
+                        "UPDATE state SET value = ?, updated_at = strftime('%s','now') WHERE ns = ? AND key = ?",
+                        (json.dumps(value), ns, key),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return written
+
+    async def set_state_if(self, ns, key, value, expect):
+        return await self._run(self._set_state_if, ns, str(key), value, expect)
+
+
+_backends = {}
+
+
+def get_storage_backend(kind, path=None, cache_size=10000):
+    """Return the shared backend for kind/path.
+
+    Every Database instance in the process must see the same buffered
+    writes, so backends are singletons per (kind, path).
+    """
+    key = (kind, path)
+    if key not in _backends:
+        if kind == 'memory':
+            _backends[key] = MemoryBackend()
+        elif kind == 'sqlite':
+            _backends[key] = SQLiteBackend(path, cache_size=cache_size)
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {kind!r} (expected 'sqlite' or 'memory')")
+    return _backends[key]
@@ -35,7 +35,8 @@ async def extract_video_thumbnail(video_path: str, output_path: str = None, seek
     Extract a thumbnail from a video file using ffmpeg (HIGH QUALITY mode).
 
     Args:
-        video_path: Path to the video file
+        video_path: Path to the video file, or an http(s) URL that serves byte
+            ranges (ffmpeg then only reads the parts it needs)
         output_path: Path where to save the thumbnail (optional, will auto-generate if not provided)
         seek_time: Time position to extract thumbnail from (default: 10 seconds)
 
@@ -50,7 +51,8 @@ async def extract_video_thumbnail(video_path: str, output_path: str = None, seek
             "Fix: run  sudo apt install ffmpeg  on your VPS, then restart the bot."
         )
 
-    if not os.path.exists(video_path):
+    is_url = video_path.startswith(("http://", "https://"))
+    if not is_url and not os.path.exists(video_path):
         raise FileNotFoundError(f"Video file not found: {video_path}")
 
     if output_path is None:
@@ -62,8 +64,11 @@ async def extract_video_thumbnail(video_path: str, output_path: str = None, seek
     output_dir = Path(output_path).parent
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    cmd = [
-        ffmpeg_path,
+    cmd = [ffmpeg_path]
+    if is_url:
+        # Give up on a stalled read instead of hanging the batch (microseconds)
+        cmd += ["-rw_timeout", "30000000"]
+    cmd += [
         "-ss", seek_time,
         "-i", video_path,
         "-vf", "scale=1280:-1",
@@ -0,0 +1,125 @@
+"""
+Thumbnail job queue shared by every batch.
+
+    url = await thumbnails.get(file_unique_id, client, message, folder, caption)
+
+- Results are cached by file_unique_id in process and persistently in the
+  'thumbs' state namespace (Mongo, or the embedded store without
+  DATABASE_URL). A file that was thumbnailed once, in any subject or any
+  earlier run, never costs another download, ffmpeg run or upload.
+- Concurrent requests for the same file share one job.
+- Jobs wait in a bounded queue and run on a fixed pool of workers, one
+  ffmpeg process each, so the number of encoders never exceeds the worker
+  count (the CPU count by default). A full queue makes callers wait.
+
+Failures are not cached; the next request for that file tries again.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+
+log = logging.getLogger("batch.thumbnails")
+
+_NS = "thumbs"
+
+
+class ThumbnailService:
+    def __init__(self, generate: Callable[..., Awaitable[str]], db, workers: int = None,
+                 queue_size: int = 100, memory_cache: int = 10000):
+        """
+        Args:
+            generate: coroutine producing the thumbnail URL from the args given to get()
+            db: Database, used for the persistent cache
+            workers: concurrent jobs (and ffmpeg processes); defaults to the CPU count
+        """
+        self.generate = generate
+        self.db = db
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_max = memory_cache
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool = []
+        self.stats = dict(hits=0, persisted_hits=0, shared=0, generated=0, failed=0)
+
+    def _remember(self, key: str, url: str):
+        self._cache[key] = url
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_max:
+            self._cache.popitem(last=False)
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pool = [task for task in self._pool if not task.done()]
+        while len(self._pool) < self.workers:
+            self._pool.append(asyncio.create_task(self._worker()))
+
+    async def cached(self, key: str) -> Optional[str]:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return self._cache[key]
+        try:
+            entry = await self.db.get_state(_NS, key)
+        except Exception as e:
+            log.warning(f"Thumbnail cache lookup failed for {key}: {e}")
+            entry = None
+        if entry and entry.get('url'):
+            self.stats['persisted_hits'] += 1
+            self._remember(key, entry['url'])
+            return entry['url']
+        return None
+
+    async def get(self, key: str, *args) -> str:
+        """Thumbnail URL for the file identified by key (its file_unique_id)."""
+        if key:
+            url = await self.cached(key)
+            if url:
+                return url
+            if key in self._inflight:
+                self.stats['shared'] += 1
+                return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        if key:
+            self._inflight[key] = future
+        self._ensure_workers()
+        try:
+            await self._queue.put((key, args, future))
+        except BaseException:
+            self._inflight.pop(key, None)
+            raise
+        return await asyncio.shield(future)
+
+    async def _worker(self):
+        while True:
+            key, args, future = await self._queue.get()
+            try:
+                url = await self.generate(*args)
+            except Exception as e:
+                self.stats['failed'] += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.stats['generated'] += 1
+                if key:
+                    self._remember(key, url)
+                    try:
+                        await self.db.set_state(_NS, key, {'url': url, 'created_at': time.time()})
+                    except Exception as e:
+                        log.warning(f"Could not persist thumbnail for {key}: {e}")
+                if not future.done():
+                    future.set_result(url)
+            finally:
+                if key and self._inflight.get(key) is future:
+                    del self._inflight[key]
+                # Nobody may be awaiting a failed shared job any more
+                if future.done() and not future.cancelled():
+                    future.exception()
+                self._queue.task_done()
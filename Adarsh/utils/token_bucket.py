@@ -0,0 +1,62 @@
+import time
+import asyncio
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    try_consume() is O(1) and never blocks, so it can be used from request
+    handlers; acquire() waits until enough tokens are available.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def try_consume(self, amount: float = 1) -> float:
+        """Take `amount` tokens if available.
+
+        Returns 0.0 on success, otherwise the number of seconds until the
+        bucket will hold enough tokens.
+        """
+        self._refill(time.monotonic())
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    async def acquire(self, amount: float = 1) -> None:
+        while True:
+            wait = self.try_consume(amount)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def set_rate(self, rate: float, capacity: float = None) -> None:
+        """Change the refill rate (and optionally capacity) keeping earned tokens."""
+        self._refill(time.monotonic())
+        self.rate = float(rate)
+        if capacity is not None:
+            self.capacity = float(capacity)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def idle_for(self) -> float:
+        """Seconds since the bucket was last touched."""
+        return time.monotonic() - self.updated
+
+    @property
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
@@ -94,6 +94,63 @@ class Var(object):
         return None
     
     DATABASE_URL = str(getenv('DATABASE_URL', ''))
+    # Embedded storage used when DATABASE_URL is not set: 'sqlite' (durable) or 'memory'
+    STORAGE_BACKEND = str(getenv('STORAGE_BACKEND', 'sqlite')).lower().strip()
+    STORAGE_PATH = str(getenv('STORAGE_PATH', 'streambot.db'))
+    STORAGE_CACHE_SIZE = int(getenv('STORAGE_CACHE_SIZE', '10000'))
+    SEEN_USERS_CACHE_SIZE = int(getenv('SEEN_USERS_CACHE_SIZE', '100000'))
+    # /broadcast: concurrent senders, messages per second per bot, and whether
+    # to also send through the MULTI_TOKEN bots (users must have started them)
+    BROADCAST_WORKERS = int(getenv('BROADCAST_WORKERS', '20'))
+    BROADCAST_RATE = float(getenv('BROADCAST_RATE', '25'))
+    BROADCAST_MULTI_CLIENT = os.environ.get('BROADCAST_MULTI_CLIENT', 'False') == 'True'
+    BROADCAST_CHECKPOINT_EVERY = int(getenv('BROADCAST_CHECKPOINT_EVERY', '200'))
+    # /batch pipeline: subjects in flight, per-stage concurrency, Telegram calls per second
+    BATCH_SUBJECT_CONCURRENCY = int(getenv('BATCH_SUBJECT_CONCURRENCY', '3'))
+    BATCH_FETCH_CONCURRENCY = int(getenv('BATCH_FETCH_CONCURRENCY', '2'))
+    BATCH_LINK_CONCURRENCY = int(getenv('BATCH_LINK_CONCURRENCY', '8'))
+    BATCH_UPLOAD_CONCURRENCY = int(getenv('BATCH_UPLOAD_CONCURRENCY', '4'))
+    BATCH_RATE = float(getenv('BATCH_RATE', '20'))
+    # /batch commits finished subjects every N subjects or every N seconds, whichever comes first
+    BATCH_COMMIT_EVERY = int(getenv('BATCH_COMMIT_EVERY', '10'))
+    BATCH_COMMIT_INTERVAL = float(getenv('BATCH_COMMIT_INTERVAL', '180'))
+    # Parallel blob uploads per GitHub publisher
+    GITHUB_BLOB_CONCURRENCY = int(getenv('GITHUB_BLOB_CONCURRENCY', '8'))
+    # Minimum seconds between edits of a /batch, /fbatch or /fwd status message
+    PROGRESS_EDIT_INTERVAL = float(getenv('PROGRESS_EDIT_INTERVAL', '5'))
+    # Thumbnail service: concurrent ffmpeg jobs (0 = CPU count) and queued jobs
+    THUMB_WORKERS = int(getenv('THUMB_WORKERS', '0'))
+    THUMB_QUEUE_SIZE = int(getenv('THUMB_QUEUE_SIZE', '100'))
+    # Spread /batch page fetches across every bot client (MULTI_TOKEN*)
+    BATCH_SHARD_CLIENTS = os.environ.get('BATCH_SHARD_CLIENTS', 'True') == 'True'
+    # Spread the /fbatch history scan across every bot client (each must be in the supergroup)
+    FBATCH_SHARD_CLIENTS = os.environ.get('FBATCH_SHARD_CLIENTS', 'True') == 'True'
+    # Web limits per IP (per /64 for IPv6): download-link generation and concurrent streams
+    # (defaults match the old limiter: one request per 5 s sustained, two back to back)
+    LINK_RATE_PER_MINUTE = float(getenv('LINK_RATE_PER_MINUTE', '12'))
+    LINK_BURST = int(getenv('LINK_BURST', '2'))
+    STREAMS_PER_IP = int(getenv('STREAMS_PER_IP', '8'))
+    # 'local' (per process) or 'mongo' (shared by every deployment using DATABASE_URL)
+    LIMITER_BACKEND = str(getenv('LIMITER_BACKEND', 'local')).lower().strip()
+    # Stream admission (opt-in): concurrent streams per bot client / per process (0 = unlimited),
+    # and the fraction of each cap kept for range continuations of admitted viewers
+    STREAM_MAX_PER_CLIENT = int(getenv('STREAM_MAX_PER_CLIENT', '0'))
+    STREAM_MAX_PER_PROCESS = int(getenv('STREAM_MAX_PER_PROCESS', '0'))
+    STREAM_PRIORITY_RESERVE = float(getenv('STREAM_PRIORITY_RESERVE', '0.1'))
+    # Seconds without a byte of progress before a stream is reaped
+    STREAM_STALL_TIMEOUT = float(getenv('STREAM_STALL_TIMEOUT', '60'))
+    # Enables /api/admin/streams when set (send as X-Admin-Key header or ?key=)
+    ADMIN_API_KEY = str(getenv('ADMIN_API_KEY', '')).strip()
+    # Bandwidth shaping (KiB/s, 0 = unlimited); playback vs download=1 share by weight
+    BANDWIDTH_SHAPING = os.environ.get('BANDWIDTH_SHAPING', 'False') == 'True'
+    BANDWIDTH_PER_CONNECTION_KBPS = float(getenv('BANDWIDTH_PER_CONNECTION_KBPS', '0'))
+    BANDWIDTH_PER_IP_KBPS = float(getenv('BANDWIDTH_PER_IP_KBPS', '0'))
+    BANDWIDTH_PER_CLIENT_KBPS = float(getenv('BANDWIDTH_PER_CLIENT_KBPS', '0'))
+    BANDWIDTH_INTERACTIVE_WEIGHT = float(getenv('BANDWIDTH_INTERACTIVE_WEIGHT', '4'))
+    BANDWIDTH_BULK_WEIGHT = float(getenv('BANDWIDTH_BULK_WEIGHT', '1'))
+    # Download queue: concurrent link generations (all run on the main bot), unfinished tickets per IP
+    DOWNLOAD_QUEUE_PER_CLIENT = int(getenv('DOWNLOAD_QUEUE_PER_CLIENT', '2'))
+    DOWNLOAD_QUEUE_PER_IP = int(getenv('DOWNLOAD_QUEUE_PER_IP', '3'))
     UPDATES_CHANNEL = str(getenv('UPDATES_CHANNEL', None))
     BANNED_CHANNELS = list(set(int(x) for x in str(getenv("BANNED_CHANNELS", "")).split()))
     RECAPTCHA_SITE_KEY = str(getenv('RECAPTCHA_SITE_KEY', '6LdCK_crAAAAAD702QCUelFDiZPr5wqL-3qbgk2u'))
@@ -0,0 +1,33 @@
+"""
+Offline benchmarks for /batch, /fwd and the media stream route.
+
+    python -m benchmarks batch --subjects 4 --messages 300 --runs 2
+    python -m benchmarks fwd --messages 40 --flood-rate 0.02
+    python -m benchmarks stream --requests 300 --concurrency 32
+    python -m benchmarks all --json > baseline.json
+    python -m benchmarks.loadtest --rate 30 --duration 60
+
+The first four drive one code path end to end in this process; loadtest
+runs the web server in a child process under sustained mixed traffic.
+
+Telegram and GitHub are replaced by the fakes in fakes.py, so no bot
+token, channel, Mongo or network access is needed. Results are printed as
+wall time, throughput, latency percentiles and per-method API call counts.
+
+The bot reads its configuration when Adarsh.vars is imported, so the
+placeholders below are set before anything from Adarsh is imported.
+Storage and GitHub are always local here, whatever the shell has set.
+"""
+import os
+
+for _key, _value in {
+    "API_ID": "1",
+    "API_HASH": "benchmark",
+    "BOT_TOKEN": "1:benchmark",
+    "BIN_CHANNEL": "-1001000000001",
+    "DB_CHANNEL": "-1001000000002",
+    "GIT_TOKEN": "benchmark",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+os.environ.update(DATABASE_URL="", STORAGE_BACKEND="memory", LIMITER_BACKEND="local", THUMB_API="")
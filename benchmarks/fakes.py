@@ -0,0 +1,394 @@
+"""
+In-process stand-ins for Telegram and GitHub.
+
+FakeTelegram holds the chats (message id -> FakeMessage) that every
+FakeClient reads from, so several clients can shard the same channel like
+real bots do. Each client answers the pyrogram calls the batch, forward
+and streaming paths make:
+
+    get_messages, copy_message / Message.copy, send_message / reply_text / edit_text,
+    storage.dc_id(), and upload.GetFile through media_sessions
+
+Every call sleeps for the configured latency and, with probability
+`flood_rate`, raises FloodWait instead of answering.
+
+FakeGitHub is a small aiohttp app speaking the parts of the REST API the
+bot uses (repos, Git Data API, contents, recursive trees). start() points
+Adarsh.utils.github_client at it, so calls still go through the real
+pooled client with its ETag cache and retries.
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from aiohttp import web
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId, FileType, FileUniqueId, FileUniqueType
+from aiohttp.test_utils import TestServer
+from Adarsh.utils import github_client
+
+
+class Conditions:
+    """Latency and FloodWait injection for one fake service."""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 20, flood_rate: float = 0.0,
+                 flood_seconds: int = 2, seed: int = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.floods = Counter()
+
+    async def hit(self, method: str):
+        self.calls[method] += 1
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.floods[method] += 1
+            raise FloodWait(value=self.flood_seconds)
+
+
+# ── Telegram ─────────────────────────────────────────────────────────────
+
+# Synthetic file contents: 1 MiB, the chunk size media_streamer asks for
+BLOCK = bytes(range(256)) * 4096
+
+_MEDIA_ATTRS = ("audio", "document", "photo", "sticker", "animation", "video", "voice", "video_note")
+
+# kind, mime type, extension, share of generated messages
+MESSAGE_MIX = (
+    ("video", "video/mp4", "mp4", 0.65),
+    ("pdf", "application/pdf", "pdf", 0.10),
+    ("audio", "audio/mpeg", "mp3", 0.05),
+    ("document", "application/zip", "zip", 0.05),
+    ("text", None, None, 0.10),
+    ("empty", None, None, 0.05),
+)
+
+
+class FakeMedia:
+    def __init__(self, media_id: int, dc_id: int, file_name: str, mime_type: str, file_size: int):
+        self.file_id = FileId(
+            file_type=FileType.DOCUMENT, dc_id=dc_id, media_id=media_id,
+            access_hash=media_id * 7919, file_reference=b"",
+        ).encode()
+        self.file_unique_id = FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=media_id).encode()
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.file_size = file_size
+        self.media_id = media_id
+
+
+class FakeMessage:
+    """The attributes of pyrogram's Message the bot reads."""
+
+    def __init__(self, client, chat_id: int, id: int, media: FakeMedia = None, media_attr: str = "document",
+                 text: str = None, empty: bool = False, date: datetime = None):
+        self._client = client
+        self.id = id
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=1)
+        self.empty = empty
+        self.text = text
+        self.caption = None
+        self.date = date or datetime.now(timezone.utc)
+        self.edit_date = None
+        self.forward_from_chat = None
+        self.forward_sender_name = None
+        self.message_thread_id = None
+        self.reply_to_top_message_id = None
+        self.service = None
+        for attr in _MEDIA_ATTRS:
+            setattr(self, attr, None)
+        self.media = None
+        if media is not None:
+            setattr(self, media_attr, media)
+            self.media = media_attr
+
+    def copy_to(self, client, chat_id: int, id: int) -> "FakeMessage":
+        media = next((a for a in _MEDIA_ATTRS if getattr(self, a)), "document")
+        return FakeMessage(client, chat_id, id, getattr(self, media), media, self.text)
+
+    async def copy(self, chat_id: int, **kwargs) -> "FakeMessage":
+        return await self._client.copy_message(chat_id, self.chat.id, self.id)
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        return await self._client.send_message(self.chat.id, text)
+
+    reply = reply_text
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self._client.conditions.hit("edit_message_text")
+        self._client.telegram.edits += 1
+        self.text = text
+        return self
+
+
+class FakeTelegram:
+    """Chats shared by every FakeClient."""
+
+    def __init__(self, seed: int = None):
+        self.chats = {}                      # chat_id -> {message id: FakeMessage}
+        self.media = {}                      # media_id -> FakeMedia
+        self.sent = []                       # texts sent to private chats
+        self.edits = 0
+        self.random = random.Random(seed)
+        self._media_ids = iter(range(10_000_000, 2 ** 62))
+        self._last_ids = Counter()
+
+    def chat(self, chat_id: int) -> dict:
+        return self.chats.setdefault(chat_id, {})
+
+    def reserve(self, chat_id: int, count: int = 1) -> range:
+        """The next count message ids of chat_id."""
+        first = self._last_ids[chat_id] + 1
+        self._last_ids[chat_id] += count
+        return range(first, first + count)
+
+    def next_id(self, chat_id: int) -> int:
+        return self.reserve(chat_id)[0]
+
+    def new_media(self, file_name: str, mime_type: str, file_size: int, dc_id: int = 4) -> FakeMedia:
+        media = FakeMedia(next(self._media_ids), dc_id, file_name, mime_type, file_size)
+        self.media[media.media_id] = media
+        return media
+
+    def populate(self, chat_id: int, count: int, file_size: int = 50 * 1024 * 1024,
+                 mix=MESSAGE_MIX, dc_id: int = 4) -> range:
+        """Append count synthetic messages to chat_id; returns their ids."""
+        kinds = list(mix)
+        weights = [kind[3] for kind in mix]
+        ids = self.reserve(chat_id, count)
+        chat = self.chat(chat_id)
+        for msg_id in ids:
+            kind, mime_type, ext, _ = self.random.choices(kinds, weights)[0]
+            if kind == "empty":
+                chat[msg_id] = FakeMessage(None, chat_id, msg_id, empty=True)
+            elif kind == "text":
+                chat[msg_id] = FakeMessage(None, chat_id, msg_id, text=f"Note {msg_id}")
+            else:
+                media = self.new_media(f"lecture_{msg_id}.{ext}", mime_type, file_size, dc_id)
+                attr = "document" if kind == "pdf" else kind
+                chat[msg_id] = FakeMessage(None, chat_id, msg_id, media, attr)
+        return ids
+
+
+class FakeStorage:
+    def __init__(self, dc_id: int):
+        self._dc_id = dc_id
+
+    async def dc_id(self) -> int:
+        return self._dc_id
+
+    async def test_mode(self) -> bool:
+        return False
+
+
+class FakeMediaSession:
+    """Answers upload.GetFile with synthetic bytes of the requested media."""
+
+    def __init__(self, client: "FakeClient"):
+        self.client = client
+
+    async def send(self, query, *args, **kwargs):
+        if not isinstance(query, raw.functions.upload.GetFile):
+            raise NotImplementedError(type(query).__name__)
+        await self.client.conditions.hit("upload.GetFile")
+        media = self.client.telegram.media[query.location.id]
+        length = max(0, min(query.limit, media.file_size - query.offset))
+        block = BLOCK * (length // len(BLOCK) + 1) if length > len(BLOCK) else BLOCK
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=block[:length])
+
+    invoke = send
+
+
+class FakeClient:
+    def __init__(self, telegram: FakeTelegram, conditions: Conditions, db_channel: int,
+                 bot_id: int = 1, dc_id: int = 2):
+        self.telegram = telegram
+        self.conditions = conditions
+        self.db_channel = db_channel
+        self.me = SimpleNamespace(id=bot_id, username=f"bench_{bot_id}_bot")
+        self.storage = FakeStorage(dc_id)
+        session = FakeMediaSession(self)
+        self.media_sessions = {dc: session for dc in range(1, 6)}
+
+    def _get(self, chat_id: int, msg_id: int) -> FakeMessage:
+        msg = self.telegram.chat(chat_id).get(msg_id)
+        if msg is None:
+            return FakeMessage(self, chat_id, msg_id, empty=True)
+        msg._client = self
+        return msg
+
+    async def get_messages(self, chat_id: int, message_ids=None, **kwargs):
+        await self.conditions.hit("get_messages")
+        if isinstance(message_ids, (list, tuple, range)):
+            return [self._get(chat_id, msg_id) for msg_id in message_ids]
+        return self._get(chat_id, message_ids)
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int, **kwargs):
+        await self.conditions.hit("copy_message")
+        source = self._get(from_chat_id, message_id)
+        if source.empty:
+            raise ValueError(f"MESSAGE_ID_INVALID: {message_id}")
+        copied = source.copy_to(self, chat_id, self.telegram.next_id(chat_id))
+        self.telegram.chat(chat_id)[copied.id] = copied
+        return copied
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> FakeMessage:
+        await self.conditions.hit("send_message")
+        self.telegram.sent.append(text)
+        msg = FakeMessage(self, chat_id, self.telegram.next_id(chat_id), text=text)
+        self.telegram.chat(chat_id)[msg.id] = msg
+        return msg
+
+    async def invoke(self, query, *args, **kwargs):
+        return await self.media_sessions[1].send(query)
+
+
+# ── GitHub ───────────────────────────────────────────────────────────────
+
+def _sha(*parts) -> str:
+    return hashlib.sha1("\0".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class FakeGitHub:
+    """One in-memory repository per owner/repo, served over local HTTP."""
+
+    def __init__(self, latency_ms: float = 80, jitter_ms: float = 30, error_rate: float = 0.0, seed: int = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.repos = {}
+        self._server = None
+        self._api = None
+
+    def _repo(self, name: str) -> dict:
+        if name not in self.repos:
+            root = _sha("commit", name)
+            self.repos[name] = {
+                "head": root,
+                "commits": {root: {"tree": _sha("tree", name), "parents": []}},
+                "trees": {_sha("tree", name): {}},         # tree sha -> {path: blob sha}
+                "blobs": {},
+            }
+        return self.repos[name]
+
+    async def start(self):
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_route("*", "/repos/{owner}/{repo}{rest:.*}", self._handle)
+        self._server = TestServer(app, host="127.0.0.1")
+        await self._server.start_server()
+        self._api = github_client.API
+        github_client.API = str(self._server.make_url("")).rstrip("/")
+
+    async def close(self):
+        if self._api is not None:
+            github_client.API = self._api
+        if self._server is not None:
+            await self._server.close()
+
+    def files(self, name: str) -> dict:
+        repo = self._repo(name)
+        return repo["trees"][repo["commits"][repo["head"]]["tree"]]
+
+    @staticmethod
+    def _json(data, status: int = 200) -> web.Response:
+        headers = {
+            "X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "4999",
+            "X-RateLimit-Used": "1", "X-RateLimit-Reset": str(int(time.time()) + 3600),
+            "X-RateLimit-Resource": "core",
+        }
+        return web.Response(status=status, text=json.dumps(data), content_type="application/json", headers=headers)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        rest = request.match_info["rest"]
+        endpoint = f"{request.method} {'/'.join(rest.split('/')[:3]) or '/'}"
+        self.calls[endpoint] += 1
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.calls["502 injected"] += 1
+            return web.Response(status=502, text="Bad Gateway")
+
+        name = f"{request.match_info['owner']}/{request.match_info['repo']}"
+        repo = self._repo(name)
+        body = await request.json() if request.can_read_body else {}
+        response = self._route(request.method, rest, name, repo, body, request.query)
+        if request.method == "GET" and response.status == 200:
+            etag = _sha(response.text)
+            if request.headers.get("If-None-Match") == f'"{etag}"':
+                return web.Response(status=304)
+            response.headers["ETag"] = f'"{etag}"'
+        return response
+
+    def _route(self, method: str, rest: str, name: str, repo: dict, body: dict, query) -> web.Response:
+        parts = rest.strip("/").split("/")
+        if rest in ("", "/") and method == "GET":
+            return self._json({"full_name": name, "default_branch": "main"})
+
+        if parts[:2] == ["git", "blobs"] and method == "POST":
+            sha = _sha("blob", body["content"])
+            repo["blobs"][sha] = body["content"]
+            return self._json({"sha": sha}, 201)
+
+        if parts[:3] in (["git", "ref", "heads"], ["git", "refs", "heads"]):
+            if method == "PATCH":
+                new = body["sha"]
+                if repo["head"] not in repo["commits"][new]["parents"]:
+                    return self._json({"message": "Update is not a fast forward"}, 422)
+                repo["head"] = new
+            return self._json({"object": {"sha": repo["head"], "type": "commit"}})
+
+        if parts[:2] == ["git", "commits"]:
+            if method == "POST":
+                sha = _sha("commit", body["tree"], *body["parents"], body["message"])
+                repo["commits"][sha] = {"tree": body["tree"], "parents": body["parents"]}
+                return self._json({"sha": sha}, 201)
+            commit = repo["commits"].get(parts[2])
+            if commit is None:
+                return self._json({"message": "Not Found"}, 404)
+            return self._json({"sha": parts[2], "tree": {"sha": commit["tree"]}})
+
+        if parts[:2] == ["git", "trees"]:
+            if method == "POST":
+                files = dict(repo["trees"].get(body.get("base_tree"), {}))
+                files.update({entry["path"]: entry["sha"] for entry in body["tree"]})
+                sha = _sha("tree", *sorted(files.items()))
+                repo["trees"][sha] = files
+                return self._json({"sha": sha}, 201)
+            files = self.files(name)
+            return self._json({"sha": repo["commits"][repo["head"]]["tree"], "truncated": False, "tree": [
+                {"path": path, "mode": "100644", "type": "blob", "sha": sha} for path, sha in sorted(files.items())
+            ]})
+
+        if parts[0] == "contents":
+            path = "/".join(parts[1:])
+            files = self.files(name)
+            if method == "GET":
+                if path not in files:
+                    return self._json({"message": "Not Found"}, 404)
+                return self._json({"path": path, "sha": files[path]})
+            if method == "PUT":
+                blob = _sha("blob", body["content"])
+                repo["blobs"][blob] = body["content"]
+                files = dict(files, **{path: blob})
+                tree = _sha("tree", *sorted(files.items()))
+                repo["trees"][tree] = files
+                commit = _sha("commit", tree, repo["head"], body.get("message", ""))
+                repo["commits"][commit] = {"tree": tree, "parents": [repo["head"]]}
+                repo["head"] = commit
+                return self._json({"content": {"path": path, "sha": blob}, "commit": {"sha": commit}}, 201)
+
+        return self._json({"message": "Not Found"}, 404)
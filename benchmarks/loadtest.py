@@ -0,0 +1,368 @@
+"""
+Load test for the stream server.
+
+    python -m benchmarks.loadtest --rate 30 --duration 60 --clients 2
+    python -m benchmarks.loadtest --mix seek=60,full=10,head=10,watch=10,generate=10 --stream-mib 2
+
+A child process boots web_server() with fake bot clients (see fakes.py)
+and a SyntheticStreamer in place of every ByteStreamer, which makes up
+file bytes at --stream-mib MiB/s per stream instead of calling GetFile.
+This process then opens sessions at --rate per second (Poisson arrivals)
+for --duration seconds, each one of:
+
+    seek      a ranged GET at a random offset, like a player seeking
+    full      a whole-file GET, like a download
+    head      a HEAD probe of the media URL
+    watch     the /watch/ player page
+    generate  /prepare/<token> -> /api/generate/<token> -> the returned /watch/ page
+
+Reported: requests/s and MiB/s, status codes and time-to-first-byte
+percentiles per kind, and from the server process its peak open
+connections, RSS per open connection and event-loop lag.
+
+The server runs with the shell's environment, so limits such as
+STREAM_MAX_PER_CLIENT, STREAMS_PER_IP or BANDWIDTH_SHAPING can be varied
+per run. Every session gets its own X-Forwarded-For address unless --ips
+caps the number of distinct viewers.
+"""
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import subprocess
+from collections import Counter, defaultdict
+import aiohttp
+import psutil
+from aiohttp import web
+from yarl import URL
+
+from Adarsh.server import web_server      # first, like bot.py; it resolves an import cycle
+from Adarsh.server import stream_routes
+from Adarsh.vars import Var
+from Adarsh.bot import multi_clients, work_loads
+from Adarsh.utils import render_template
+from Adarsh.utils.custom_dl import ByteStreamer
+from benchmarks.fakes import BLOCK, Conditions, FakeClient, FakeTelegram
+from benchmarks.report import Report, percentile
+
+
+MiB = 1024 * 1024
+KINDS = ("seek", "full", "head", "watch", "generate")
+VIDEO = (("video", "video/mp4", "mp4", 1.0),)
+
+
+class SyntheticStreamer(ByteStreamer):
+    """ByteStreamer serving made-up bytes at `rate` bytes/s per stream."""
+
+    PIECE = 64 * 1024
+
+    def __init__(self, client, rate: float):
+        super().__init__(client)
+        self.rate = rate
+
+    async def yield_file(self, file_id, index: int, offset: int, first_part_cut: int,
+                         last_part_cut: int, part_count: int, chunk_size: int):
+        started = time.monotonic()
+        sent = 0
+        for part in range(1, part_count + 1):
+            chunk = BLOCK[:chunk_size]
+            if part == part_count:
+                chunk = chunk[:last_part_cut]
+            if part == 1:
+                chunk = chunk[first_part_cut:]
+            for start in range(0, len(chunk), self.PIECE):
+                piece = chunk[start:start + self.PIECE]
+                yield piece
+                sent += len(piece)
+                if self.rate:
+                    delay = started + sent / self.rate - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+
+# ── Server process ───────────────────────────────────────────────────────
+
+class ServerProbe:
+    """In-flight requests, RSS and event-loop lag of the server process."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        self.baseline_rss = self.process.memory_info().rss
+        self.peak_rss = self.baseline_rss
+        self.peak_in_flight = 0
+        self.rss_at_peak = self.baseline_rss
+        self.lag = []
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        self.in_flight += 1
+        try:
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    async def run(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag.append(max(0.0, time.monotonic() - before - self.interval))
+            rss = self.process.memory_info().rss
+            self.peak_rss = max(self.peak_rss, rss)
+            if self.in_flight >= self.peak_in_flight:
+                self.peak_in_flight, self.rss_at_peak = self.in_flight, rss
+
+    def snapshot(self) -> dict:
+        return {
+            "baseline_rss": self.baseline_rss,
+            "peak_rss": self.peak_rss,
+            "peak_in_flight": self.peak_in_flight,
+            "rss_at_peak": self.rss_at_peak,
+            "lag_p50": percentile(self.lag, 50),
+            "lag_p99": percentile(self.lag, 99),
+            "lag_max": max(self.lag, default=0.0),
+        }
+
+
+async def _serve(args):
+    telegram = FakeTelegram(seed=args.seed)
+    conditions = Conditions(args.latency, args.jitter, seed=args.seed)
+    clients = [FakeClient(telegram, conditions, Var.DB_CHANNEL, bot_id=index + 1) for index in range(args.clients)]
+    for index, client in enumerate(clients):
+        multi_clients[index] = client
+        work_loads[index] = 0
+        stream_routes.class_cache[client] = SyntheticStreamer(client, args.stream_mib * MiB)
+    # /watch/ and /api/generate use the main bot directly
+    stream_routes.StreamBot = render_template.StreamBot = clients[0]
+
+    file_size = args.file_mb * MiB
+    catalog = {"files": [], "tokens": []}
+    chat = telegram.chat(Var.BIN_CHANNEL)
+    for msg_id in telegram.populate(Var.BIN_CHANNEL, args.files, file_size, mix=VIDEO):
+        catalog["files"].append({"id": msg_id, "hash": chat[msg_id].video.file_unique_id[:6],
+                                 "name": chat[msg_id].video.file_name, "size": file_size})
+    source = telegram.chat(Var.DB_CHANNEL)
+    for msg_id in telegram.populate(Var.DB_CHANNEL, args.files, file_size, mix=VIDEO):
+        media = source[msg_id].video
+        catalog["tokens"].append(await stream_routes.db.store_temp_file({
+            "message_id": msg_id, "file_name": media.file_name, "file_size": file_size,
+            "mime_type": media.mime_type, "caption": media.file_name, "from_chat_id": Var.DB_CHANNEL,
+            "file_unique_id": media.file_unique_id,
+        }))
+
+    probe = ServerProbe()
+
+    async def catalog_handler(request):
+        return web.json_response(catalog)
+
+    async def stats(request):
+        if request.query.get("reset"):
+            probe.reset()
+        return web.json_response({**probe.snapshot(), "telegram_calls": dict(conditions.calls)})
+
+    app = await web_server()
+    app.middlewares.append(probe.middleware)
+    app.router.add_get("/_loadtest/catalog", catalog_handler)
+    app.router.add_get("/_loadtest/stats", stats)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.serve_port).start()
+    await probe.run()
+
+
+# ── Load generator ───────────────────────────────────────────────────────
+
+class Recorder:
+    def __init__(self):
+        self.ttfb = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.bytes = 0
+
+    async def fetch(self, session, kind: str, method: str, url, headers: dict, body: bool = True):
+        """Send one request; returns (status, text) with text only for small non-media bodies."""
+        started = time.monotonic()
+        try:
+            async with session.request(method, url, headers=headers) as resp:
+                self.ttfb[kind].append(time.monotonic() - started)
+                self.statuses[kind][resp.status] += 1
+                if not body:
+                    async for chunk in resp.content.iter_any():
+                        self.bytes += len(chunk)
+                    return resp.status, None
+                text = await resp.text()
+                self.bytes += len(text)
+                return resp.status, text
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errors[f"{kind}: {type(e).__name__}"] += 1
+            return None, None
+
+
+async def _session(recorder, session, base: URL, catalog: dict, kind: str, rng, ip: str):
+    headers = {"X-Forwarded-For": ip}
+    file = rng.choice(catalog["files"])
+    media = base / f"{file['hash']}{file['id']}"
+    if kind == "seek":
+        start = rng.randrange(0, file["size"] - 1)
+        end = min(file["size"] - 1, start + rng.randint(512 * 1024, 4 * MiB))
+        await recorder.fetch(session, kind, "GET", media, {**headers, "Range": f"bytes={start}-{end}"}, body=False)
+    elif kind == "full":
+        await recorder.fetch(session, kind, "GET", media, headers, body=False)
+    elif kind == "head":
+        await recorder.fetch(session, kind, "HEAD", media, headers, body=False)
+    elif kind == "watch":
+        await recorder.fetch(session, kind, "GET", (base / "watch" / str(file["id"]) / file["name"]).with_query(
+            hash=file["hash"]), headers)
+    elif kind == "generate":
+        token = rng.choice(catalog["tokens"])
+        status, _ = await recorder.fetch(session, "prepare", "GET", base / "prepare" / token, headers)
+        if status != 200:
+            return
+        status, text = await recorder.fetch(session, kind, "GET", base / "api" / "generate" / token, headers)
+        if status != 200:
+            return
+        stream_url = URL(json.loads(text)["stream_url"])
+        await recorder.fetch(session, "watch", "GET", base.join(URL(stream_url.raw_path_qs)), headers)
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in KINDS:
+            raise argparse.ArgumentTypeError(f"unknown kind {kind!r}; expected one of {', '.join(KINDS)}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+async def _wait_ready(session, base: URL, proc, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            async with session.get(base / "_loadtest" / "catalog") as resp:
+                if resp.status == 200:
+                    return await resp.json()
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+async def _load(args, base: URL, proc) -> Report:
+    rng = random.Random(args.seed)
+    kinds, weights = zip(*args.mix.items())
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=0, force_close=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        catalog = await _wait_ready(session, base, proc)
+        async with session.get((base / "_loadtest" / "stats").with_query(reset="1")) as resp:
+            await resp.read()
+
+        tasks = []
+        started = time.monotonic()
+        while time.monotonic() - started < args.duration:
+            n = len(tasks)
+            ip = f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}" if not args.ips else f"10.0.{n % args.ips >> 8}.{n % args.ips & 255}"
+            kind = rng.choices(kinds, weights)[0]
+            tasks.append(asyncio.create_task(_session(recorder, session, base, catalog, kind, rng, ip)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        issued = time.monotonic() - started
+        _, unfinished = await asyncio.wait(tasks, timeout=args.drain)
+        for task in unfinished:
+            task.cancel()
+        wall = time.monotonic() - started
+
+        async with session.get(base / "_loadtest" / "stats") as resp:
+            server = await resp.json()
+
+    report = Report("loadtest")
+    report.add("setup", "rate", args.rate)
+    report.add("setup", "duration_s", args.duration)
+    report.add("setup", "mix", ",".join(f"{kind}={weight:g}" for kind, weight in args.mix.items()))
+    report.add("setup", "clients", args.clients)
+    report.add("setup", "stream_mib_per_s", args.stream_mib)
+    report.add("setup", "file_mb", args.file_mb)
+
+    requests = sum(len(samples) for samples in recorder.ttfb.values())
+    report.add("totals", "sessions", len(tasks))
+    report.add("totals", "requests", requests)
+    report.add("totals", "requests_per_s", round(requests / issued, 1))
+    report.add("totals", "mib_per_s", round(recorder.bytes / MiB / wall, 1))
+    report.add("totals", "unfinished_after_drain", len(unfinished))
+    report.counts("client errors", recorder.errors)
+    for kind, samples in recorder.ttfb.items():
+        report.add(f"{kind}", "status", " ".join(f"{s}:{c}" for s, c in sorted(recorder.statuses[kind].items())))
+        report.timings(f"{kind}", samples)
+
+    grown = server["rss_at_peak"] - server["baseline_rss"]
+    report.add("server", "peak_connections", server["peak_in_flight"])
+    report.add("server", "baseline_rss_mib", round(server["baseline_rss"] / MiB, 1))
+    report.add("server", "peak_rss_mib", round(server["peak_rss"] / MiB, 1))
+    report.add("server", "kib_per_connection",
+               round(grown / 1024 / server["peak_in_flight"], 1) if server["peak_in_flight"] else 0)
+    report.add("server", "loop_lag_p50_ms", round(server["lag_p50"] * 1000, 2))
+    report.add("server", "loop_lag_p99_ms", round(server["lag_p99"] * 1000, 2))
+    report.add("server", "loop_lag_max_ms", round(server["lag_max"] * 1000, 2))
+    report.counts("server telegram calls", server["telegram_calls"])
+    return report
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20, help="new sessions per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep opening sessions")
+    parser.add_argument("--drain", type=float, default=60, help="seconds to wait for open sessions afterwards")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("seek=50,full=10,head=15,watch=10,generate=15"))
+    parser.add_argument("--stream-mib", type=float, default=4, help="MiB/s served per stream (0 = unthrottled)")
+    parser.add_argument("--file-mb", type=int, default=32)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=2, help="fake bot clients in multi_clients")
+    parser.add_argument("--latency", type=float, default=40, help="Telegram call latency, ms")
+    parser.add_argument("--jitter", type=float, default=15, help="± random latency, ms")
+    parser.add_argument("--ips", type=int, default=0, help="distinct viewer addresses (0 = one per session)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of text")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the server's logs")
+    parser.add_argument("--serve-port", type=int, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = _parser().parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.serve_port:
+        asyncio.run(_serve(args))
+        return
+
+    port = _free_port()
+    output = None if args.verbose else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.loadtest", *sys.argv[1:], "--serve-port", str(port)],
+                            stdout=output, stderr=output)
+    try:
+        report = asyncio.run(_load(args, URL(f"http://127.0.0.1:{port}"), proc))
+    finally:
+        proc.terminate()
+        proc.wait(10)
+    print(json.dumps(report.as_dict(), indent=2, default=str) if args.json else report.render())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Results of one benchmark run, printed as aligned text or dumped as JSON.
+
+    report = Report("batch")
+    report.add("run", "wall_s", 12.3)
+    report.timings("subject ready", samples_in_seconds)
+    report.counts("telegram calls", conditions.calls)
+    print(report.render())
+"""
+import math
+from typing import Dict, Iterable
+
+
+def percentile(samples: list, p: float) -> float:
+    """Nearest-rank percentile of samples (0 for no samples)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Report:
+    def __init__(self, name: str):
+        self.name = name
+        self.sections: Dict[str, dict] = {}
+
+    def add(self, section: str, key: str, value):
+        self.sections.setdefault(section, {})[key] = value
+
+    def timings(self, section: str, samples: Iterable[float], unit: str = "ms", scale: float = 1000):
+        """Count, mean and p50/p95/p99/max of samples given in seconds."""
+        samples = list(samples)
+        self.add(section, "count", len(samples))
+        if not samples:
+            return
+        self.add(section, f"mean_{unit}", round(sum(samples) / len(samples) * scale, 2))
+        for p in (50, 95, 99):
+            self.add(section, f"p{p}_{unit}", round(percentile(samples, p) * scale, 2))
+        self.add(section, f"max_{unit}", round(max(samples) * scale, 2))
+
+    def counts(self, section: str, counter: dict):
+        for key, value in sorted(counter.items()):
+            self.add(section, key, value)
+
+    def as_dict(self) -> dict:
+        return {"benchmark": self.name, **self.sections}
+
+    def render(self) -> str:
+        lines = [f"== {self.name} =="]
+        for section, values in self.sections.items():
+            lines.append(f"  {section}")
+            width = max((len(key) for key in values), default=0)
+            for key, value in values.items():
+                lines.append(f"    {key.ljust(width)}  {value}")
+        return "\n".join(lines)
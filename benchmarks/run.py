@@ -0,0 +1,332 @@
+"""
+Benchmark scenarios. Each builds its fakes, drives the real code path end
+to end and returns a Report:
+
+- batch:  _run_batch_processing over synthetic subjects in DB_CHANNEL,
+          publishing to FakeGitHub. --runs 2 also measures the incremental
+          re-run, where every subject is unchanged.
+- fwd:    _run_fwd_processing copying subjects from a source chat into
+          DB_CHANNEL, including its fixed pacing sleeps (see --pacing-scale).
+- stream: web_server() on a local port, with concurrent full and ranged
+          GETs against the media route, served by upload.GetFile fakes.
+"""
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+from Adarsh.server import web_server      # first, like bot.py; it resolves an import cycle
+from Adarsh.vars import Var
+from Adarsh.bot import multi_clients, work_loads
+from Adarsh.bot.plugins import stream
+from Adarsh.utils.github_client import github
+from Adarsh.utils.github_publisher import GitHubPublisher
+from benchmarks.fakes import Conditions, FakeClient, FakeGitHub, FakeMessage, FakeTelegram
+from benchmarks.report import Report
+
+
+MiB = 1024 * 1024
+ADMIN_CHAT = 1001
+SOURCE_CHAT = -1001000000003
+GITHUB_DEST = "bench/lectures/batch"
+
+
+def _fakes(args):
+    telegram = FakeTelegram(seed=args.seed)
+    conditions = Conditions(args.latency, args.jitter, args.flood_rate, args.flood_seconds, seed=args.seed)
+    clients = [FakeClient(telegram, conditions, Var.DB_CHANNEL, bot_id=index + 1, dc_id=args.home_dc)
+               for index in range(args.clients)]
+    multi_clients.clear()
+    work_loads.clear()
+    for index, client in enumerate(clients):
+        multi_clients[index] = client
+        work_loads[index] = 0
+    return telegram, conditions, clients
+
+
+def _links(chat_id: int, subjects: list) -> str:
+    short = stream.db_channel_short_id(chat_id)
+    lines = []
+    for name, ids in subjects:
+        lines += [name, f"F - https://t.me/c/{short}/{ids[0]}", f"L - https://t.me/c/{short}/{ids[-1]}"]
+    return "\n".join(lines)
+
+
+def _admin_message(telegram, client, text: str) -> FakeMessage:
+    return FakeMessage(client, ADMIN_CHAT, telegram.next_id(ADMIN_CHAT), text=text)
+
+
+def _chat_outcome(report: Report, telegram, conditions):
+    errors = [text for text in telegram.sent if text.startswith("❌")]
+    report.add("chat", "replies", len(telegram.sent))
+    report.add("chat", "status_edits", telegram.edits)
+    report.add("chat", "error_replies", len(errors))
+    if errors:
+        report.add("chat", "first_error", errors[0][:300])
+    report.counts("flood waits injected", conditions.floods)
+
+
+class _ScaledAsyncio:
+    """asyncio as seen by stream.py, with its fixed pacing sleeps scaled."""
+
+    def __init__(self, scale: float):
+        self._scale = scale
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    def sleep(self, delay, *args, **kwargs):
+        return asyncio.sleep(delay * self._scale, *args, **kwargs)
+
+
+# ── Scenarios ────────────────────────────────────────────────────────────
+
+async def bench_batch(args) -> Report:
+    telegram, conditions, clients = _fakes(args)
+    fake_github = FakeGitHub(args.gh_latency, args.gh_jitter, args.gh_error_rate, seed=args.seed)
+    await fake_github.start()
+
+    subjects = [(f"Subject {n}", telegram.populate(Var.DB_CHANNEL, args.messages, args.file_mb * MiB))
+                for n in range(1, args.subjects + 1)]
+    admin = _admin_message(telegram, clients[0], _links(Var.DB_CHANNEL, subjects))
+    total_messages = args.subjects * args.messages
+
+    if args.thumb_ms:
+        # Stand-in for ffmpeg + upload: a fixed delay, then a real group-committed publish
+        thumb_publisher = GitHubPublisher("bench", "thumbs", "benchmark")
+
+        async def generate(client, message, folder, caption):
+            await asyncio.sleep(args.thumb_ms / 1000)
+            return await thumb_publisher.publish(f"{folder}/{caption}.jpg", b"\xff\xd8\xff" + bytes(4096),
+                                                 f"Add thumbnail for {caption}")
+
+        stream.THUMB_API = "benchmark"
+        stream.thumbnails.generate = generate
+
+    # A subject is ready when its JSON is staged for the final commit
+    ready = []
+    clock = {"start": 0.0}
+    original_stage = GitHubPublisher.stage
+
+    async def timed_stage(self, path, content):
+        result = await original_stage(self, path, content)
+        if path.endswith(".json"):
+            ready.append(time.monotonic() - clock["start"])
+        return result
+
+    report = Report("batch")
+    report.add("setup", "subjects", args.subjects)
+    report.add("setup", "messages_per_subject", args.messages)
+    report.add("setup", "clients", args.clients)
+    GitHubPublisher.stage = timed_stage
+    try:
+        for run in range(1, args.runs + 1):
+            ready.clear()
+            telegram_before, github_before = Counter(conditions.calls), Counter(fake_github.calls)
+            clock["start"] = time.monotonic()
+            await stream._run_batch_processing(clients[0], admin, GITHUB_DEST)
+            wall = time.monotonic() - clock["start"]
+
+            section = f"run {run}"
+            report.add(section, "wall_s", round(wall, 2))
+            report.add(section, "messages_per_s", round(total_messages / wall, 1))
+            report.add(section, "subjects_staged", len(ready))
+            report.timings(f"{section}: subject ready", ready, unit="s", scale=1)
+            report.counts(f"{section}: telegram calls", conditions.calls - telegram_before)
+            report.counts(f"{section}: github calls", fake_github.calls - github_before)
+    finally:
+        GitHubPublisher.stage = original_stage
+        await fake_github.close()
+        await github.close()
+
+    report.add("github", "files_in_repo", len(fake_github.files("bench/lectures")))
+    report.counts("github client", github.stats)
+    report.counts("thumbnails", stream.thumbnails.stats)
+    _chat_outcome(report, telegram, conditions)
+    return report
+
+
+async def bench_fwd(args) -> Report:
+    telegram, conditions, clients = _fakes(args)
+    subjects = [(f"Subject {n}", telegram.populate(SOURCE_CHAT, args.messages, args.file_mb * MiB))
+                for n in range(1, args.subjects + 1)]
+    links_text = _links(SOURCE_CHAT, subjects)
+    admin = _admin_message(telegram, clients[0], "/fwd")
+    total_messages = args.subjects * args.messages
+
+    # Time between consecutive successful copies, i.e. the cost of one source message
+    copies = []
+    client = clients[0]
+    copy_message = client.copy_message
+
+    async def timed_copy(*a, **kw):
+        copied = await copy_message(*a, **kw)
+        copies.append(time.monotonic())
+        return copied
+
+    client.copy_message = timed_copy
+    before = len(telegram.chat(Var.DB_CHANNEL))
+    stream.asyncio = _ScaledAsyncio(args.pacing_scale)
+    started = time.monotonic()
+    try:
+        await stream._run_fwd_processing(client, admin, links_text)
+    finally:
+        stream.asyncio = asyncio
+    wall = time.monotonic() - started
+
+    report = Report("fwd")
+    report.add("setup", "subjects", args.subjects)
+    report.add("setup", "messages_per_subject", args.messages)
+    report.add("setup", "pacing_scale", args.pacing_scale)
+    report.add("run", "wall_s", round(wall, 2))
+    report.add("run", "source_messages_per_s", round(total_messages / wall, 2))
+    report.add("run", "copied", len(telegram.chat(Var.DB_CHANNEL)) - before)
+    report.timings("per copied message", [b - a for a, b in zip([started] + copies, copies)])
+    report.counts("telegram calls", conditions.calls)
+    _chat_outcome(report, telegram, conditions)
+    return report
+
+
+async def bench_stream(args) -> Report:
+    telegram, conditions, clients = _fakes(args)
+    file_size = args.file_mb * MiB
+    ids = telegram.populate(Var.BIN_CHANNEL, args.files, file_size, mix=(("video", "video/mp4", "mp4", 1.0),),
+                            dc_id=args.file_dc)
+    files = [(msg_id, telegram.chat(Var.BIN_CHANNEL)[msg_id].video) for msg_id in ids]
+
+    server = TestServer(await web_server(), host="127.0.0.1")
+    await server.start_server()
+    rng = random.Random(args.seed)
+    gate = asyncio.Semaphore(args.concurrency)
+    ttfb, durations, statuses = [], [], Counter()
+    received = 0
+
+    async def one(session, n):
+        nonlocal received
+        msg_id, media = rng.choice(files)
+        # One viewer per request, so the per-IP stream cap does not skew the result
+        headers = {"X-Forwarded-For": f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"}
+        if rng.random() < args.range_share:
+            start = rng.randrange(0, file_size - 1)
+            end = min(file_size - 1, start + rng.randint(256 * 1024, 4 * MiB))
+            headers["Range"] = f"bytes={start}-{end}"
+        async with gate:
+            started = time.monotonic()
+            async with session.get(server.make_url(f"/{media.file_unique_id[:6]}{msg_id}"), headers=headers) as resp:
+                statuses[resp.status] += 1
+                first = True
+                async for chunk in resp.content.iter_any():
+                    if first:
+                        ttfb.append(time.monotonic() - started)
+                        first = False
+                    received += len(chunk)
+            durations.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    try:
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(one(session, n) for n in range(args.requests)))
+    finally:
+        await server.close()
+    wall = time.monotonic() - started
+
+    report = Report("stream")
+    report.add("setup", "requests", args.requests)
+    report.add("setup", "concurrency", args.concurrency)
+    report.add("setup", "file_mb", args.file_mb)
+    report.add("setup", "range_share", args.range_share)
+    report.add("run", "wall_s", round(wall, 2))
+    report.add("run", "requests_per_s", round(args.requests / wall, 1))
+    report.add("run", "mib_per_s", round(received / MiB / wall, 1))
+    report.counts("status", {str(status): count for status, count in statuses.items()})
+    report.timings("time to first byte", ttfb)
+    report.timings("request duration", durations)
+    report.counts("telegram calls", conditions.calls)
+    report.counts("flood waits injected", conditions.floods)
+    return report
+
+
+SCENARIOS = {"batch": bench_batch, "fwd": bench_fwd, "stream": bench_stream}
+
+
+# ── Command line ─────────────────────────────────────────────────────────
+
+def _parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--latency", type=float, default=40, help="Telegram call latency, ms")
+    common.add_argument("--jitter", type=float, default=15, help="± random latency, ms")
+    common.add_argument("--flood-rate", type=float, default=0.0, help="share of Telegram calls raising FloodWait")
+    common.add_argument("--flood-seconds", type=int, default=2, help="FloodWait value")
+    common.add_argument("--clients", type=int, default=1, help="fake bot clients in multi_clients")
+    common.add_argument("--home-dc", type=int, default=2, help="DC the fake clients live in")
+    common.add_argument("--seed", type=int, default=1)
+    common.add_argument("--json", action="store_true", help="print JSON instead of text")
+    common.add_argument("-v", "--verbose", action="store_true", help="show the bot's INFO logs")
+
+    github_opts = argparse.ArgumentParser(add_help=False)
+    github_opts.add_argument("--gh-latency", type=float, default=80, help="GitHub call latency, ms")
+    github_opts.add_argument("--gh-jitter", type=float, default=30)
+    github_opts.add_argument("--gh-error-rate", type=float, default=0.0, help="share of GitHub calls answered 502")
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    batch = sub.add_parser("batch", parents=[common, github_opts])
+    batch.add_argument("--subjects", type=int, default=4)
+    batch.add_argument("--messages", type=int, default=300, help="messages per subject")
+    batch.add_argument("--file-mb", type=int, default=200)
+    batch.add_argument("--runs", type=int, default=2, help="consecutive runs over the same subjects")
+    batch.add_argument("--thumb-ms", type=float, default=0, help="simulated thumbnail cost, ms (0 = off)")
+
+    fwd = sub.add_parser("fwd", parents=[common])
+    fwd.add_argument("--subjects", type=int, default=2)
+    fwd.add_argument("--messages", type=int, default=40, help="messages per subject")
+    fwd.add_argument("--file-mb", type=int, default=200)
+    fwd.add_argument("--pacing-scale", type=float, default=1.0,
+                     help="multiply the fixed sleeps in _run_fwd_processing (0 removes them)")
+
+    media = sub.add_parser("stream", parents=[common])
+    media.add_argument("--requests", type=int, default=200)
+    media.add_argument("--concurrency", type=int, default=20)
+    media.add_argument("--files", type=int, default=50)
+    media.add_argument("--file-mb", type=int, default=8)
+    media.add_argument("--file-dc", type=int, default=4, help="DC the files live in")
+    media.add_argument("--range-share", type=float, default=0.7, help="share of ranged requests")
+
+    sub.add_parser("all", parents=[common, github_opts], help="every scenario with its defaults")
+    return parser
+
+
+async def _main(args) -> list:
+    if args.scenario != "all":
+        return [await SCENARIOS[args.scenario](args)]
+    reports = []
+    for name, scenario in SCENARIOS.items():
+        # The scenario's own defaults, with the shared options given to "all"
+        scenario_args = _parser().parse_args([name])
+        for key, value in vars(args).items():
+            if key != "scenario":
+                setattr(scenario_args, key, value)
+        reports.append(await scenario(scenario_args))
+    return reports
+
+
+def main():
+    args = _parser().parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    reports = asyncio.run(_main(args))
+    if args.json:
+        print(json.dumps([report.as_dict() for report in reports], indent=2, default=str))
+    else:
+        print("\n\n".join(report.render() for report in reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ from aiohttp import web
 from Adarsh.server import web_server
 from Adarsh.utils.keepalive import ping_server
 from Adarsh.bot.clients import initialize_clients
+from Adarsh.utils.job_journal import journal
 
 logging.basicConfig(
     level=logging.INFO,
@@ -62,6 +63,10 @@ async def start_services():
     bind_address = "0.0.0.0" if Var.ON_HEROKU else Var.BIND_ADDRESS
     await web.TCPSite(app, bind_address, Var.PORT).start()
     print('----------------------------- DONE ---------------------------------------------------------------------')
+    # /batch and /fwd jobs interrupted by the last shutdown continue where they stopped
+    pending_jobs = await journal.resume_all()
+    if pending_jobs:
+        print('                        resuming =>> {} unfinished job(s)'.format(pending_jobs))
     print('\n')
     print('---------------------------------------------------------------------------------------------------------')
     print('---------------------------------------------------------------------------------------------------------')